@@ -0,0 +1,82 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+class AsyncWriter:
+    """
+    Runs write jobs on a thread pool so computing the next variant overlaps
+    with saving the previous one.
+
+    At most max_pending jobs are queued or running; submit() blocks once that
+    many are outstanding, which caps the memory held by arrays waiting to be
+    written. The first failed job is re-raised by the next submit(), flush()
+    or close(), so a failed write aborts the run instead of losing samples.
+    With num_threads=0 jobs run inline in the calling thread.
+    """
+
+    def __init__(self, num_threads=4, max_pending=None):
+        self.num_threads = num_threads
+        self.executor = ThreadPoolExecutor(num_threads) if num_threads > 0 else None
+        self.slots = threading.BoundedSemaphore(max_pending or max(1, 4 * num_threads))
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.error = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # Do not mask the error of the main loop, but still wait for the threads
+            self.shutdown()
+
+    # Function to queue one write job, blocks while the queue is full
+    def submit(self, function, *args, **kwargs):
+        self.raise_if_failed()
+        if self.executor is None:
+            function(*args, **kwargs)
+            return
+
+        self.slots.acquire()
+        try:
+            future = self.executor.submit(function, *args, **kwargs)
+        except BaseException:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.pending.add(future)
+        future.add_done_callback(self._job_done)
+
+    def _job_done(self, future):
+        with self.lock:
+            self.pending.discard(future)
+            if self.error is None and not future.cancelled() and future.exception() is not None:
+                self.error = future.exception()
+        self.slots.release()
+
+    # Function to re-raise the first error of a background job
+    def raise_if_failed(self):
+        if self.error is not None:
+            raise self.error
+
+    # Function to wait until every queued job has finished
+    def flush(self):
+        with self.lock:
+            outstanding = list(self.pending)
+        wait(outstanding)
+        self.raise_if_failed()
+
+    # Function to stop the threads without raising job errors
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    # Function to wait for all jobs, stop the threads and raise the first job error
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.shutdown()
@@ -0,0 +1,213 @@
+import os
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+import numpy as np
+import trimesh
+import data_augmentation as augmentation
+from surface_sampler import SurfaceSampler, farthest_point_sampling
+from pointcloud_io import save_xyz
+from occupancy_io import save_occupancy
+
+# Benchmark results are stored next to the code they time, one JSON file per run; --output-dir overrides it
+benchmark_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+
+# Occupancy resolutions and point counts every stage is timed at
+benchmark_resolutions = (32, 64)
+benchmark_point_counts = (2048, 8192)
+
+# Variants generated together when timing the end-to-end per-variant cost
+benchmark_batch_size = 25
+
+# Clouds thinned together when timing farthest-point sampling, which is reported per cloud
+fps_batch_size = 4
+
+# A stage is reported as a regression when it is this much slower than the baseline
+regression_threshold = 0.15
+
+
+# Function to build the synthetic meshes, so the benchmark needs no dataset
+def synthetic_meshes(quick=False):
+    """
+    sphere_1k and box are small closed meshes, sphere_20k a medium one,
+    thin_shell two nested spheres 2% apart (a hollow object whose walls are
+    thinner than a voxel), scan_80k a noisy sphere with the face count of
+    a high-poly YCB scan.
+    """
+    rng = np.random.default_rng(0)
+    meshes = {
+        "sphere_1k": trimesh.creation.icosphere(3),
+        "box": trimesh.creation.box(extents=(0.4, 0.7, 1.0)),
+    }
+    outer = trimesh.creation.icosphere(4)
+    inner = trimesh.creation.icosphere(4)
+    inner.vertices *= 0.98
+    inner.invert()
+    meshes["thin_shell"] = trimesh.util.concatenate([outer, inner])
+    if not quick:
+        meshes["sphere_20k"] = trimesh.creation.icosphere(5)
+        scan = trimesh.creation.icosphere(6)
+        scan.vertices *= 1.0 + 0.01 * rng.standard_normal((len(scan.vertices), 1))
+        meshes["scan_80k"] = scan
+    return meshes
+
+
+# Function to time a call, returns the best of repeat runs and the peak traced memory of one run
+def measure(function, repeat=3):
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+
+    # Memory is traced in a separate run, tracing slows the allocations down
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": min(seconds), "peak_bytes": peak}
+
+
+# Function to time the generation stages of one mesh at every resolution and point count
+def benchmark_mesh(mesh, resolutions=benchmark_resolutions, point_counts=benchmark_point_counts, repeat=3):
+    results = {}
+    rng = np.random.default_rng(0)
+    rotation = augmentation.random_rotation_matrix(rng)
+    normalized = augmentation.force_cubic_normalization(augmentation.rotate_mesh(mesh.copy(), rotation))
+    output_dir = tempfile.mkdtemp(prefix="benchmark_")
+    try:
+        results["force_cubic_normalization"] = measure(
+            lambda: augmentation.force_cubic_normalization(augmentation.rotate_mesh(mesh.copy(), rotation)), repeat)
+        results["sampler_setup"] = measure(lambda: SurfaceSampler.from_mesh(mesh), repeat)
+
+        for count in point_counts:
+            results[f"sample_complete_from_mesh/{count}"] = measure(
+                lambda: augmentation.sample_complete_from_mesh(normalized, count, rng), repeat)
+            results[f"sample_partial_from_mesh/{count}"] = measure(
+                lambda: augmentation.sample_partial_from_mesh(normalized, count, rng), repeat)
+            points = augmentation.sample_complete_from_mesh(normalized, count, rng)
+            path = os.path.join(output_dir, "cloud.xyz")
+            results[f"save_xyz/{count}"] = measure(lambda: save_xyz(points, path), repeat)
+
+            # Farthest-point thinning of oversampled clouds, against the plain sample_surface path above
+            candidates = SurfaceSampler.from_mesh(normalized).sample(
+                np.repeat(np.eye(3)[None], fps_batch_size, axis=0), np.zeros((fps_batch_size, 3)),
+                count * augmentation.fps_oversample, [np.random.default_rng(b) for b in range(fps_batch_size)])
+            thinning = measure(lambda: farthest_point_sampling(candidates, count), repeat)
+            results[f"farthest_point_sampling/{count}"] = {"seconds": thinning["seconds"] / fps_batch_size,
+                                                           "peak_bytes": thinning["peak_bytes"]}
+
+        for resolution in resolutions:
+            for voxelizer in ("parity", "trimesh"):
+                results[f"create_solid_occupancy_grid/{voxelizer}/{resolution}"] = measure(
+                    lambda: augmentation.create_solid_occupancy_grid(normalized, resolution, voxelizer), repeat)
+            grid = augmentation.create_solid_occupancy_grid(normalized, resolution)
+            for occupancy_format in ("dense", "packed"):
+                path = os.path.join(output_dir, "grid.npy")
+                results[f"save_occupancy/{occupancy_format}/{resolution}"] = measure(
+                    lambda: save_occupancy(path, grid, occupancy_format), repeat)
+
+            # End-to-end cost of a batch of variants, without saving, reported per variant
+            options = {"voxel_resolution": resolution}
+            sampler = SurfaceSampler.from_mesh(mesh)
+            variant_ids = list(range(benchmark_batch_size))
+            batch = measure(lambda: augmentation.generate_variants(mesh, "benchmark", variant_ids, options, sampler), repeat)
+            results[f"variant/{resolution}"] = {"seconds": batch["seconds"] / benchmark_batch_size,
+                                                "peak_bytes": batch["peak_bytes"]}
+            if resolution == resolutions[0]:
+                fps_options = {**options, "point_sampling": "fps"}
+                fps_ids = variant_ids[:fps_batch_size]
+                batch = measure(lambda: augmentation.generate_variants(mesh, "benchmark", fps_ids, fps_options, sampler), repeat)
+                results[f"variant_fps/{resolution}"] = {"seconds": batch["seconds"] / fps_batch_size,
+                                                        "peak_bytes": batch["peak_bytes"]}
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    return results
+
+
+# Function to get the current commit of the repository, if it is one
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Function to run the whole suite, returns {"commit", "machine", "meshes", "results": {"mesh/stage/...": timing}}
+def run_benchmarks(resolutions=benchmark_resolutions, point_counts=benchmark_point_counts, repeat=3, quick=False):
+    meshes = synthetic_meshes(quick)
+    results = {}
+    for name, mesh in meshes.items():
+        for stage, timing in benchmark_mesh(mesh, resolutions, point_counts, repeat).items():
+            results[f"{name}/{stage}"] = timing
+        print(f"Benchmarked {name} ({len(mesh.faces)} faces)")
+    return {
+        "commit": current_commit(),
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "machine": {"platform": platform.platform(), "processor": platform.processor(), "cpus": os.cpu_count(),
+                    "numpy": np.__version__, "trimesh": trimesh.__version__},
+        "settings": {"resolutions": list(resolutions), "point_counts": list(point_counts), "repeat": repeat,
+                     "batch_size": benchmark_batch_size},
+        "meshes": {name: len(mesh.faces) for name, mesh in meshes.items()},
+        "results": results,
+    }
+
+
+# Function to compare two runs, returns the stages slower than the baseline by more than threshold
+def compare_results(baseline, current, threshold=regression_threshold):
+    regressions = {}
+    for key, timing in current["results"].items():
+        previous = baseline["results"].get(key)
+        if previous is None or previous["seconds"] <= 0:
+            continue
+        ratio = timing["seconds"] / previous["seconds"]
+        if ratio > 1.0 + threshold:
+            regressions[key] = {"baseline_seconds": previous["seconds"], "seconds": timing["seconds"], "ratio": ratio}
+    return regressions
+
+
+# Function to print a run as a table, with the change against a baseline when given
+def print_results(current, baseline=None):
+    for key, timing in current["results"].items():
+        line = f"{key:<60} {timing['seconds'] * 1e3:10.2f} ms {timing['peak_bytes'] / 2 ** 20:8.1f} MiB"
+        previous = (baseline or {}).get("results", {}).get(key)
+        if previous is not None and previous["seconds"] > 0:
+            line += f" {100.0 * (timing['seconds'] / previous['seconds'] - 1.0):+7.1f}%"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the generation stages on synthetic meshes")
+    parser.add_argument("--output", default=None, help="JSON result file (default: a file per commit in the benchmarks directory)")
+    parser.add_argument("--output-dir", default=benchmark_dir, help="directory of the default result files")
+    parser.add_argument("--compare", default=None, help="baseline JSON result file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=regression_threshold, help="relative slowdown reported as a regression")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage, the best one is kept")
+    parser.add_argument("--quick", action="store_true", help="only the small meshes")
+    args = parser.parse_args()
+
+    current = run_benchmarks(repeat=args.repeat, quick=args.quick)
+    output_path = args.output or os.path.join(
+        args.output_dir, f"benchmark_{current['commit'] or 'nocommit'}_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path, "w") as f:
+        json.dump(current, f, indent=2)
+
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(current, baseline)
+    print(f"Results written to {output_path}")
+    if baseline is not None:
+        regressions = compare_results(baseline, current, args.threshold)
+        for key, regression in regressions.items():
+            print(f"REGRESSION {key}: {regression['baseline_seconds'] * 1e3:.2f} ms -> "
+                  f"{regression['seconds'] * 1e3:.2f} ms ({regression['ratio']:.2f}x)")
+        raise SystemExit(1 if regressions else 0)
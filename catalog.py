@@ -0,0 +1,170 @@
+import os
+import sqlite3
+import numpy as np
+from occupancy_io import load_occupancy
+from pointcloud_io import load_xyz
+from shard_io import open_shard, read_shard_occupancy
+
+# Catalog of the generated variants, one SQLite file per dataset. Every row records where the outputs of
+# one variant live, so listing, filtering and sampling never touch the directory tree:
+#   category, split, variant_id, row              row is the index of the variant inside its split
+#   rotation                                      9 float64 values of the rotation matrix, row major
+#   partial_path, complete_path, occupancy_path   loose files, or NULL for packed variants
+#   shard                                         shard directory of packed variants, or NULL
+#   partial_shape, complete_shape, occupancy_shape  array shapes as "2048,3"
+# Paths are stored relative to the directory of the catalog file, so a dataset can be moved as a whole.
+catalog_name = "catalog.sqlite"
+
+path_columns = ("partial_path", "complete_path", "occupancy_path", "shard")
+shape_columns = ("partial_shape", "complete_shape", "occupancy_shape")
+columns = ("category", "split", "variant_id", "row", "rotation") + path_columns + shape_columns
+
+schema = """
+CREATE TABLE IF NOT EXISTS variants (
+    category TEXT NOT NULL,
+    split TEXT NOT NULL,
+    variant_id INTEGER NOT NULL,
+    row INTEGER NOT NULL,
+    rotation BLOB,
+    partial_path TEXT,
+    complete_path TEXT,
+    occupancy_path TEXT,
+    shard TEXT,
+    partial_shape TEXT,
+    complete_shape TEXT,
+    occupancy_shape TEXT,
+    PRIMARY KEY (category, variant_id)
+);
+CREATE INDEX IF NOT EXISTS variants_split ON variants (split, category);
+"""
+
+
+class Catalog:
+    """SQLite index of the generated variants with a small query API."""
+
+    def __init__(self, path):
+        self.path = path
+        self.root = os.path.dirname(os.path.abspath(path))
+        os.makedirs(self.root, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(schema)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    # Function to add or replace variant rows given as dicts with the catalog columns
+    def add(self, rows):
+        values = [tuple(self.encode(column, row.get(column)) for column in columns) for row in rows]
+        with self.connection:
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO variants ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", values)
+        return len(values)
+
+    # Function to delete the rows of a category, or of the whole catalog
+    def remove(self, category=None):
+        where, parameters = self.filters(category=category)
+        with self.connection:
+            return self.connection.execute(f"DELETE FROM variants{where}", parameters).rowcount
+
+    # Function to change the recorded paths of variants, updates are (category, variant id, {column: path})
+    def update_paths(self, updates):
+        with self.connection:
+            for category, variant_id, paths in updates:
+                assignments = ", ".join(f"{column} = ?" for column in paths)
+                self.connection.execute(f"UPDATE variants SET {assignments} WHERE category = ? AND variant_id = ?",
+                                        [self.encode(column, path) for column, path in paths.items()] + [category, variant_id])
+
+    # Function to list the categories, optionally only those with variants in one split
+    def categories(self, split=None):
+        where, parameters = self.filters(split=split)
+        return [category for category, in self.connection.execute(
+            f"SELECT DISTINCT category FROM variants{where} ORDER BY category", parameters)]
+
+    # Function to count the variants matching the filters
+    def count(self, category=None, split=None):
+        where, parameters = self.filters(category, split)
+        return self.connection.execute(f"SELECT COUNT(*) FROM variants{where}", parameters).fetchone()[0]
+
+    # Function to count the variants of every category and split, returns {category: {split: count}}
+    def split_counts(self):
+        counts = {}
+        for category, split, count in self.connection.execute(
+                "SELECT category, split, COUNT(*) FROM variants GROUP BY category, split ORDER BY category, split"):
+            counts.setdefault(category, {})[split] = count
+        return counts
+
+    # Function to list the variants matching the filters, ordered by category and variant id
+    def query(self, category=None, split=None, variant_ids=None, limit=None):
+        where, parameters = self.filters(category, split, variant_ids)
+        sql = f"SELECT {', '.join(columns)} FROM variants{where} ORDER BY category, variant_id"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return [self.decode(values) for values in self.connection.execute(sql, parameters)]
+
+    # Function to pick count random variants matching the filters, reproducible for a given seed
+    def sample(self, count, category=None, split=None, seed=None):
+        where, parameters = self.filters(category, split)
+        rowids = np.array([rowid for rowid, in self.connection.execute(f"SELECT rowid FROM variants{where}", parameters)])
+        chosen = np.random.default_rng(seed).choice(rowids, size=min(count, len(rowids)), replace=False)
+        rows = {}
+        for start in range(0, len(chosen), 500):
+            block = [int(rowid) for rowid in chosen[start:start + 500]]
+            for values in self.connection.execute(
+                    f"SELECT rowid, {', '.join(columns)} FROM variants WHERE rowid IN ({', '.join('?' * len(block))})", block):
+                rows[values[0]] = self.decode(values[1:])
+        return [rows[int(rowid)] for rowid in chosen]
+
+    # Function to build the WHERE clause of the common filters
+    def filters(self, category=None, split=None, variant_ids=None):
+        clauses, parameters = [], []
+        if category is not None:
+            clauses.append("category = ?")
+            parameters.append(category)
+        if split is not None:
+            clauses.append("split = ?")
+            parameters.append(split)
+        if variant_ids is not None:
+            variant_ids = [int(i) for i in variant_ids]
+            clauses.append(f"variant_id IN ({', '.join('?' * len(variant_ids))})")
+            parameters.extend(variant_ids)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), parameters
+
+    # Function to convert a column value to its stored form
+    def encode(self, column, value):
+        if value is None:
+            return None
+        if column == "rotation":
+            return np.asarray(value, dtype=np.float64).reshape(9).tobytes()
+        if column in path_columns:
+            return os.path.relpath(value, self.root)
+        if column in shape_columns:
+            return ",".join(str(int(n)) for n in value)
+        return value
+
+    # Function to convert a stored row to a dict with absolute paths, a 3x3 rotation and shape tuples
+    def decode(self, values):
+        entry = dict(zip(columns, values))
+        if entry["rotation"] is not None:
+            entry["rotation"] = np.frombuffer(entry["rotation"], dtype=np.float64).reshape(3, 3)
+        for column in path_columns:
+            if entry[column] is not None:
+                entry[column] = os.path.normpath(os.path.join(self.root, entry[column]))
+        for column in shape_columns:
+            if entry[column] is not None:
+                entry[column] = tuple(int(n) for n in entry[column].split(","))
+        return entry
+
+
+# Function to load the (partial, complete, occupancy) arrays of a catalog entry
+def load_entry(entry):
+    if entry["shard"] is not None:
+        shard = open_shard(entry["shard"])
+        row = entry["row"]
+        return np.asarray(shard["partial"][row]), np.asarray(shard["complete"][row]), read_shard_occupancy(shard, row)[0]
+    return load_xyz(entry["partial_path"]), load_xyz(entry["complete_path"]), load_occupancy(entry["occupancy_path"])
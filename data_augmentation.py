@@ -1,100 +1,173 @@
 import os
+import zlib
+import argparse
+import functools
+import contextlib
+from functools import lru_cache
+from multiprocessing import Pool
 import numpy as np
 import scipy.ndimage
 import trimesh
 from scipy.spatial.transform import Rotation as R
+from shard_io import create_shard, shard_dir, shard_exists, open_shard, write_shard_row, flush_shard
+from occupancy_io import save_occupancy, occupancy_formats, occupancy_file_path
+from surface_sampler import SurfaceSampler, sample_half_space, farthest_point_sampling
+import depth_renderer
+from depth_renderer import look_at, sample_visible
+from query_points import points_inside, sample_query_points, signed_distance, save_query_points, sdf_surface_samples, \
+    query_padding, query_sigma, query_uniform_fraction
+from voxelizer import voxelize_solid, voxelize_solid_batch, voxelize_intervals, voxelize_intervals_batch
+from async_writer import AsyncWriter
+from pointcloud_io import save_xyz, binary_path
+from mesh_normalization import rotate_mesh, normalize_mesh, force_cubic_normalization
+from manifest import Manifest, params_hash, file_hash
+from catalog import Catalog, catalog_name
+from mesh_cache import load_mesh, source_hash
+from mesh_lod import load_lod_mesh, lod_tolerance, lod_cell_fractions
+from profiling import StageProfiler, ProgressLine
+from sharding import shard_units, shard_manifest_dir, merge_shard_manifests
+import time
 
 # Define base paths
 ycb_grasp_dataset_dir = "/home/haoming/Downloads/ycb_grasp_dataset"
 input_dir = os.path.join(ycb_grasp_dataset_dir, "input")
 gt_dir = os.path.join(ycb_grasp_dataset_dir, "gt")
+packed_dir = os.path.join(ycb_grasp_dataset_dir, "packed")
+manifest_dir = os.path.join(ycb_grasp_dataset_dir, "manifests")
+report_dir = os.path.join(ycb_grasp_dataset_dir, "reports")
+catalog_path = os.path.join(ycb_grasp_dataset_dir, catalog_name)
 meshes_dir = "/home/haoming/Downloads/ycb_meshes/ycb-objects/meshes"
 
-# Function to generate a random rotation matrix
-def random_rotation_matrix():
-    # Generate random rotation matrix using random Euler angles
-    return R.random().as_matrix()
-
-# Function to apply rotation to the mesh vertices
-def rotate_mesh(mesh, rotation_matrix):
-    # Apply rotation to mesh vertices by multiplying with the rotation matrix
-    mesh.vertices = mesh.vertices @ rotation_matrix.T
-    return mesh
-
-# Function to normalize the mesh vertices to range [-0.5, 0.5]
-def normalize_mesh(mesh):
-    # Get the bounding box of the vertices
-    min_bounds = mesh.bounds[0]
-    max_bounds = mesh.bounds[1]
-
-    # Compute the center of the bounding box
-    center = (min_bounds + max_bounds) / 2.0
-
-    # Shift the vertices to be centered at the origin
-    mesh.vertices -= center
-
-    # Compute the scale factor to fit the vertices in [-0.5, 0.5]
-    scale = np.max(max_bounds - min_bounds)
-
-    # Scale the vertices to fit within the range [-0.5, 0.5]
-    mesh.vertices /= scale
-
-    return mesh
-
-def force_cubic_normalization(mesh):
-    min_bounds = mesh.bounds[0]
-    max_bounds = mesh.bounds[1]
-
-    # Compute the center of the bounding box
-    center = (min_bounds + max_bounds) / 2.0
-
-    # Compute the ranges along each axis
-    ranges = max_bounds - min_bounds
-
-    # Find the maximum range across all axes
-    max_range = np.max(ranges)
-
-    # Scale each axis proportionally to make the mesh cubic
-    scales = max_range / ranges
-
-    # Translate the mesh to the center
-    mesh.apply_translation(-center)
-
-    # Apply non-uniform scaling to make the bounding box cubic
-    mesh.apply_scale(scales)
-
-    # Finally, apply uniform scaling to fit the bounding box in [-0.5, 0.5]
-    mesh.apply_scale(1 / max_range)
+# Variants per mesh and how they are split between train and test
+num_variants = 700
+num_train_variants = 600
+
+# Number of points for complete and partial point clouds and the occupancy resolution
+num_complete_points = 8192
+num_partial_points = 2048
+voxel_resolution = 32
+
+# In farthest-point mode every cloud is drawn with this many times its points, then thinned by farthest-point sampling
+fps_oversample = 2
+
+# Partial clouds are sampled from the surface on the side normal . x < distance of this cutting plane
+partial_plane = ((0.0, 0.0, 1.0), 0.0)
+
+# Depth-rendered partial clouds are seen by a camera at this position looking at the origin (from below, like the bottom half)
+partial_camera = (0.0, 0.0, -2.0)
+
+# Variants generated together in one batch by the cached sampler
+variant_batch_size = 25
+
+# The outputs produced for every variant
+variant_outputs = ("partial", "complete", "occupancy")
+
+# Output options, any of them can be overridden per run
+#   sampler:          "cached" samples whole batches with SurfaceSampler, "trimesh" copies the mesh per variant
+#   binary_sidecar:   also write a float32 .xyzb file next to every .xyz for fast loading
+#   writer_threads:   threads saving finished variants in the background, 0 saves inline
+#   voxelizer:        "parity" fills a fixed grid by ray crossing parity, "trimesh" uses mesh.voxelized + binary_fill_holes
+#   output_format:    "files" writes three files per variant, "packed" one shard per category/split
+#   occupancy_format: "dense", "packed" or "packed_compressed" storage of the occupancy grids, or "sparse" column
+#                     intervals written without a dense grid (parity voxelizer and loose files only); they can be
+#                     densified at other resolutions, exactly along z and nearest-neighbour in x and y
+#   voxel_resolution: resolution of the occupancy grids
+#   mesh_cache:       load meshes through the preprocessed float32 mesh cache instead of parsing the .ply
+#   mesh_lod:         use the coarsest cached decimated mesh whose error is below the voxel pitch and point spacing
+#   resume:           skip outputs the manifest records as complete for the same mesh and parameters
+#   partial:          "half_space" samples the surface below partial_plane, "depth" the surface visible from partial_camera
+#   point_sampling:   "uniform" random surface samples, or "fps" farthest-point thinning of fps_oversample times as many
+#   query_points:     number of labeled occupancy query points written per variant (loose files only), 0 writes none
+#   query_sdf:        also store the approximate signed distance of every query point
+default_options = {
+    "sampler": "cached",
+    "voxelizer": "parity",
+    "writer_threads": 4,
+    "binary_sidecar": False,
+    "output_format": "files",
+    "occupancy_format": "dense",
+    "mesh_cache": True,
+    "mesh_lod": False,
+    "resume": True,
+    "partial": "half_space",
+    "query_points": 0,
+    "query_sdf": False,
+    "point_sampling": "uniform",
+    "voxel_resolution": voxel_resolution,
+}
+
+# Function to load a source mesh, through the mesh cache unless it is disabled
+def load_source_mesh(mesh_path, options):
+    # Levels of detail are built from and stored in the mesh cache
+    if options.get("mesh_lod"):
+        return load_lod_mesh(mesh_path, options["voxel_resolution"], num_complete_points)
+    if options["mesh_cache"]:
+        return load_mesh(mesh_path)
+    return trimesh.load(mesh_path)
+
+# Function to fill in the defaults for the options that were not given
+def resolve_options(options=None):
+    options = {**default_options, **(options or {})}
+    if options["occupancy_format"] == "sparse" and (options["voxelizer"] != "parity" or options["output_format"] != "files"):
+        raise ValueError("sparse occupancy is only written as loose files by the parity voxelizer")
+    if options["query_points"] > 0 and options["output_format"] != "files":
+        raise ValueError("query points are only written as loose files")
+    return options
+
+# Work is split into (mesh, variant-range) units of this many variants
+variants_per_unit = 50
+
+# Base seed; every variant derives its own random streams from it
+base_seed = 0
+
+# Function to create the random streams of one variant
+def variant_rngs(category_name, variant_id, seed=None, count=3):
+    """
+    Returns independent generators for the rotation, the complete cloud and
+    the partial cloud of a variant, followed by the query points with count=4.
+    They depend only on the seed (base_seed by default), the category and the
+    variant id, so the output does not depend on how the work is split.
+    """
+    seed = base_seed if seed is None else seed
+    seed_sequence = np.random.SeedSequence([seed, zlib.crc32(category_name.encode()), variant_id])
+    return [np.random.default_rng(child) for child in seed_sequence.spawn(count)]
 
-    return mesh
+# Function to generate a random rotation matrix
+def random_rotation_matrix(rng=None):
+    # Generate a uniformly distributed random rotation matrix
+    return R.random(random_state=rng).as_matrix()
 
-# Function to sample a partial point cloud from the complete point cloud
-def sample_partial_from_mesh(mesh, num_points=2048):
+# Function to sample a partial point cloud from the part of the mesh below the cutting plane
+def sample_partial_from_mesh(mesh, num_points=2048, rng=None, plane=partial_plane):
     """
-    This function takes the complete point cloud and samples 2048 points
-    from the bottom half (where z < 0).
+    The triangles are clipped against the plane (by default the bottom half,
+    z < 0) and num_points points are drawn uniformly from the clipped surface.
     """
-    # Extract the bottom half points where the z-coordinate is less than 0
-    sampled_full_points, _ = trimesh.sample.sample_surface(mesh, num_points * 8)
-    bottom_half_points = sampled_full_points[sampled_full_points[:, 2] < 0]
+    if rng is None:
+        rng = np.random.default_rng()
 
-    # If there are enough points, randomly sample 2048, otherwise take all
-    if len(bottom_half_points) > num_points:
-        sampled_points = bottom_half_points[np.random.choice(len(bottom_half_points), num_points, replace=False)]
-    else:
-        repeat_indices = np.random.choice(len(bottom_half_points), num_points - len(bottom_half_points), replace=True)
-        sampled_points = np.vstack([bottom_half_points, bottom_half_points[repeat_indices]])
+    normal, distance = plane
+    return sample_half_space(mesh.triangles, num_points, rng, normal, distance)
 
-    return sampled_points
+# Function to sample a partial point cloud from the surface a depth camera at partial_camera sees
+def sample_visible_from_mesh(mesh, num_points=2048, rng=None, camera=partial_camera):
+    if rng is None:
+        rng = np.random.default_rng()
+
+    return sample_visible(mesh.vertices, mesh.faces, look_at(camera), camera, num_points, [rng])[0]
 
 # Function to sample a complete point cloud from the mesh
-def sample_complete_from_mesh(mesh, num_points=8192):
+def sample_complete_from_mesh(mesh, num_points=8192, rng=None):
     # Sample uniformly from the mesh surface
-    sampled_points, _ = trimesh.sample.sample_surface(mesh, num_points)
+    sampled_points, _ = trimesh.sample.sample_surface(mesh, num_points, seed=rng)
     return sampled_points
 
 # Function to create a solid occupancy grid from the mesh
-def create_solid_occupancy_grid(mesh, resolution=32):
+def create_solid_occupancy_grid(mesh, resolution=32, voxelizer="parity"):
+    # Test the voxel centres of the fixed [-0.5, 0.5]^3 grid directly
+    if voxelizer == "parity":
+        return voxelize_solid(mesh.vertices, mesh.faces, resolution).astype(int)
+
     # Create a voxelized version of the mesh
     voxel_grid = mesh.voxelized(pitch=1.0 / resolution).matrix
 
@@ -104,71 +177,596 @@ def create_solid_occupancy_grid(mesh, resolution=32):
 
     return voxel_grid.astype(int)
 
-# Function to save a point cloud to an XYZ file
-def save_xyz(points, file_path):
-    np.savetxt(file_path, points, fmt="%.6f")
-
-# Function to process each mesh and generate rotated variants
-def process_mesh_variants(mesh_path, category_name):
-    # Load and normalize the mesh
-    mesh = trimesh.load(mesh_path)
-    #normalized_mesh = normalize_mesh(mesh)
-    #normalized_mesh = force_cubic_normalization(mesh)
-
-    # Create directories for train and test
-    train_input_dir = os.path.join(input_dir, category_name, "train")
-    test_input_dir = os.path.join(input_dir, category_name, "test")
-    train_gt_dir = os.path.join(gt_dir, category_name, "train")
-    test_gt_dir = os.path.join(gt_dir, category_name, "test")
-
-    os.makedirs(train_input_dir, exist_ok=True)
-    os.makedirs(test_input_dir, exist_ok=True)
-    os.makedirs(train_gt_dir, exist_ok=True)
-    os.makedirs(test_gt_dir, exist_ok=True)
-
-    # Generate 700 variants using random rotations
-    for i in range(700):
-        suffix = f"_{i}"
-
-        # Generate a random rotation matrix
-        rotation_matrix = random_rotation_matrix()
-
-        # Rotate the mesh before sampling point clouds and generating the occupancy grid
+# Function to get the split of a variant and its row inside that split
+def variant_split(variant_id):
+    if variant_id < num_train_variants:
+        return "train", variant_id
+    return "test", variant_id - num_train_variants
+
+# Function to get the output paths (partial, complete, occupancy) of a variant
+def variant_paths(category_name, variant_id):
+    split, _ = variant_split(variant_id)
+    suffix = f"_{variant_id}"
+    partial_path = os.path.join(input_dir, category_name, split, f"{category_name}{suffix}_x.xyz")
+    complete_path = os.path.join(gt_dir, category_name, split, f"{category_name}{suffix}_y.xyz")
+    occupancy_path = os.path.join(gt_dir, category_name, split, f"{category_name}{suffix}.npy")
+    return partial_path, complete_path, occupancy_path
+
+# Function to get the query point file of a variant, next to its occupancy grid
+def query_points_path(category_name, variant_id):
+    split, _ = variant_split(variant_id)
+    return os.path.join(gt_dir, category_name, split, f"{category_name}_{variant_id}_q.npz")
+
+# Function to list the outputs written for every variant with the given options
+def enabled_outputs(options):
+    return variant_outputs + ("points",) if options["query_points"] > 0 else variant_outputs
+
+# Function to create the random stream of the query points of a variant, the fourth stream of variant_rngs
+def query_points_rng(category_name, variant_id, seed=None):
+    return variant_rngs(category_name, variant_id, seed, count=4)[3]
+
+# Function to generate the labeled query points of a batch of variants, in the frame of their other outputs
+def generate_query_points(mesh, category_name, variant_ids, options, sampler=None, seed=None):
+    """
+    Half of the points are uniform in the (slightly grown) normalized cube,
+    the others are surface samples jittered by query_sigma. They are rounded
+    to float16 before labeling, so the stored labels hold for the stored
+    points. Returns (points, inside, signed distance or None) per variant.
+    """
+    if sampler is None:
+        sampler = SurfaceSampler.from_mesh(mesh)
+    rotation_matrices = np.stack([random_rotation_matrix(variant_rngs(category_name, i, seed)[0]) for i in variant_ids])
+    linear, offset = sampler.cubic_normalization(rotation_matrices)
+
+    results = []
+    for b, i in enumerate(variant_ids):
+        rng = query_points_rng(category_name, i, seed)
+        surface = sampler.sample(linear[b], offset[b], sdf_surface_samples, [rng])[0]
+        points = sample_query_points(surface, options["query_points"], rng).astype(np.float16).astype(np.float64)
+        inside = points_inside(sampler.triangles @ linear[b].T + offset[b], points)
+        sdf = signed_distance(surface, points, inside) if options["query_sdf"] else None
+        results.append((points, inside, sdf))
+    return results
+
+# Function to get how many points to draw for a cloud of count points
+def candidate_count(count, options):
+    return count * fps_oversample if options["point_sampling"] == "fps" else count
+
+# Function to thin a batch of candidate clouds down to count points in farthest-point mode
+def spread_clouds(clouds, count, rngs, options):
+    if options["point_sampling"] != "fps":
+        return clouds
+    return farthest_point_sampling(clouds, count, rngs)
+
+# Function to generate a single rotated variant of the mesh
+def generate_variant(mesh, category_name, variant_id, options=None, outputs=variant_outputs, profiler=None):
+    options = resolve_options(options)
+    profiler = profiler or StageProfiler()
+    rotation_rng, complete_rng, partial_rng = variant_rngs(category_name, variant_id)
+
+    # Generate a random rotation matrix
+    rotation_matrix = random_rotation_matrix(rotation_rng)
+
+    # Rotate the mesh before sampling point clouds and generating the occupancy grid
+    with profiler.stage("normalize"):
         rotated_mesh = rotate_mesh(mesh.copy(), rotation_matrix)
         normalized_mesh = force_cubic_normalization(rotated_mesh)
 
-        # Sample the complete and partial point clouds from the rotated mesh
-        rotated_complete = sample_complete_from_mesh(normalized_mesh)
-        rotated_partial = sample_partial_from_mesh(normalized_mesh)
-        rotated_occupancy_grid = create_solid_occupancy_grid(normalized_mesh)
-
-        # Save partial and complete point clouds
-        partial_variant_path = os.path.join(train_input_dir if i < 600 else test_input_dir, f"{category_name}{suffix}_x.xyz")
-        complete_variant_path = os.path.join(train_gt_dir if i < 600 else test_gt_dir, f"{category_name}{suffix}_y.xyz")
-        save_xyz(rotated_partial, partial_variant_path)
-        save_xyz(rotated_complete, complete_variant_path)
-
-        # Save the rotated occupancy grid
-        occupancy_variant_path = os.path.join(train_gt_dir if i < 600 else test_gt_dir, f"{category_name}{suffix}.npy")
-        np.save(occupancy_variant_path, rotated_occupancy_grid)
-
-        print(f"Processed variant {i + 1}/700 for category {category_name}")
-
-# Main function to process all meshes
-def main():
-    mesh_files = [f for f in os.listdir(meshes_dir) if f.endswith(".ply")]
-    counter = 0
+    # Sample the complete and partial point clouds from the rotated mesh, skipping outputs that are not wanted
+    rotated_complete = rotated_partial = rotated_occupancy_grid = None
+    if "complete" in outputs:
+        with profiler.stage("complete_sampling"):
+            rotated_complete = sample_complete_from_mesh(normalized_mesh, candidate_count(num_complete_points, options), rng=complete_rng)
+            rotated_complete = spread_clouds(rotated_complete[None], num_complete_points, [complete_rng], options)[0]
+    if "partial" in outputs:
+        with profiler.stage("partial_sampling"):
+            count = candidate_count(num_partial_points, options)
+            if options["partial"] == "depth":
+                rotated_partial = sample_visible_from_mesh(normalized_mesh, count, rng=partial_rng)
+            else:
+                rotated_partial = sample_partial_from_mesh(normalized_mesh, count, rng=partial_rng)
+            rotated_partial = spread_clouds(rotated_partial[None], num_partial_points, [partial_rng], options)[0]
+    if "occupancy" in outputs:
+        with profiler.stage("voxelization"):
+            if options["occupancy_format"] == "sparse":
+                rotated_occupancy_grid = voxelize_intervals(normalized_mesh.vertices, normalized_mesh.faces,
+                                                            options["voxel_resolution"])
+            else:
+                rotated_occupancy_grid = create_solid_occupancy_grid(normalized_mesh, options["voxel_resolution"], options["voxelizer"])
+
+    return rotation_matrix, rotated_partial, rotated_complete, rotated_occupancy_grid
+
+# Function to generate a batch of rotated variants, returns one tuple per variant like generate_variant
+def generate_variants(mesh, category_name, variant_ids, options=None, sampler=None, outputs=variant_outputs, profiler=None):
+    """
+    Every output uses its own random stream, so leaving some of them out
+    through outputs does not change the ones that are produced.
+    """
+    options = resolve_options(options)
+    profiler = profiler or StageProfiler()
+    if options["sampler"] == "trimesh":
+        return [generate_variant(mesh, category_name, i, options, outputs, profiler) for i in variant_ids]
+    if sampler is None:
+        sampler = SurfaceSampler.from_mesh(mesh)
+
+    rngs = [variant_rngs(category_name, i) for i in variant_ids]
+    rotation_matrices = np.stack([random_rotation_matrix(rotation_rng) for rotation_rng, _, _ in rngs])
+
+    # Rotation plus force_cubic_normalization is one affine map per variant, no mesh copies needed
+    with profiler.stage("normalize"):
+        linear, offset = sampler.cubic_normalization(rotation_matrices)
+    completes = partials = grids = [None] * len(rngs)
+    if "complete" in outputs:
+        with profiler.stage("complete_sampling"):
+            complete_rngs = [complete_rng for _, complete_rng, _ in rngs]
+            completes = sampler.sample(linear, offset, candidate_count(num_complete_points, options), complete_rngs)
+            completes = spread_clouds(completes, num_complete_points, complete_rngs, options)
+    if "partial" in outputs:
+        with profiler.stage("partial_sampling"):
+            partial_rngs = [partial_rng for _, _, partial_rng in rngs]
+            if options["partial"] == "depth":
+                mapped_vertices = np.einsum("bij,vj->bvi", linear, sampler.vertices) + offset[:, None]
+                cameras = np.repeat(np.asarray([partial_camera]), len(rngs), axis=0)
+                partials = sample_visible(mapped_vertices, sampler.faces, look_at(cameras), cameras,
+                                          candidate_count(num_partial_points, options), partial_rngs)
+            else:
+                normal, distance = partial_plane
+                partials = sampler.sample_half_space(linear, offset, candidate_count(num_partial_points, options), partial_rngs,
+                                                     normal, distance)
+            partials = spread_clouds(np.asarray(partials), num_partial_points, partial_rngs, options)
+    if "occupancy" in outputs:
+        with profiler.stage("voxelization"):
+            resolution = options["voxel_resolution"]
+            if options["occupancy_format"] == "sparse":
+                grids = voxelize_intervals_batch(sampler.vertices, sampler.faces, linear, offset, resolution)
+            elif options["voxelizer"] == "parity":
+                grids = voxelize_solid_batch(sampler.vertices, sampler.faces, linear, offset, resolution).astype(int)
+            else:
+                grids = [create_solid_occupancy_grid(sampler.transformed_mesh(linear[b], offset[b]), resolution, "trimesh")
+                         for b in range(len(rngs))]
+
+    return [(rotation_matrices[b], partials[b], completes[b], grids[b]) for b in range(len(rngs))]
+
+# Function to allocate the train and test shards of a category if they are missing
+def ensure_packed_shards(category_name, options, replace=True):
+    """
+    Shards of another shape are replaced only with replace; the nodes of a
+    multi-node run pass False, so none of them can swap out a shard whose rows
+    another node is writing. Such shards are reallocated once beforehand with
+    --allocate-shards.
+    """
+    packed_occupancy = options["occupancy_format"] != "dense"
+    split_rows = {"train": num_train_variants, "test": num_variants - num_train_variants}
+    for split, num_rows in split_rows.items():
+        directory = shard_dir(packed_dir, category_name, split)
+        if shard_exists(directory, num_rows, packed_occupancy, (num_partial_points, 3), (num_complete_points, 3),
+                        (options["voxel_resolution"],) * 3):
+            continue
+        if os.path.isdir(directory) and not replace:
+            raise ValueError(f"shard {directory} has another shape, reallocate the shards with --allocate-shards first")
+        created = create_shard(directory, num_rows, (num_partial_points, 3), (num_complete_points, 3),
+                               (options["voxel_resolution"],) * 3, packed_occupancy=packed_occupancy, replace=replace)
+        # Another node may have won the race, its shard must then be the expected one
+        if not created and not shard_exists(directory, num_rows, packed_occupancy, (num_partial_points, 3),
+                                            (num_complete_points, 3), (options["voxel_resolution"],) * 3):
+            raise ValueError(f"shard {directory} was created with another shape by another process")
+
+# Function to get the manifest file of a category, or the one a shard of a multi-node run writes
+def manifest_path(category_name, shard_index=None):
+    if shard_index is not None:
+        return os.path.join(shard_manifest_dir(manifest_dir, shard_index), f"{category_name}.json")
+    return os.path.join(manifest_dir, f"{category_name}.json")
+
+# Function to check whether a run reads its meshes through the mesh cache, levels of detail always live in it
+def uses_mesh_cache(options):
+    return options["mesh_cache"] or options["mesh_lod"]
+
+# The source mesh hash is computed once per file and process; the mesh cache only rehashes changed files,
+# without it the file is hashed directly and the cache directory is left alone
+@lru_cache(maxsize=None)
+def mesh_file_hash(mesh_path, use_mesh_cache=True):
+    return source_hash(mesh_path) if use_mesh_cache else file_hash(mesh_path)
+
+# Function to hash the parameters each output depends on, editing one of them invalidates only that output
+def output_params_hashes(options):
+    shared = {"base_seed": base_seed, "num_train_variants": num_train_variants, "output_format": options["output_format"],
+              "mesh_cache": options["mesh_cache"]}
+    if options["mesh_lod"]:
+        # The level every output is made from depends on the voxel pitch and the complete point count
+        shared["mesh_lod"] = {"lod_tolerance": lod_tolerance, "lod_cell_fractions": lod_cell_fractions,
+                              "voxel_resolution": options["voxel_resolution"], "num_complete_points": num_complete_points}
+    clouds = {**shared, "sampler": options["sampler"], "binary_sidecar": options["binary_sidecar"], **sampling_params(options)}
+    return {
+        "partial": params_hash({**clouds, "num_partial_points": num_partial_points, **partial_params(options)}),
+        "complete": params_hash({**clouds, "num_complete_points": num_complete_points}),
+        "occupancy": params_hash({**shared, "voxel_resolution": options["voxel_resolution"], "voxelizer": options["voxelizer"],
+                                  "occupancy_format": options["occupancy_format"]}),
+        "points": params_hash({**shared, "query_points": options["query_points"], "query_sdf": options["query_sdf"],
+                               "query_padding": query_padding, "query_sigma": query_sigma,
+                               "query_uniform_fraction": query_uniform_fraction, "sdf_surface_samples": sdf_surface_samples,
+                               "labels": "voxelizer_rays"}),
+    }
+
+# Function to get the parameters of the point sampling mode, none for the default uniform sampling
+def sampling_params(options):
+    if options["point_sampling"] == "fps":
+        return {"point_sampling": "fps", "fps_oversample": fps_oversample}
+    return {}
+
+# Function to get the parameters deciding the partial clouds of the chosen partial mode
+def partial_params(options):
+    if options["partial"] == "depth":
+        return {"partial": "depth", "partial_camera": partial_camera, "image_size": depth_renderer.image_size,
+                "field_of_view": depth_renderer.field_of_view}
+    return {"partial_plane": partial_plane}
+
+# Function to list the files written for one output of a variant
+def output_files(category_name, variant_id, output, options):
+    partial_path, complete_path, occupancy_path = variant_paths(category_name, variant_id)
+    if output == "occupancy":
+        return [occupancy_file_path(occupancy_path, options["occupancy_format"])]
+    if output == "points":
+        return [query_points_path(category_name, variant_id)]
+    path = partial_path if output == "partial" else complete_path
+    return [path, binary_path(path)] if options["binary_sidecar"] else [path]
+
+# Function to record finished outputs in a manifest, removing files an output no longer writes
+def record_outputs(manifest, category_name, completed, mesh_hash, hashes, options):
+    for variant_id, outputs in completed:
+        for output in outputs:
+            if options["output_format"] == "packed":
+                split, row = variant_split(variant_id)
+                superseded = manifest.record(variant_id, output, mesh_hash, hashes[output],
+                                             shard=shard_dir(packed_dir, category_name, split), row=row)
+            else:
+                files = output_files(category_name, variant_id, output, options)
+                superseded = manifest.record(variant_id, output, mesh_hash, hashes[output], files)
+            for path in superseded:
+                if os.path.exists(path):
+                    os.remove(path)
+
+# Function to count the bytes written for finished outputs
+def written_bytes(category_name, completed, options):
+    if options["output_format"] == "packed":
+        row_bytes = {"partial": num_partial_points * 3 * 4, "complete": num_complete_points * 3 * 4,
+                     "occupancy": options["voxel_resolution"] ** 3 // (8 if options["occupancy_format"] != "dense" else 1)}
+        return sum(row_bytes[output] for _, outputs in completed for output in outputs)
+    total = 0
+    for variant_id, outputs in completed:
+        for output in outputs:
+            total += sum(os.path.getsize(path) for path in output_files(category_name, variant_id, output, options))
+    return total
 
+# Function to process each mesh and generate rotated variants
+def process_mesh_variants(mesh_path, category_name, start=0, stop=num_variants, mesh=None, options=None, sampler=None,
+                          manifest=None, save_manifest=True, profiler=None, progress=None, shard_index=None):
+    options = resolve_options(options)
+    output_format = options["output_format"]
+    profiler = profiler or StageProfiler()
+
+    # Without a source file there is nothing to key the manifest on
+    mesh_hash = mesh_file_hash(mesh_path, uses_mesh_cache(options)) if mesh_path is not None else None
+    if manifest is None and mesh_hash is not None:
+        manifest = Manifest(manifest_path(category_name, shard_index))
+    hashes = output_params_hashes(options)
+
+    # Merging removes the shard manifests, so a shard also skips what an earlier merge moved into the dataset manifest
+    manifests = [manifest] if manifest is not None else []
+    if shard_index is not None and mesh_hash is not None:
+        manifests.append(Manifest(manifest_path(category_name)))
+
+    # Load the mesh unless the caller already holds it
+    with profiler.stage("load"):
+        if mesh is None:
+            mesh = load_source_mesh(mesh_path, options)
+        if sampler is None and options["sampler"] == "cached":
+            sampler = SurfaceSampler.from_mesh(mesh)
+
+    # Create directories for train and test, or the shards in packed mode
+    shards = {}
+    if output_format == "packed":
+        ensure_packed_shards(category_name, options, replace=shard_index is None)
+        shards = {split: open_shard(shard_dir(packed_dir, category_name, split), mode="r+") for split in ("train", "test")}
+    else:
+        for base_dir in (input_dir, gt_dir):
+            for split in ("train", "test"):
+                os.makedirs(os.path.join(base_dir, category_name, split), exist_ok=True)
+
+    # Generate the variants start..stop-1 using random rotations, a batch at a time,
+    # while the writer saves the previous ones; leaving the block waits for all writes
+    completed = []
+    with AsyncWriter(options["writer_threads"]) as writer:
+        for batch_start in range(start, stop, variant_batch_size):
+            # Outputs the manifest already records as up to date are not generated again
+            todo = {}
+            for i in range(batch_start, min(batch_start + variant_batch_size, stop)):
+                todo[i] = [output for output in enabled_outputs(options) if not (options["resume"] and any(
+                    recorded.is_complete(i, output, mesh_hash, hashes[output]) for recorded in manifests))]
+            variant_ids = [i for i, outputs in todo.items() if outputs]
+            if not variant_ids:
+                continue
+            needed = {output for i in variant_ids for output in todo[i]}
+            variants = generate_variants(mesh, category_name, variant_ids, options, sampler, outputs=needed, profiler=profiler)
+
+            for i, (rotation_matrix, rotated_partial, rotated_complete, rotated_occupancy_grid) in zip(variant_ids, variants):
+                rotated_partial = rotated_partial if "partial" in todo[i] else None
+                rotated_complete = rotated_complete if "complete" in todo[i] else None
+                rotated_occupancy_grid = rotated_occupancy_grid if "occupancy" in todo[i] else None
+
+                if output_format == "packed":
+                    split, row = variant_split(i)
+                    writer.submit(profiler.timed("save", write_shard_row), shards[split], row, i, rotation_matrix,
+                                  rotated_partial, rotated_complete, rotated_occupancy_grid)
+                else:
+                    # Save partial and complete point clouds and the rotated occupancy grid
+                    partial_variant_path, complete_variant_path, occupancy_variant_path = variant_paths(category_name, i)
+                    if rotated_partial is not None:
+                        writer.submit(profiler.timed("save", save_xyz), rotated_partial, partial_variant_path, options["binary_sidecar"])
+                    if rotated_complete is not None:
+                        writer.submit(profiler.timed("save", save_xyz), rotated_complete, complete_variant_path, options["binary_sidecar"])
+                    if rotated_occupancy_grid is not None:
+                        writer.submit(profiler.timed("save", save_occupancy), occupancy_variant_path, rotated_occupancy_grid,
+                                      options["occupancy_format"])
+                completed.append((i, todo[i]))
+
+            # Query points are labeled against the same normalized mesh as the grids
+            points_ids = [i for i in variant_ids if "points" in todo[i]]
+            if points_ids:
+                with profiler.stage("query_points"):
+                    query_points = generate_query_points(mesh, category_name, points_ids, options, sampler)
+                for i, (points, inside, sdf) in zip(points_ids, query_points):
+                    writer.submit(profiler.timed("save", save_query_points), query_points_path(category_name, i), points, inside, sdf)
+
+            profiler.add_variants(len(variant_ids))
+            if progress is not None:
+                progress.update(profiler.variants)
+
+    for shard in shards.values():
+        flush_shard(shard)
+    profiler.add_bytes(written_bytes(category_name, completed, options))
+
+    # Outputs are only recorded once all of their writes have finished
+    if manifest is not None:
+        record_outputs(manifest, category_name, completed, mesh_hash, hashes, options)
+        if save_manifest:
+            manifest.save()
+    return manifest
+
+# Function to build the catalog rows of the variants whose outputs are all recorded in a manifest
+def catalog_rows(category_name, manifest, options):
+    """
+    The rotation of a variant is recomputed from its random stream, so the
+    catalog needs nothing from the workers beyond the manifest records.
+    """
+    shapes = {"partial_shape": (num_partial_points, 3), "complete_shape": (num_complete_points, 3),
+              "occupancy_shape": (options["voxel_resolution"],) * 3}
+    rows = []
+    for key, outputs in sorted(manifest.variants.items(), key=lambda item: int(item[0])):
+        if not all(output in outputs for output in variant_outputs):
+            continue
+        variant_id = int(key)
+        split, row = variant_split(variant_id)
+        rotation_rng, _, _ = variant_rngs(category_name, variant_id)
+        entry = {"category": category_name, "split": split, "variant_id": variant_id, "row": row,
+                 "rotation": random_rotation_matrix(rotation_rng), **shapes}
+        if "shard" in outputs["partial"]:
+            entry["shard"] = outputs["partial"]["shard"]
+        else:
+            # The first recorded file of an output is the .xyz or grid itself, a binary sidecar follows it
+            for output in variant_outputs:
+                entry[f"{output}_path"] = next(iter(outputs[output]["files"]))
+        rows.append(entry)
+    return rows
+
+# Function to rewrite the catalog rows of some categories from their manifests
+def update_catalog(category_names, options, path=None):
+    with Catalog(path or catalog_path) as catalog:
+        for category_name in category_names:
+            catalog.remove(category_name)
+            catalog.add(catalog_rows(category_name, Manifest(manifest_path(category_name)), options))
+
+# Function to list the meshes to process in a stable order
+def list_mesh_files():
+    return sorted(f for f in os.listdir(meshes_dir) if f.endswith(".ply"))
+
+# Function to split all meshes into (mesh, variant-range) work units
+def make_work_units(mesh_files, unit_size=variants_per_unit):
+    units = []
     for mesh_file in mesh_files:
         category_name = mesh_file.replace(".ply", "")
         mesh_path = os.path.join(meshes_dir, mesh_file)
+        for start in range(0, num_variants, unit_size):
+            units.append((mesh_path, category_name, start, min(start + unit_size, num_variants)))
+    return units
+
+# Each worker keeps the meshes it has loaded so consecutive units of the same mesh reuse them
+@lru_cache(maxsize=2)
+def load_worker_mesh(mesh_path, use_mesh_cache=True, lod_resolution=None):
+    return load_source_mesh(mesh_path, {"mesh_cache": use_mesh_cache, "mesh_lod": lod_resolution is not None,
+                                        "voxel_resolution": lod_resolution})
+
+# The sampler's triangle data is likewise built once per mesh and worker
+@lru_cache(maxsize=2)
+def load_worker_sampler(mesh_path, use_mesh_cache=True, lod_resolution=None):
+    return SurfaceSampler.from_mesh(load_worker_mesh(mesh_path, use_mesh_cache, lod_resolution))
+
+# Function run by the pool workers on one work unit, returns the unit, its new manifest records and its stage totals
+def process_work_unit(unit, options=None, shard_index=None):
+    mesh_path, category_name, start, stop = unit
+    options = resolve_options(options)
+    lod_resolution = options["voxel_resolution"] if options["mesh_lod"] else None
+    sampler = load_worker_sampler(mesh_path, options["mesh_cache"], lod_resolution) if options["sampler"] == "cached" else None
+
+    profiler = StageProfiler()
+    with profiler.stage("load"):
+        mesh = load_worker_mesh(mesh_path, options["mesh_cache"], lod_resolution)
+
+    # Workers read the manifest but never write it; the main process merges their records
+    manifest = process_mesh_variants(mesh_path, category_name, start, stop, mesh=mesh, options=options, sampler=sampler,
+                                     save_manifest=False, profiler=profiler, shard_index=shard_index)
+    return unit, manifest.new_records, profiler.as_dict()
+
+# Function to delete the outputs the manifest of a category records for another mesh, parameters or variant count
+def prune_category(mesh_path, category_name, options, shard_index=None):
+    manifest = Manifest(manifest_path(category_name, shard_index))
+    removed = manifest.prune(mesh_file_hash(mesh_path, uses_mesh_cache(options)), output_params_hashes(options), num_variants)
+    manifest.save()
+    return removed
 
-        # Process the set of files for this category
-        process_mesh_variants(mesh_path, category_name)
-        counter = counter + 1
-        print(f"========================================= {counter}/ 83 ==============================================")
+# Main function to process all meshes
+def main(num_workers=1, unit_size=variants_per_unit, options=None, prune=False, progress=False, report_path=None,
+         num_shards=1, shard_index=0):
+    """
+    Per-stage wall time, throughput, bytes written and peak memory of the run
+    are written as JSON to report_path (a timestamped file in report_dir by
+    default). progress draws a single status line instead of per-mesh banners.
+
+    With num_shards > 1 only the work units of shard shard_index are
+    generated: every node lists the same sorted units and balances them by
+    mesh face count in the same way, so the shards are disjoint and together
+    cover the dataset. Each shard writes its own manifests, combined
+    afterwards with merge_shard_manifests (--merge-shards with the same
+    --num-shards). Packed shards of a changed shape are not replaced by the
+    nodes, they are reallocated once beforehand with --allocate-shards.
+
+    The catalog rows of the processed categories are rewritten from their
+    manifests at the end of the run.
+    """
+    options = resolve_options(options)
+    profiler = StageProfiler()
+    mesh_files = list_mesh_files()
+    report_path = report_path or os.path.join(report_dir, f"run_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    sharded = num_shards > 1
+    manifest_shard = shard_index if sharded else None
+
+    # Fill the mesh cache up front so workers never parse the same .ply concurrently
+    if uses_mesh_cache(options):
+        with profiler.stage("mesh_cache"):
+            for mesh_file in mesh_files:
+                load_source_mesh(os.path.join(meshes_dir, mesh_file), options)
+
+    # Units are ordered mesh by mesh, so each worker mostly sees the mesh it already loaded
+    units = shard_units(make_work_units(mesh_files, unit_size), num_shards, shard_index, use_mesh_cache=uses_mesh_cache(options))
+    unit_categories = sorted({category_name for _, category_name, _, _ in units})
+
+    if prune:
+        with profiler.stage("prune"):
+            for category_name in unit_categories:
+                removed = prune_category(os.path.join(meshes_dir, f"{category_name}.ply"), category_name, options, manifest_shard)
+                print(f"Pruned {len(removed)} stale files of {category_name}")
+
+    # Shards are allocated up front so workers only ever write into existing rows
+    if options["output_format"] == "packed":
+        with profiler.stage("allocate_shards"):
+            for category_name in unit_categories:
+                ensure_packed_shards(category_name, options, replace=not sharded)
+
+    progress_line = ProgressLine(sum(stop - start for _, _, start, stop in units), enabled=progress)
+    if num_workers <= 1 and not sharded:
+        for counter, mesh_file in enumerate(mesh_files, start=1):
+            category_name = mesh_file.replace(".ply", "")
+            mesh_path = os.path.join(meshes_dir, mesh_file)
+
+            # Process the set of files for this category
+            process_mesh_variants(mesh_path, category_name, options=options, profiler=profiler, progress=progress_line)
+            if not progress:
+                print(f"========================================= {counter}/ {len(mesh_files)} ==============================================")
+    else:
+        manifests = {}
+        run_unit = functools.partial(process_work_unit, options=options, shard_index=manifest_shard)
+        with (Pool(num_workers) if num_workers > 1 else contextlib.nullcontext()) as pool:
+            results = pool.imap_unordered(run_unit, units) if pool is not None else map(run_unit, units)
+            for counter, ((_, category_name, start, stop), records, totals) in enumerate(results, start=1):
+                if category_name not in manifests:
+                    manifests[category_name] = Manifest(manifest_path(category_name, manifest_shard))
+                for variant_id, output, entry in records:
+                    for path in manifests[category_name].add_entry(variant_id, output, entry):
+                        if os.path.exists(path):
+                            os.remove(path)
+                with profiler.stage("manifest"):
+                    manifests[category_name].save()
+                profiler.merge(totals)
+                progress_line.update(profiler.variants)
+                if not progress:
+                    print(f"=========== unit {counter}/{len(units)}: {category_name} variants {start}-{stop - 1} done ===========")
+    progress_line.close(profiler.variants)
+
+    # Shards only see part of the variants; their catalog is written after --merge-shards
+    if not sharded:
+        with profiler.stage("catalog"):
+            update_catalog(unit_categories, options)
+
+    # Stage seconds of pool workers add up across processes, so they can exceed the wall time
+    profiler.write_report(report_path, options=options, num_workers=num_workers, num_meshes=len(mesh_files),
+                          num_shards=num_shards, shard_index=shard_index, num_units=len(units))
+    totals = profiler.as_dict()
+    print(f"Generated {totals['variants']} variants in {totals['wall_seconds']:.1f}s "
+          f"({totals['variants_per_second']:.1f} variants/s), report written to {report_path}")
+    return totals
 
 if __name__ == "__main__":
-    main()
-
-
+    parser = argparse.ArgumentParser(description="Generate rotated YCB variants")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes")
+    parser.add_argument("--unit-size", type=int, default=variants_per_unit, help="variants per work unit")
+    parser.add_argument("--output-format", choices=["files", "packed"], default=default_options["output_format"],
+                        help="loose files per variant or packed per-category shards")
+    parser.add_argument("--occupancy-format", choices=occupancy_formats, default=default_options["occupancy_format"],
+                        help="dense .npy grids, bit-packed (optionally compressed) grids, or sparse column intervals; "
+                             "sparse grids loaded at another resolution are exact along z only, nearest-neighbour in x and y")
+    parser.add_argument("--voxel-resolution", type=int, default=default_options["voxel_resolution"],
+                        help="resolution of the occupancy grids")
+    parser.add_argument("--sampler", choices=["cached", "trimesh"], default=default_options["sampler"],
+                        help="batched cached surface sampler or per-variant trimesh sampling")
+    parser.add_argument("--voxelizer", choices=["parity", "trimesh"], default=default_options["voxelizer"],
+                        help="fixed-grid parity voxelizer or mesh.voxelized + binary_fill_holes")
+    parser.add_argument("--writer-threads", type=int, default=default_options["writer_threads"],
+                        help="background threads saving finished variants (0 saves inline)")
+    parser.add_argument("--binary-sidecar", action="store_true", help="also write float32 .xyzb sidecars")
+    parser.add_argument("--mesh-lod", action="store_true", help="generate from the coarsest cached decimated mesh that is accurate enough")
+    parser.add_argument("--no-mesh-cache", action="store_true", help="parse the .ply files and leave the mesh cache directory untouched (--mesh-lod still uses it)")
+    parser.add_argument("--no-resume", action="store_true", help="regenerate outputs the manifest records as complete")
+    parser.add_argument("--prune", action="store_true", help="delete outputs recorded for other meshes or parameters first")
+    parser.add_argument("--partial", choices=["half_space", "depth"], default=default_options["partial"],
+                        help="partial clouds from the surface below the cutting plane or the surface visible to a depth camera")
+    parser.add_argument("--point-sampling", choices=["uniform", "fps"], default=default_options["point_sampling"],
+                        help="uniform surface samples or farthest-point thinning of oversampled clouds")
+    parser.add_argument("--query-points", type=int, default=default_options["query_points"],
+                        help="labeled occupancy query points written per variant (0 writes none)")
+    parser.add_argument("--query-sdf", action="store_true", help="also store the signed distance of the query points")
+    parser.add_argument("--num-shards", type=int, default=1, help="split the work units into this many shards (one per node)")
+    parser.add_argument("--shard-index", type=int, default=0, help="shard generated by this node, in [0, num-shards)")
+    parser.add_argument("--merge-shards", action="store_true", help="only merge the per-shard manifests into the dataset manifests")
+    parser.add_argument("--allocate-shards", action="store_true",
+                        help="only allocate the packed shards of every category, run once before a multi-node packed run")
+    parser.add_argument("--progress", action="store_true", help="show a single progress line instead of per-mesh banners")
+    parser.add_argument("--report", default=None, help="path of the JSON run report (default: a timestamped file in the reports directory)")
+    args = parser.parse_args()
+    options = {
+        "sampler": args.sampler,
+        "voxelizer": args.voxelizer,
+        "writer_threads": args.writer_threads,
+        "binary_sidecar": args.binary_sidecar,
+        "output_format": args.output_format,
+        "occupancy_format": args.occupancy_format,
+        "mesh_cache": not args.no_mesh_cache,
+        "mesh_lod": args.mesh_lod,
+        "resume": not args.no_resume,
+        "partial": args.partial,
+        "query_points": args.query_points,
+        "point_sampling": args.point_sampling,
+        "query_sdf": args.query_sdf,
+        "voxel_resolution": args.voxel_resolution,
+    }
+    if args.allocate_shards:
+        for mesh_file in list_mesh_files():
+            ensure_packed_shards(mesh_file.replace(".ply", ""), resolve_options(options))
+    elif args.merge_shards:
+        if args.num_shards < 2:
+            parser.error("--merge-shards needs the --num-shards of the run")
+        merged = merge_shard_manifests(manifest_dir, args.num_shards)
+        for category_name, conflicts in merged.items():
+            print(f"Merged the shard manifests of {category_name} ({conflicts} conflicting records)")
+        update_catalog(sorted(merged), resolve_options(options))
+    else:
+        main(num_workers=args.workers, unit_size=args.unit_size, options=options, prune=args.prune, progress=args.progress,
+             report_path=args.report, num_shards=args.num_shards, shard_index=args.shard_index)
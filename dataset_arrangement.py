@@ -14,7 +14,7 @@ os.makedirs(input_dir, exist_ok=True)
 # Get all partial point cloud files from the partial_pcs folder
 partial_files = [f for f in os.listdir(partial_pcs_dir) if f.endswith(".xyz")]
 
-# Create folders for each partial point cloud in both 'gt' and 'input'
+# Create folders for each partial point cloud in both 'gt' and 'input' (pipeline.py creates them as it writes)
 for partial_file in partial_files:
     partial_name = partial_file.replace(".xyz", "")
 
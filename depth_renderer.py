@@ -0,0 +1,247 @@
+import time
+import numpy as np
+
+# Square depth images of this many pixels per side
+image_size = 128
+
+# Full horizontal and vertical field of view of the pinhole cameras in degrees
+field_of_view = 60.0
+
+# Triangles with a vertex closer to the camera than this are not rasterized
+near_plane = 1e-3
+
+# Upper bound on the number of (triangle, pixel) candidates rasterized at once
+max_fragment_block = 1 << 22
+
+# Upper bound on batch * faces triangles transformed into camera space at once
+max_triangle_block = 1 << 20
+
+
+# Function to build world-to-camera rotations of cameras at the given positions looking at a target
+def look_at(positions, target=(0.0, 0.0, 0.0), up=(0.0, 0.0, 1.0)):
+    """
+    Camera frames have x to the right, y down and z along the viewing
+    direction, so depth is the camera-space z. Cameras looking along the up
+    vector use the y axis as up instead.
+    """
+    positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+    forward = np.asarray(target, dtype=np.float64) - positions
+    forward /= np.linalg.norm(forward, axis=1, keepdims=True)
+    ups = np.broadcast_to(np.asarray(up, dtype=np.float64), positions.shape).copy()
+    right = np.cross(forward, ups)
+    parallel = np.linalg.norm(right, axis=1) < 1e-6
+    right[parallel] = np.cross(forward[parallel], [0.0, 1.0, 0.0])
+    right /= np.linalg.norm(right, axis=1, keepdims=True)
+    down = np.cross(forward, right)
+    return np.stack([right, down, forward], axis=1)
+
+
+# Function to get the focal length in pixels of a square image
+def focal_length(size=image_size, fov=field_of_view):
+    return (size / 2.0) / np.tan(np.deg2rad(fov) / 2.0)
+
+
+# Function to bring vertices (V, 3) or per-camera vertices (B, V, 3) into the frames of B cameras
+def camera_vertices(vertices, rotations, positions):
+    vertices = np.asarray(vertices, dtype=np.float64)
+    if vertices.ndim == 2:
+        return np.einsum("bij,bvj->bvi", rotations, vertices[None] - positions[:, None])
+    return np.einsum("bij,bvj->bvi", rotations, vertices - positions[:, None])
+
+
+# Function to rasterize camera-space triangles into a shared depth and face buffer
+def rasterize(triangles, camera_index, face_index, depth, faces_hit, size, focal):
+    """
+    triangles are (T, 3, 3) in camera space, camera_index and face_index say
+    which image and face each one belongs to. depth and faces_hit are the
+    flattened (B * size * size) buffers and are updated in place, keeping the
+    nearest fragment of every pixel.
+    """
+    keep = triangles[:, :, 2].min(axis=1) > near_plane
+    triangles, camera_index, face_index = triangles[keep], camera_index[keep], face_index[keep]
+
+    # Pixel coordinates of the vertices; pixel (i, j) has its centre at (i + 0.5, j + 0.5)
+    inverse_z = 1.0 / triangles[:, :, 2]
+    u = focal * triangles[:, :, 0] * inverse_z + size / 2.0
+    v = focal * triangles[:, :, 1] * inverse_z + size / 2.0
+    area = (u[:, 1] - u[:, 0]) * (v[:, 2] - v[:, 0]) - (u[:, 2] - u[:, 0]) * (v[:, 1] - v[:, 0])
+
+    # Pixel centres inside the bounding box of every triangle
+    x0 = np.clip(np.ceil(u.min(axis=1) - 0.5), 0, size).astype(np.int64)
+    x1 = np.clip(np.floor(u.max(axis=1) - 0.5), -1, size - 1).astype(np.int64)
+    y0 = np.clip(np.ceil(v.min(axis=1) - 0.5), 0, size).astype(np.int64)
+    y1 = np.clip(np.floor(v.max(axis=1) - 0.5), -1, size - 1).astype(np.int64)
+    widths = np.maximum(x1 - x0 + 1, 0)
+    counts = widths * np.maximum(y1 - y0 + 1, 0) * (area != 0)
+
+    # Rasterize blocks of triangles whose candidate pixels fit in max_fragment_block
+    ends = np.cumsum(counts)
+    start = 0
+    while start < len(counts):
+        stop = max(start + 1, int(np.searchsorted(ends, ends[start] - counts[start] + max_fragment_block, side="right")))
+        block = np.arange(start, stop)
+        start = stop
+        if counts[block].sum() == 0:
+            continue
+        t = np.repeat(block, counts[block])
+        local = np.arange(len(t)) - np.repeat(np.cumsum(counts[block]) - counts[block], counts[block])
+        px = x0[t] + local % widths[t]
+        py = y0[t] + local // widths[t]
+
+        # Barycentric coordinates of the pixel centres from the edge functions
+        cx = px + 0.5
+        cy = py + 0.5
+        w1 = ((cx - u[t, 0]) * (v[t, 2] - v[t, 0]) - (u[t, 2] - u[t, 0]) * (cy - v[t, 0])) / area[t]
+        w2 = ((u[t, 1] - u[t, 0]) * (cy - v[t, 0]) - (cx - u[t, 0]) * (v[t, 1] - v[t, 0])) / area[t]
+        w0 = 1.0 - w1 - w2
+        inside = (w0 >= 0) & (w1 >= 0) & (w2 >= 0)
+        t, px, py = t[inside], px[inside], py[inside]
+
+        # 1 / z is affine in screen space, so it is interpolated with the screen barycentrics
+        fragment_depth = 1.0 / (w0[inside] * inverse_z[t, 0] + w1[inside] * inverse_z[t, 1] + w2[inside] * inverse_z[t, 2])
+        pixel = camera_index[t] * size * size + py * size + px
+
+        # Nearest fragment per pixel within the block, then against the buffer
+        order = np.lexsort((fragment_depth, pixel))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = pixel[order[1:]] != pixel[order[:-1]]
+        order = order[first]
+        nearer = fragment_depth[order] < depth[pixel[order]]
+        order = order[nearer]
+        depth[pixel[order]] = fragment_depth[order]
+        faces_hit[pixel[order]] = face_index[t[order]]
+
+
+# Function to render depth images of a mesh from B cameras
+def render_depth(vertices, faces, rotations, positions, size=image_size, fov=field_of_view):
+    """
+    vertices are (V, 3), shared by all cameras, or (B, V, 3) with one mapped
+    copy of the mesh per camera. Returns the (B, size, size) depth images,
+    inf where nothing is hit, and the index of the visible face of every
+    pixel, -1 where nothing is hit.
+    """
+    rotations = np.asarray(rotations, dtype=np.float64).reshape(-1, 3, 3)
+    positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+    vertices = np.asarray(vertices, dtype=np.float64)
+    faces = np.asarray(faces, dtype=np.int64)
+    num_cameras = len(rotations)
+    focal = focal_length(size, fov)
+
+    depth = np.full(num_cameras * size * size, np.inf)
+    faces_hit = np.full(num_cameras * size * size, -1, dtype=np.int64)
+    step = max(1, max_triangle_block // max(1, len(faces)))
+    for start in range(0, num_cameras, step):
+        cameras = np.arange(start, min(start + step, num_cameras))
+        mesh_vertices = vertices if vertices.ndim == 2 else vertices[cameras]
+        triangles = camera_vertices(mesh_vertices, rotations[cameras], positions[cameras])[:, faces]
+        rasterize(triangles.reshape(-1, 3, 3), np.repeat(cameras, len(faces)), np.tile(np.arange(len(faces)), len(cameras)),
+                  depth, faces_hit, size, focal)
+    return depth.reshape(num_cameras, size, size), faces_hit.reshape(num_cameras, size, size)
+
+
+# Function to back-project every hit pixel of depth images to world points
+def depth_to_points(depth, rotations, positions, fov=field_of_view):
+    size = depth.shape[-1]
+    focal = focal_length(size, fov)
+    rows, columns = np.mgrid[0:size, 0:size] + 0.5
+    rays = np.stack([(columns - size / 2.0) / focal, (rows - size / 2.0) / focal, np.ones_like(rows)], axis=-1)
+    clouds = []
+    for b in range(len(depth)):
+        hit = np.isfinite(depth[b])
+        camera_points = rays[hit] * depth[b][hit][:, None]
+        clouds.append(camera_points @ rotations[b] + positions[b])
+    return clouds
+
+
+# Function to sample count visible surface points per camera
+def sample_visible(vertices, faces, rotations, positions, count, rngs, size=image_size, fov=field_of_view):
+    """
+    Points are spread uniformly over the image area the object covers, like
+    the returns of a depth sensor: a hit pixel is drawn, then a random position
+    inside it, and its ray is intersected with the plane of the face visible
+    in that pixel. This gives exactly count points at any image size.
+    """
+    rotations = np.asarray(rotations, dtype=np.float64).reshape(-1, 3, 3)
+    positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+    vertices = np.asarray(vertices, dtype=np.float64)
+    faces = np.asarray(faces, dtype=np.int64)
+    focal = focal_length(size, fov)
+    _, faces_hit = render_depth(vertices, faces, rotations, positions, size, fov)
+
+    points = np.empty((len(rotations), count, 3))
+    for b, rng in enumerate(rngs):
+        hit = np.flatnonzero(faces_hit[b] >= 0)
+        if len(hit) == 0:
+            raise ValueError("the mesh is not visible from the camera")
+        pixel = hit[rng.integers(len(hit), size=count)]
+        mesh_vertices = vertices if vertices.ndim == 2 else vertices[b]
+        triangles = (mesh_vertices[faces[faces_hit[b].reshape(-1)[pixel]]] - positions[b]) @ rotations[b].T
+
+        camera_points = face_intersections(triangles, pixel, rng.random((count, 2)), size, focal)
+        points[b] = camera_points @ rotations[b] + positions[b]
+    return points
+
+
+# Function to intersect the rays through positions inside pixels with the planes of camera-space triangles
+def face_intersections(triangles, pixel, offsets, size, focal):
+    """
+    Faces are often no larger than a pixel, so a ray can pass next to the face
+    seen at the pixel centre; such intersections are moved to the nearest
+    point of the face (barycentrics clamped), which keeps every point on the
+    visible surface.
+    """
+    rays = np.stack([(pixel % size + offsets[:, 0] - size / 2.0) / focal,
+                     (pixel // size + offsets[:, 1] - size / 2.0) / focal, np.ones(len(pixel))], axis=1)
+    edges = triangles[:, 1:] - triangles[:, :1]
+    normals = np.cross(edges[:, 0], edges[:, 1])
+    squared_area = np.einsum("ni,ni->n", normals, normals)
+    weights = np.empty((len(pixel), 3))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scale = np.einsum("ni,ni->n", normals, triangles[:, 0]) / np.einsum("ni,ni->n", normals, rays)
+        relative = rays * scale[:, None] - triangles[:, 0]
+
+        # Barycentric coordinates of the intersections, clamped to the triangle
+        weights[:, 1] = np.einsum("ni,ni->n", np.cross(relative, edges[:, 1]), normals) / squared_area
+        weights[:, 2] = np.einsum("ni,ni->n", np.cross(edges[:, 0], relative), normals) / squared_area
+    weights[:, 0] = 1.0 - weights[:, 1] - weights[:, 2]
+    weights = np.clip(np.nan_to_num(weights, nan=1.0 / 3.0, posinf=1.0, neginf=0.0), 0.0, None)
+    weights /= weights.sum(axis=1, keepdims=True)
+    return np.einsum("nk,nki->ni", weights, triangles)
+
+
+# Function to time depth-rendered partial clouds against the half-space sampler on a synthetic mesh
+def benchmark(num_variants=100, num_points=2048, subdivisions=4, batch_size=25):
+    import trimesh
+    from scipy.spatial.transform import Rotation as R
+    from surface_sampler import SurfaceSampler
+
+    mesh = trimesh.creation.icosphere(subdivisions)
+    sampler = SurfaceSampler.from_mesh(mesh)
+    rotations = R.random(num_variants, random_state=0).as_matrix()
+    linear, offset = sampler.cubic_normalization(rotations)
+    rngs = [np.random.default_rng(i) for i in range(num_variants)]
+    camera_position = np.array([[0.0, 0.0, -2.0]])
+    camera_rotation = look_at(camera_position)
+
+    timings = {}
+    start = time.perf_counter()
+    for b in range(0, num_variants, batch_size):
+        sampler.sample_half_space(linear[b:b + batch_size], offset[b:b + batch_size], num_points, rngs[b:b + batch_size])
+    timings["half_space"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for b in range(0, num_variants, batch_size):
+        batch = slice(b, b + batch_size)
+        mapped = np.einsum("bij,vj->bvi", linear[batch], sampler.vertices) + offset[batch, None]
+        count = len(mapped)
+        sample_visible(mapped, sampler.faces, np.repeat(camera_rotation, count, axis=0),
+                       np.repeat(camera_position, count, axis=0), num_points, rngs[batch])
+    timings["depth"] = time.perf_counter() - start
+
+    for name, seconds in timings.items():
+        print(f"{name:>10}: {num_variants / seconds:8.1f} variants/s ({len(mesh.faces)} faces, {num_points} points)")
+    return timings
+
+
+if __name__ == "__main__":
+    benchmark()
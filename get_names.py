@@ -1,17 +1,31 @@
 import os
+from catalog import Catalog, catalog_name
 
 # Define the base directories
 ycb_grasp_dataset_dir = "/home/haoming/Downloads/ycb_grasp_dataset"
 input_dir = os.path.join(ycb_grasp_dataset_dir, "input")
 gt_dir = os.path.join(ycb_grasp_dataset_dir, "gt")
+catalog_path = os.path.join(ycb_grasp_dataset_dir, catalog_name)
 
 # Function to get a list of folder names
 def get_folder_names(base_dir):
     folder_names = [f for f in os.listdir(base_dir) if os.path.isdir(os.path.join(base_dir, f))]
     return folder_names
 
+# Function to get the category names and their variant counts per split from the catalog
+def get_catalog_names(path=catalog_path):
+    with Catalog(path) as catalog:
+        return catalog.split_counts()
+
 # Get folder names from input and gt directories
 def main():
+    if os.path.exists(catalog_path):
+        counts = get_catalog_names()
+        for category, splits in counts.items():
+            print(f"{category}: {splits.get('train', 0)} train, {splits.get('test', 0)} test")
+        print(len(counts))
+        return
+
     input_folder_names = get_folder_names(input_dir)
     gt_folder_names = get_folder_names(gt_dir)
 
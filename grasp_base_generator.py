@@ -1,8 +1,18 @@
 import os
+import time
+import zlib
 import numpy as np
 import trimesh
-import scipy.ndimage
 from scipy.spatial.transform import Rotation as R
+from shard_io import create_shard, shard_dir, open_shard, write_shard_rows, flush_shard
+from occupancy_io import save_occupancy
+from async_writer import AsyncWriter
+from pointcloud_io import save_xyz as write_xyz
+from mesh_cache import load_mesh as load_cached_mesh
+from profiling import StageProfiler, ProgressLine
+from surface_sampler import sample_half_space
+from mesh_normalization import normalize_mesh as normalize_mesh_vertices
+from grid_transform import rotate_grids, rotation_bounds_grid, normalized_cube_grid
 
 # Define the directories
 base_dir = "/home/haoming/Downloads/ycb_meshes/grasp_database"
@@ -11,12 +21,8 @@ complete_output_dir = os.path.join(output_dir, "complete_pcs")
 partial_output_dir = os.path.join(output_dir, "partial_pcs")
 occupancy_output_dir = os.path.join(output_dir, "occupancy_grids")
 variant_output_dir = os.path.join(output_dir, "variants")
-
-# Create output directories if they don't exist
-os.makedirs(complete_output_dir, exist_ok=True)
-os.makedirs(partial_output_dir, exist_ok=True)
-os.makedirs(occupancy_output_dir, exist_ok=True)
-os.makedirs(variant_output_dir, exist_ok=True)
+packed_variant_dir = os.path.join(output_dir, "packed_variants")
+report_dir = os.path.join(output_dir, "reports")
 
 # Number of points for complete and partial point clouds
 num_complete_points = 8192
@@ -24,102 +30,190 @@ num_partial_points = 2048
 num_variants = 700
 voxel_resolution = 32
 
-# Function to normalize the mesh vertices to range [-0.5, 0.5]
-def normalize_mesh_vertices(mesh):
-    min_bounds = mesh.bounds[0]
-    max_bounds = mesh.bounds[1]
-    center = (min_bounds + max_bounds) / 2.0
-    mesh.vertices -= center
-    scale = np.max(max_bounds - min_bounds)
-    mesh.vertices /= scale
+# "files" writes three files per variant, "packed" writes one shard per mesh
+default_output_format = "files"
+
+# Occupancy storage: "dense", "packed" or "packed_compressed"
+occupancy_format = "dense"
+
+# Threads saving variants in the background (0 saves inline)
+writer_threads = 4
+
+# Also write a float32 .xyzb sidecar next to every .xyz file
+binary_sidecar = False
+
+# Base seed; the base clouds of a mesh and the rotation of every variant derive their own random streams from it
+base_seed = 0
+
+# Variants rotated together and handed to the writer as one block
+variant_block_size = 50
 
-# Function to load a PLY file as a trimesh object
+# Rotated grids are voxel_resolution^3 grids of the normalized cube [-0.5, 0.5]^3, like the grids of
+# data_augmentation; voxels a rotation moves outside the cube are cropped. With pad_rotated_grids they
+# are kept in the larger origin-centred cube that holds the grid under any rotation instead
+pad_rotated_grids = False
+
+# Function to load a PLY file as a trimesh object through the preprocessed mesh cache
 def load_mesh(mesh_path):
-    return trimesh.load(mesh_path)
+    return load_cached_mesh(mesh_path)
+
+# Function to get the seed sequence of a mesh, or of one variant of it
+def seed_sequence(mesh_name, *variant_id):
+    return np.random.SeedSequence([base_seed, zlib.crc32(mesh_name.encode()), *variant_id])
 
 # Function to generate complete and partial point clouds
-def generate_point_clouds(mesh):
-    sampled_points, _ = trimesh.sample.sample_surface(mesh, num_complete_points)
-    partial_points = sampled_points[sampled_points[:, 2] < 0]
-    if len(partial_points) < num_partial_points:
-        return sampled_points, partial_points
-    else:
-        partial_indices = np.random.choice(len(partial_points), num_partial_points, replace=False)
-        return sampled_points, partial_points[partial_indices]
-
-# Function to create the occupancy grid
+def generate_point_clouds(mesh, mesh_name):
+    complete_rng, partial_rng = (np.random.default_rng(child) for child in seed_sequence(mesh_name).spawn(2))
+    sampled_points, _ = trimesh.sample.sample_surface(mesh, num_complete_points, seed=complete_rng)
+    # The partial cloud is drawn from the surface clipped to the bottom half (z < 0), so it always has num_partial_points points
+    partial_points = sample_half_space(mesh.triangles, num_partial_points, partial_rng)
+    return sampled_points, partial_points
+
+# Function to create the occupancy grid and its voxel index to world transform
 def generate_occupancy_grid(mesh):
     voxelized_mesh = mesh.voxelized(pitch=1.0 / voxel_resolution)
-    return voxelized_mesh.matrix.astype(int)
+    return voxelized_mesh.matrix.astype(int), voxelized_mesh.transform
 
 # Function to save point clouds and occupancy grids
 def save_xyz(file_path, points):
-    np.savetxt(file_path, points, fmt='%.6f')
+    write_xyz(points, file_path, binary_sidecar)
+    return file_path
 
 def save_occupancy_grid(file_path, occupancy_grid):
-    np.save(file_path, occupancy_grid)
-
-# Function to generate a random 3D rotation matrix
-def random_rotation_matrix():
-    return R.random().as_matrix()
-
-# Function to apply rotation to the point clouds and occupancy grid
-def apply_rotation(points, rotation_matrix):
-    return points @ rotation_matrix.T
+    return save_occupancy(file_path, occupancy_grid, occupancy_format)
+
+# Function to wrap a save function so its time and the size of the written file are profiled
+def profiled_save(profiler, save_function):
+    def run(*args):
+        with profiler.stage("save"):
+            path = save_function(*args)
+        profiler.add_bytes(os.path.getsize(path))
+    return run
+
+# Function to generate the random 3D rotation matrices of some variants, each from its own seeded stream
+def random_rotation_matrices(mesh_name, variant_ids):
+    return np.stack([R.random(random_state=np.random.default_rng(seed_sequence(mesh_name, i))).as_matrix() for i in variant_ids])
+
+# Function to rotate one point cloud by a batch of rotations, giving (B, N, 3) clouds
+def apply_rotations(points, rotation_matrices):
+    return np.einsum("nj,bij->bni", points, rotation_matrices)
+
+# Function to get the shape and transform of the rotated grids, the same for every variant of a mesh
+def rotated_grid_frame(shape, transform):
+    if pad_rotated_grids:
+        return rotation_bounds_grid(shape, transform)
+    return normalized_cube_grid(voxel_resolution)
+
+# Rotated grids are resampled into the rotated grid frame, so they stay aligned with the rotated point clouds
+def apply_rotation_to_occupancy_grids(grid, rotation_matrices, transform):
+    rotated_shape, rotated_transform = rotated_grid_frame(grid.shape, transform)
+    return rotate_grids(grid, rotation_matrices, transform, rotated_shape, rotated_transform)
+
+# Function to save a block of variants to their files, run as one writer job
+def save_variant_block(profiler, mesh_name, start, rotated_complete_points, rotated_partial_points, rotated_occupancy_grids):
+    for offset in range(len(rotated_complete_points)):
+        i = start + offset
+        variant_complete_file = os.path.join(variant_output_dir, f"{mesh_name}_complete_variant_{i}.xyz")
+        variant_partial_file = os.path.join(variant_output_dir, f"{mesh_name}_partial_variant_{i}.xyz")
+        variant_occupancy_file = os.path.join(variant_output_dir, f"{mesh_name}_occupancy_variant_{i}.npy")
 
-def apply_rotation_to_occupancy_grid(grid, rotation_matrix):
-    rotated_grid = scipy.ndimage.rotate(grid, angle=np.rad2deg(np.arccos(rotation_matrix[0, 0])), axes=(0, 1), reshape=False)
-    return rotated_grid
+        profiled_save(profiler, save_xyz)(variant_complete_file, rotated_complete_points[offset])
+        profiled_save(profiler, save_xyz)(variant_partial_file, rotated_partial_points[offset])
+        profiled_save(profiler, save_occupancy_grid)(variant_occupancy_file, rotated_occupancy_grids[offset])
 
 # Function to process each mesh and generate its variants
-def process_mesh(mesh_name, mesh_path):
+def process_mesh(mesh_name, mesh_path, output_format=None, profiler=None, progress=None):
+    output_format = output_format or default_output_format
+    profiler = profiler or StageProfiler()
+
     # Load and normalize the mesh
-    mesh = load_mesh(mesh_path)
-    normalize_mesh_vertices(mesh)
+    with profiler.stage("load"):
+        mesh = load_mesh(mesh_path)
+    with profiler.stage("normalize"):
+        normalize_mesh_vertices(mesh)
 
     # Generate complete and partial point clouds
-    complete_points, partial_points = generate_point_clouds(mesh)
+    with profiler.stage("sampling"):
+        complete_points, partial_points = generate_point_clouds(mesh, mesh_name)
 
     # Generate occupancy grid
-    occupancy_grid = generate_occupancy_grid(mesh)
+    with profiler.stage("voxelization"):
+        occupancy_grid, grid_transform = generate_occupancy_grid(mesh)
 
     # Save the original point clouds and occupancy grid
     complete_file = os.path.join(complete_output_dir, f"{mesh_name}_complete.xyz")
     partial_file = os.path.join(partial_output_dir, f"{mesh_name}_partial.xyz")
     occupancy_file = os.path.join(occupancy_output_dir, f"{mesh_name}_occupancy.npy")
 
-    save_xyz(complete_file, complete_points)
-    save_xyz(partial_file, partial_points)
-    save_occupancy_grid(occupancy_file, occupancy_grid)
-
-    # Generate variants
-    for i in range(num_variants):
-        rotation_matrix = random_rotation_matrix()
-
-        rotated_complete_points = apply_rotation(complete_points, rotation_matrix)
-        rotated_partial_points = apply_rotation(partial_points, rotation_matrix)
-        rotated_occupancy_grid = apply_rotation_to_occupancy_grid(occupancy_grid, rotation_matrix)
-
-        variant_complete_file = os.path.join(variant_output_dir, f"{mesh_name}_complete_variant_{i}.xyz")
-        variant_partial_file = os.path.join(variant_output_dir, f"{mesh_name}_partial_variant_{i}.xyz")
-        variant_occupancy_file = os.path.join(variant_output_dir, f"{mesh_name}_occupancy_variant_{i}.npy")
-
-        save_xyz(variant_complete_file, rotated_complete_points)
-        save_xyz(variant_partial_file, rotated_partial_points)
-        save_occupancy_grid(variant_occupancy_file, rotated_occupancy_grid)
-
-        print(f"Created variant {i+1} for {mesh_name}")
+    profiled_save(profiler, save_xyz)(complete_file, complete_points)
+    profiled_save(profiler, save_xyz)(partial_file, partial_points)
+    profiled_save(profiler, save_occupancy_grid)(occupancy_file, occupancy_grid)
+
+    # All variants of a mesh share the shapes of the base clouds and grid, so they fit one shard
+    if output_format == "packed":
+        variant_shard_dir = shard_dir(packed_variant_dir, mesh_name, "variants")
+        rotated_grid_shape, _ = rotated_grid_frame(occupancy_grid.shape, grid_transform)
+        create_shard(variant_shard_dir, num_variants, partial_points.shape, complete_points.shape, rotated_grid_shape,
+                     packed_occupancy=occupancy_format != "dense")
+        shard = open_shard(variant_shard_dir, mode="r+")
+
+    # Every variant rotates the same base clouds and grid, so all rotations are drawn at once and a
+    # block of variants is rotated with one einsum and handed to the writer as a single job
+    rotation_matrices = random_rotation_matrices(mesh_name, range(num_variants))
+
+    # Generate blocks while the writer saves the previous ones; leaving the block waits for all writes
+    with AsyncWriter(writer_threads, max_pending=max(1, writer_threads)) as writer:
+        for start in range(0, num_variants, variant_block_size):
+            block_rotations = rotation_matrices[start:start + variant_block_size]
+            with profiler.stage("rotation"):
+                rotated_complete_points = apply_rotations(complete_points, block_rotations)
+                rotated_partial_points = apply_rotations(partial_points, block_rotations)
+                rotated_occupancy_grids = apply_rotation_to_occupancy_grids(occupancy_grid, block_rotations, grid_transform)
+
+            profiler.add_variants(len(block_rotations))
+            if progress is not None:
+                progress.update(profiler.variants)
+
+            if output_format == "packed":
+                writer.submit(profiler.timed("save", write_shard_rows), shard, start, np.arange(start, start + len(block_rotations)),
+                              block_rotations, rotated_partial_points, rotated_complete_points, rotated_occupancy_grids)
+            else:
+                writer.submit(save_variant_block, profiler, mesh_name, start, rotated_complete_points, rotated_partial_points,
+                              rotated_occupancy_grids)
+
+    if output_format == "packed":
+        flush_shard(shard)
+        profiler.add_bytes(sum(array.nbytes for array in shard.values() if isinstance(array, np.ndarray)))
+    return profiler
+
+# Function to create the output directories if they don't exist
+def create_output_dirs():
+    for directory in (complete_output_dir, partial_output_dir, occupancy_output_dir, variant_output_dir):
+        os.makedirs(directory, exist_ok=True)
 
 # Function to process all meshes in the dataset
-def process_dataset():
-    # Loop through each folder in the grasp_database
-    for folder in os.listdir(base_dir):
-        mesh_folder = os.path.join(base_dir, folder, "meshes")
-        if os.path.isdir(mesh_folder):
-            mesh_file = os.path.join(mesh_folder, f"{folder}_scaled.ply")
-            if os.path.isfile(mesh_file):
-                print(f"Processing mesh {folder}")
-                process_mesh(folder, mesh_file)
+def process_dataset(progress=False, report_path=None):
+    create_output_dirs()
+    profiler = StageProfiler()
+    report_path = report_path or os.path.join(report_dir, f"run_{time.strftime('%Y%m%d_%H%M%S')}.json")
+
+    # Collect the meshes in each folder of the grasp_database
+    mesh_files = []
+    for folder in sorted(os.listdir(base_dir)):
+        mesh_file = os.path.join(base_dir, folder, "meshes", f"{folder}_scaled.ply")
+        if os.path.isfile(mesh_file):
+            mesh_files.append((folder, mesh_file))
+
+    progress_line = ProgressLine(len(mesh_files) * num_variants, enabled=progress)
+    for folder, mesh_file in mesh_files:
+        if not progress:
+            print(f"Processing mesh {folder}")
+        process_mesh(folder, mesh_file, profiler=profiler, progress=progress_line)
+    progress_line.close(profiler.variants)
+
+    profiler.write_report(report_path, output_format=default_output_format, occupancy_format=occupancy_format,
+                          writer_threads=writer_threads, num_meshes=len(mesh_files))
+    return profiler.as_dict()
 
 # Run the processing
 if __name__ == "__main__":
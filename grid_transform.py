@@ -0,0 +1,107 @@
+import numpy as np
+from voxelizer import grid_min, grid_size
+
+# Upper bound on batch * voxels sampled at once
+max_point_block = 1 << 22
+
+
+# Function to get the shape and transform of the smallest origin-centred cube holding every rotation of a grid
+def rotation_bounds_grid(shape, transform):
+    """
+    Rotations about the origin move a voxel centre at most its distance to the
+    origin, so a cube of that half size (in voxels of the same pitch) holds the
+    grid under any rotation. Using one cube for all rotations keeps the shape
+    of every rotated grid of a mesh the same.
+    """
+    transform = np.asarray(transform, dtype=np.float64)
+    pitch = np.abs(np.linalg.det(transform[:3, :3])) ** (1.0 / 3.0)
+    corners = np.array(np.meshgrid(*[[0, n - 1] for n in shape], indexing="ij")).reshape(3, -1).T
+    radius = np.linalg.norm(corners @ transform[:3, :3].T + transform[:3, 3], axis=1).max()
+    half = int(np.ceil(radius / pitch - 1e-9))
+
+    out_transform = np.eye(4)
+    out_transform[:3, :3] *= pitch
+    out_transform[:3, 3] = -half * pitch
+    return (2 * half + 1,) * 3, out_transform
+
+
+# Function to get the shape and transform of the fixed grid covering the normalized cube at the given resolution
+def normalized_cube_grid(resolution):
+    """
+    This is the frame of the grids written by the voxelizer: voxel centres at
+    grid_min + (i + 0.5) * pitch, so every grid has the shape (resolution,) * 3.
+    """
+    pitch = grid_size / resolution
+    out_transform = np.eye(4)
+    out_transform[:3, :3] *= pitch
+    out_transform[:3, 3] = grid_min + 0.5 * pitch
+    return (resolution,) * 3, out_transform
+
+
+# Function to rotate a grid (or one grid per rotation) about the world origin for a batch of rotations
+def rotate_grids(grids, rotations, transform, out_shape=None, out_transform=None, method="nearest"):
+    """
+    grids is one (X, Y, Z) grid shared by all rotations or a (B, X, Y, Z) batch,
+    transform maps voxel indices to world coordinates (e.g. VoxelGrid.transform).
+    A voxel that holds the point p before the rotation holds R p afterwards, so
+    the output matches points @ R.T of the point clouds in the same frame.
+
+    "nearest" gives every output voxel the value of the input voxel nearest to
+    its centre rotated back; "forward" instead re-voxelizes the rotated centres
+    of the occupied input voxels, so nothing outside the rotated shape is ever
+    set, but neighbouring voxels can merge. Output voxels outside the input
+    grid are 0. Returns (B, *out_shape) grids of the input dtype.
+    """
+    grids = np.asarray(grids)
+    rotations = np.asarray(rotations, dtype=np.float64).reshape(-1, 3, 3)
+    transform = np.asarray(transform, dtype=np.float64)
+    out_shape = tuple(out_shape) if out_shape is not None else grids.shape[-3:]
+    out_transform = np.asarray(out_transform, dtype=np.float64) if out_transform is not None else transform
+    shared = grids.ndim == 3
+    if method == "forward":
+        return rotate_grids_forward(grids, rotations, transform, out_shape, out_transform)
+
+    # Output voxel index -> world -> rotated back -> input voxel index is one affine map per rotation
+    inverse = np.linalg.inv(transform)
+    linear = inverse[:3, :3] @ np.swapaxes(rotations, 1, 2)
+    index_linear = linear @ out_transform[:3, :3]
+    index_offset = linear @ out_transform[:3, 3] + inverse[:3, 3]
+    shape = grids.shape[-3:]
+    flat_grids = grids.reshape(1 if shared else len(grids), -1)
+    axes = [np.arange(n, dtype=np.float64) for n in out_shape]
+
+    rotated = np.zeros((len(rotations),) + out_shape, dtype=grids.dtype)
+    step = max(1, max_point_block // max(1, int(np.prod(out_shape))))
+    for start in range(0, len(rotations), step):
+        batch = np.arange(start, min(start + step, len(rotations)))
+        flat = np.zeros((len(batch),) + out_shape, dtype=np.int64)
+        valid = np.ones((len(batch),) + out_shape, dtype=bool)
+        for d in range(3):
+            # Nearest input index along axis d, summed from the three output axes by broadcasting
+            coordinate = (index_linear[batch, d, 0, None, None, None] * axes[0][:, None, None]
+                          + index_linear[batch, d, 1, None, None, None] * axes[1][None, :, None]
+                          + index_linear[batch, d, 2, None, None, None] * axes[2][None, None, :]
+                          + index_offset[batch, d, None, None, None])
+            index = np.rint(coordinate).astype(np.int64)
+            valid &= (index >= 0) & (index < shape[d])
+            flat = flat * shape[d] + index
+        flat[~valid] = 0
+        flat = flat.reshape(len(batch), -1)
+        values = flat_grids[0][flat] if shared else np.take_along_axis(flat_grids[batch], flat, axis=1)
+        rotated[batch] = np.where(valid, values.reshape(valid.shape), 0)
+    return rotated
+
+
+# Function to rotate grids by moving their non-zero voxel centres into the output grid
+def rotate_grids_forward(grids, rotations, transform, out_shape, out_transform):
+    inverse = np.linalg.inv(out_transform)
+    rotated = np.zeros((len(rotations), int(np.prod(out_shape))), dtype=grids.dtype)
+    for b in range(len(rotations)):
+        grid = grids if grids.ndim == 3 else grids[b]
+        occupied = np.argwhere(grid)
+        centers = occupied @ transform[:3, :3].T + transform[:3, 3]
+        indices = np.rint((centers @ rotations[b].T) @ inverse[:3, :3].T + inverse[:3, 3]).astype(np.int64)
+        valid = np.all((indices >= 0) & (indices < np.array(out_shape)), axis=1)
+        flat = np.ravel_multi_index(tuple(indices[valid].T), out_shape)
+        rotated[b, flat] = grid[tuple(occupied[valid].T)]
+    return rotated.reshape((len(rotations),) + tuple(out_shape))
@@ -0,0 +1,116 @@
+import os
+import json
+import hashlib
+from functools import lru_cache
+import numpy as np
+
+# Manifest of the generated outputs of one category, stored as JSON:
+#   {"variants": {"<variant id>": {"<output>": {"mesh_hash": ..., "params_hash": ..., "files": {path: size}}}}}
+# An output (partial, complete, occupancy) of a variant is complete when it was produced from the
+# same source mesh with the same generation parameters and all of its files still exist with the
+# recorded size. Packed outputs record the shard directory and row instead of loose files.
+
+
+# Function to hash the contents of a file
+def file_hash(path, chunk_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Function to hash a dictionary of generation parameters
+def params_hash(params):
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+
+
+class Manifest:
+    """Records which outputs of which variants of a category are up to date."""
+
+    def __init__(self, path):
+        self.path = path
+        self.variants = {}
+        self.new_records = []
+        if os.path.exists(path):
+            with open(path) as f:
+                self.variants = json.load(f).get("variants", {})
+
+    # Function to check whether an output of a variant exists and matches the mesh and parameters
+    def is_complete(self, variant_id, output, mesh_hash, output_params_hash):
+        entry = self.variants.get(str(variant_id), {}).get(output)
+        if entry is None or entry["mesh_hash"] != mesh_hash or entry["params_hash"] != output_params_hash:
+            return False
+        return entry_intact(entry, variant_id)
+
+    # Function to record a finished output, returns the files of the previous record that it replaced
+    def record(self, variant_id, output, mesh_hash, output_params_hash, files=(), shard=None, row=None):
+        entry = {"mesh_hash": mesh_hash, "params_hash": output_params_hash}
+        if shard is not None:
+            entry.update(shard=shard, row=int(row))
+        else:
+            entry["files"] = {path: os.path.getsize(path) for path in files}
+        return self.add_entry(variant_id, output, entry)
+
+    # Function to add an already built entry, used when merging the records of pool workers
+    def add_entry(self, variant_id, output, entry):
+        previous = self.variants.setdefault(str(variant_id), {}).get(output, {})
+        self.variants[str(variant_id)][output] = entry
+        self.new_records.append((int(variant_id), output, entry))
+        return [path for path in previous.get("files", {}) if path not in entry.get("files", {})]
+
+    # Function to list (variant id, output, entry) records that no longer match the current run
+    def stale_entries(self, mesh_hash, output_params_hashes, num_variants):
+        stale = []
+        for variant_id, outputs in self.variants.items():
+            for output, entry in outputs.items():
+                if (int(variant_id) >= num_variants or output not in output_params_hashes
+                        or entry["mesh_hash"] != mesh_hash or entry["params_hash"] != output_params_hashes[output]):
+                    stale.append((int(variant_id), output, entry))
+        return stale
+
+    # Function to delete the files of stale records and drop the records, returns the removed paths
+    def prune(self, mesh_hash, output_params_hashes, num_variants):
+        removed = []
+        for variant_id, output, entry in self.stale_entries(mesh_hash, output_params_hashes, num_variants):
+            for path in entry.get("files", {}):
+                if os.path.exists(path):
+                    os.remove(path)
+                    removed.append(path)
+            outputs = self.variants[str(variant_id)]
+            del outputs[output]
+            if not outputs:
+                del self.variants[str(variant_id)]
+        return removed
+
+    # Function to write the manifest atomically
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temporary_path = f"{self.path}.tmp{os.getpid()}"
+        with open(temporary_path, "w") as f:
+            json.dump({"variants": self.variants}, f, sort_keys=True)
+        os.replace(temporary_path, self.path)
+
+
+# Function to check that the files or the shard row of a record still hold the recorded output
+def entry_intact(entry, variant_id):
+    if "shard" in entry:
+        return shard_row_written(entry["shard"], entry["row"], int(variant_id))
+    return all(os.path.exists(path) and os.path.getsize(path) == size for path, size in entry["files"].items())
+
+
+# Function to check that a shard row holds the given variant
+def shard_row_written(directory, row, variant_id):
+    path = os.path.join(directory, "variant_ids.npy")
+    if not os.path.exists(path):
+        return False
+    stat = os.stat(path)
+    variant_ids = load_variant_ids(path, stat.st_mtime_ns, stat.st_size)
+    return row < len(variant_ids) and int(variant_ids[row]) == variant_id
+
+
+# The ids of a shard are read once per version of the file, not once per checked output;
+# a rewrite of the file changes its modification time and so misses the cache
+@lru_cache(maxsize=16)
+def load_variant_ids(path, mtime_ns, size):
+    return np.load(path)
@@ -0,0 +1,116 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+import trimesh
+from manifest import file_hash
+
+# Preprocessed meshes are stored here, one directory per source file and content hash
+default_cache_dir = "/home/haoming/Downloads/ycb_meshes/mesh_cache"
+
+# Arrays stored for every mesh, all plain .npy files that can be memory mapped
+#   vertices.npy      (V, 3) float32
+#   faces.npy         (F, 3) int32
+#   face_areas.npy    (F,)   float32
+#   face_normals.npy  (F, 3) float32
+# face_areas gives the source surface area recorded with the levels of detail (mesh_lod.build_lods)
+cached_arrays = ("vertices", "faces", "face_areas", "face_normals")
+
+
+class CachedMesh:
+    """Memory mapped arrays of a preprocessed mesh."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        for name in cached_arrays:
+            setattr(self, name, np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r"))
+
+    # Function to build a trimesh object without reprocessing the geometry
+    def to_trimesh(self):
+        return trimesh.Trimesh(vertices=np.asarray(self.vertices, dtype=np.float64), faces=np.asarray(self.faces, dtype=np.int64),
+                               face_normals=np.asarray(self.face_normals, dtype=np.float64), process=False)
+
+
+# Function to get the stamp file remembering the hash of a source file for its size and mtime
+def stamp_path(mesh_path, cache_dir):
+    key = hashlib.sha1(os.path.abspath(mesh_path).encode()).hexdigest()
+    return os.path.join(cache_dir, "stamps", f"{key}.json")
+
+
+# Function to get the content hash of a source mesh, only re-reading the file when its size or mtime changed
+def source_hash(mesh_path, cache_dir=None):
+    cache_dir = cache_dir or default_cache_dir
+    stat = os.stat(mesh_path)
+    stamp = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    path = stamp_path(mesh_path, cache_dir)
+    if os.path.exists(path):
+        with open(path) as f:
+            recorded = json.load(f)
+        if recorded["size"] == stamp["size"] and recorded["mtime_ns"] == stamp["mtime_ns"]:
+            return recorded["hash"]
+
+    stamp["hash"] = file_hash(mesh_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f"{path}.tmp{os.getpid()}"
+    with open(temporary_path, "w") as f:
+        json.dump(stamp, f)
+    os.replace(temporary_path, path)
+    return stamp["hash"]
+
+
+# Function to get the cache directory of a source mesh with the given content hash
+def cache_entry_dir(mesh_path, content_hash, cache_dir):
+    name = os.path.splitext(os.path.basename(mesh_path))[0]
+    return os.path.join(cache_dir, f"{name}-{content_hash[:16]}")
+
+
+# Function to parse a source mesh and write its cache entry
+def build_cache_entry(mesh_path, directory):
+    mesh = trimesh.load(mesh_path, force="mesh")
+    arrays = {
+        "vertices": mesh.vertices.astype(np.float32),
+        "faces": mesh.faces.astype(np.int32),
+        "face_areas": mesh.area_faces.astype(np.float32),
+        "face_normals": mesh.face_normals.astype(np.float32),
+    }
+
+    # Build in a private directory and rename it, so concurrent workers never see a half written entry
+    temporary_dir = f"{directory}.tmp{os.getpid()}"
+    os.makedirs(temporary_dir, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(temporary_dir, f"{name}.npy"), array)
+    try:
+        os.rename(temporary_dir, directory)
+    except OSError:
+        # Another process finished the same entry first
+        shutil.rmtree(temporary_dir, ignore_errors=True)
+
+
+# Function to load the cached arrays of a mesh, building the cache entry when it is missing or stale
+def load_cached_mesh(mesh_path, cache_dir=None):
+    cache_dir = cache_dir or default_cache_dir
+    directory = cache_entry_dir(mesh_path, source_hash(mesh_path, cache_dir), cache_dir)
+    if not all(os.path.exists(os.path.join(directory, f"{name}.npy")) for name in cached_arrays):
+        build_cache_entry(mesh_path, directory)
+    return CachedMesh(directory)
+
+
+# Function to load a mesh as a trimesh object through the cache
+def load_mesh(mesh_path, cache_dir=None):
+    cache_dir = cache_dir or default_cache_dir
+    return load_cached_mesh(mesh_path, cache_dir).to_trimesh()
+
+
+# Function to delete the cache entries of a source mesh other than the current one
+def prune_cache(mesh_path, cache_dir=None):
+    cache_dir = cache_dir or default_cache_dir
+    current = cache_entry_dir(mesh_path, source_hash(mesh_path, cache_dir), cache_dir)
+    prefix = os.path.splitext(os.path.basename(mesh_path))[0] + "-"
+    removed = []
+    for entry in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, entry)
+        if entry.startswith(prefix) and path != current and os.path.isdir(path) and len(entry) == len(prefix) + 16:
+            shutil.rmtree(path)
+            removed.append(path)
+    return removed
@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import shutil
+import argparse
+import numpy as np
+import trimesh
+from mesh_cache import default_cache_dir, cache_entry_dir, source_hash, load_cached_mesh
+
+# Decimated levels of a mesh are stored inside its mesh cache entry:
+#   lod/levels.json             per level: cell size, face count and error, plus the size of the full mesh
+#   lod/level_<k>/vertices.npy  (V, 3) float32
+#   lod/level_<k>/faces.npy     (F, 3) int32
+# Levels cluster the vertices on grids from 1/1024 to 1/32 of the largest extent of the mesh, in steps of
+# sqrt(2); only levels with fewer faces than the full mesh are kept.
+lod_cell_fractions = tuple(2.0 ** (-k / 2.0) for k in range(20, 9, -1))
+
+# A level is used when its error is at most this share of both the voxel pitch and the point spacing
+lod_tolerance = 1.0
+
+
+# Function to get the width of a mesh along its thinnest principal axis
+def min_width(vertices):
+    centered = vertices - vertices.mean(axis=0)
+    _, _, axes = np.linalg.svd(centered[::max(1, len(centered) // 20000)], full_matrices=False)
+    widths = np.ptp(centered @ axes.T, axis=0)
+    return float(min(widths.min(), np.ptp(vertices, axis=0).min()))
+
+
+# Function to decimate a mesh by clustering its vertices on a grid of the given cell size
+def cluster_vertices(vertices, faces, cell_size):
+    """
+    The vertices of a cell are replaced by their mean and the faces that
+    collapse are dropped. Faces that end up on the same three vertices are
+    cancelled in pairs, so every vertical ray still crosses the surface with
+    the parity the voxelizer expects. Returns the vertices, the faces and the
+    largest distance a vertex moved.
+    """
+    vertices = np.asarray(vertices, dtype=np.float64)
+    faces = np.asarray(faces, dtype=np.int64)
+    keys = np.floor((vertices - vertices.min(axis=0)) / cell_size).astype(np.int64)
+    _, cluster = np.unique(keys, axis=0, return_inverse=True)
+    cluster = cluster.reshape(-1)
+    counts = np.bincount(cluster)
+    representatives = np.stack([np.bincount(cluster, weights=vertices[:, d]) for d in range(3)], axis=1) / counts[:, None]
+    shift = float(np.linalg.norm(vertices - representatives[cluster], axis=1).max()) if len(vertices) else 0.0
+
+    new_faces = cluster[faces]
+    keep = ((new_faces[:, 0] != new_faces[:, 1]) & (new_faces[:, 1] != new_faces[:, 2])
+            & (new_faces[:, 0] != new_faces[:, 2]))
+    new_faces = new_faces[keep]
+    _, first, inverse, copies = np.unique(np.sort(new_faces, axis=1), axis=0, return_index=True,
+                                          return_inverse=True, return_counts=True)
+    new_faces = new_faces[np.sort(first[copies % 2 == 1])]
+
+    used, remapped = np.unique(new_faces, return_inverse=True)
+    return representatives[used], remapped.reshape(-1, 3), shift
+
+
+# Function to get the directory holding the levels of a mesh
+def lod_dir(mesh_path, cache_dir=None):
+    cache_dir = cache_dir or default_cache_dir
+    return os.path.join(cache_entry_dir(mesh_path, source_hash(mesh_path, cache_dir), cache_dir), "lod")
+
+
+# Function to build and store the levels of a mesh
+def build_lods(mesh_path, cache_dir=None):
+    mesh = load_cached_mesh(mesh_path, cache_dir)
+    vertices = np.asarray(mesh.vertices, dtype=np.float64)
+    faces = np.asarray(mesh.faces, dtype=np.int64)
+    extent = float(np.ptp(vertices, axis=0).max())
+    info = {"faces": len(faces), "area": float(np.asarray(mesh.face_areas, dtype=np.float64).sum()),
+            "max_extent": extent, "min_width": min_width(vertices), "levels": []}
+
+    directory = lod_dir(mesh_path, cache_dir)
+    temporary_dir = f"{directory}.tmp{os.getpid()}"
+    os.makedirs(temporary_dir, exist_ok=True)
+    for fraction in lod_cell_fractions:
+        level_vertices, level_faces, shift = cluster_vertices(vertices, faces, fraction * extent)
+        if len(level_faces) == 0:
+            break
+        if len(level_faces) >= len(faces):
+            continue
+        level = len(info["levels"])
+        os.makedirs(os.path.join(temporary_dir, f"level_{level}"))
+        np.save(os.path.join(temporary_dir, f"level_{level}", "vertices.npy"), level_vertices.astype(np.float32))
+        np.save(os.path.join(temporary_dir, f"level_{level}", "faces.npy"), level_faces.astype(np.int32))
+        info["levels"].append({"cell_fraction": fraction, "faces": len(level_faces), "error": shift})
+    with open(os.path.join(temporary_dir, "levels.json"), "w") as f:
+        json.dump(info, f, indent=2)
+
+    # Build in a private directory and rename it, so concurrent workers never see half written levels
+    try:
+        os.rename(temporary_dir, directory)
+    except OSError:
+        shutil.rmtree(temporary_dir, ignore_errors=True)
+    return info
+
+
+# Function to load the level information of a mesh, building the levels when they are missing
+def load_lod_info(mesh_path, cache_dir=None):
+    path = os.path.join(lod_dir(mesh_path, cache_dir), "levels.json")
+    if not os.path.exists(path):
+        return build_lods(mesh_path, cache_dir)
+    with open(path) as f:
+        return json.load(f)
+
+
+# Function to get the largest vertex error allowed for a voxel resolution and point count, in mesh units
+def error_budget(info, voxel_resolution, num_points):
+    """
+    After rotation force_cubic_normalization stretches every axis to unit
+    length, which magnifies distances by at most 1 / (thinnest width), so the
+    budget is taken in that frame. The point spacing is that of num_points
+    points spread over the surface scaled to a unit largest extent.
+    """
+    pitch = 1.0 / voxel_resolution
+    spacing = np.sqrt(info["area"] / info["max_extent"] ** 2 / num_points)
+    return lod_tolerance * min(pitch, spacing) * info["min_width"]
+
+
+# Function to choose the coarsest level within the error budget, None when only the full mesh is accurate enough
+def select_level(info, max_error):
+    chosen = None
+    for level, entry in enumerate(info["levels"]):
+        if entry["error"] <= max_error and entry["faces"] < info["faces"]:
+            chosen = level
+    return chosen
+
+
+# Function to load the coarsest mesh whose error is below the voxel pitch and point spacing
+def load_lod_mesh(mesh_path, voxel_resolution, num_points, cache_dir=None):
+    info = load_lod_info(mesh_path, cache_dir)
+    level = select_level(info, error_budget(info, voxel_resolution, num_points))
+    if level is None:
+        return load_cached_mesh(mesh_path, cache_dir).to_trimesh()
+    directory = os.path.join(lod_dir(mesh_path, cache_dir), f"level_{level}")
+    return trimesh.Trimesh(vertices=np.load(os.path.join(directory, "vertices.npy")).astype(np.float64),
+                           faces=np.load(os.path.join(directory, "faces.npy")).astype(np.int64), process=False)
+
+
+# Function to measure the time saved and the accuracy impact of the chosen level on a set of meshes
+def lod_report(mesh_paths, options=None, num_variants=25, report_path=None):
+    """
+    For every mesh the same variants are generated from the full mesh and from
+    the chosen level. Reports the face counts, the per-variant time of both,
+    the mean IoU of the occupancy grids and the mean distance from the complete
+    clouds of the level to those of the full mesh.
+    """
+    import data_augmentation as augmentation
+    from scipy.spatial import cKDTree
+    options = augmentation.resolve_options(options)
+    report = {}
+    for mesh_path in mesh_paths:
+        category_name = os.path.splitext(os.path.basename(mesh_path))[0]
+        full = load_cached_mesh(mesh_path).to_trimesh()
+        reduced = load_lod_mesh(mesh_path, options["voxel_resolution"], augmentation.num_complete_points)
+        variant_ids = list(range(num_variants))
+
+        timings, variants = {}, {}
+        for name, mesh in (("full", full), ("lod", reduced)):
+            start = time.perf_counter()
+            variants[name] = augmentation.generate_variants(mesh, category_name, variant_ids, options)
+            timings[name] = (time.perf_counter() - start) / num_variants
+
+        ious, distances = [], []
+        for (_, _, full_complete, full_grid), (_, _, lod_complete, lod_grid) in zip(variants["full"], variants["lod"]):
+            full_grid, lod_grid = np.asarray(full_grid) > 0, np.asarray(lod_grid) > 0
+            union = np.logical_or(full_grid, lod_grid).sum()
+            ious.append(np.logical_and(full_grid, lod_grid).sum() / union if union else 1.0)
+            distances.append(cKDTree(full_complete).query(lod_complete)[0].mean())
+        report[category_name] = {"faces": len(full.faces), "lod_faces": len(reduced.faces),
+                                 "seconds_per_variant": timings["full"], "lod_seconds_per_variant": timings["lod"],
+                                 "saved_seconds_per_variant": timings["full"] - timings["lod"],
+                                 "grid_iou": float(np.mean(ious)), "complete_mean_distance": float(np.mean(distances))}
+        print(f"{category_name}: {len(full.faces)} -> {len(reduced.faces)} faces, "
+              f"{timings['full'] * 1e3:.1f} -> {timings['lod'] * 1e3:.1f} ms/variant, grid IoU {np.mean(ious):.4f}")
+
+    if report_path is not None:
+        os.makedirs(os.path.dirname(report_path) or ".", exist_ok=True)
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    import data_augmentation as augmentation
+    parser = argparse.ArgumentParser(description="Build the level-of-detail meshes and report their cost and accuracy")
+    parser.add_argument("--variants", type=int, default=25, help="variants generated per mesh and level")
+    parser.add_argument("--voxel-resolution", type=int, default=augmentation.voxel_resolution, help="resolution of the grids")
+    parser.add_argument("--report", default=os.path.join(augmentation.report_dir, "lod_report.json"), help="JSON report path")
+    args = parser.parse_args()
+    mesh_paths = [os.path.join(augmentation.meshes_dir, f) for f in augmentation.list_mesh_files()]
+    lod_report(mesh_paths, {"voxel_resolution": args.voxel_resolution}, args.variants, args.report)
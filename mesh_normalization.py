@@ -0,0 +1,54 @@
+import numpy as np
+
+# Function to apply rotation to the mesh vertices
+def rotate_mesh(mesh, rotation_matrix):
+    # Apply rotation to mesh vertices by multiplying with the rotation matrix
+    mesh.vertices = mesh.vertices @ rotation_matrix.T
+    return mesh
+
+# Function to normalize the mesh vertices to range [-0.5, 0.5]
+def normalize_mesh(mesh):
+    # Get the bounding box of the vertices
+    min_bounds = mesh.bounds[0]
+    max_bounds = mesh.bounds[1]
+
+    # Compute the center of the bounding box
+    center = (min_bounds + max_bounds) / 2.0
+
+    # Shift the vertices to be centered at the origin
+    mesh.vertices -= center
+
+    # Compute the scale factor to fit the vertices in [-0.5, 0.5]
+    scale = np.max(max_bounds - min_bounds)
+
+    # Scale the vertices to fit within the range [-0.5, 0.5]
+    mesh.vertices /= scale
+
+    return mesh
+
+def force_cubic_normalization(mesh):
+    min_bounds = mesh.bounds[0]
+    max_bounds = mesh.bounds[1]
+
+    # Compute the center of the bounding box
+    center = (min_bounds + max_bounds) / 2.0
+
+    # Compute the ranges along each axis
+    ranges = max_bounds - min_bounds
+
+    # Find the maximum range across all axes
+    max_range = np.max(ranges)
+
+    # Scale each axis proportionally to make the mesh cubic
+    scales = max_range / ranges
+
+    # Translate the mesh to the center
+    mesh.apply_translation(-center)
+
+    # Apply non-uniform scaling to make the bounding box cubic
+    mesh.apply_scale(scales)
+
+    # Finally, apply uniform scaling to fit the bounding box in [-0.5, 0.5]
+    mesh.apply_scale(1 / max_range)
+
+    return mesh
@@ -0,0 +1,118 @@
+import os
+import numpy as np
+from voxelizer import densify_intervals
+
+# Storage modes for occupancy grids
+#   "dense"             plain .npy of the grid as produced by the generators
+#   "packed"            .npz with the grid bit-packed to one bit per voxel
+#   "packed_compressed" same as "packed" with the zip deflate layer on top
+#   "sparse"            .npz of the inside z intervals of every voxel column (see voxelizer.voxelize_intervals),
+#                       written without a dense grid; loading at another resolution is exact along z only,
+#                       x and y take the nearest encoded column (see voxelizer.densify_intervals)
+occupancy_formats = ("dense", "packed", "packed_compressed", "sparse")
+
+
+# Function to bit-pack an occupancy grid, returns the packed bytes and the grid shape
+def pack_occupancy(grid):
+    grid = np.asarray(grid)
+    return np.packbits(grid.reshape(-1) > 0), grid.shape
+
+
+# Function to bit-pack a batch of equally shaped grids into an (N, num_bytes) array
+def pack_occupancy_batch(grids):
+    grids = np.asarray(grids)
+    return np.packbits(grids.reshape(len(grids), -1) > 0, axis=1), grids.shape[1:]
+
+
+# Function to unpack a single bit-packed grid
+def unpack_occupancy(bits, shape):
+    return np.unpackbits(bits, count=int(np.prod(shape))).reshape(shape).view(bool)
+
+
+# Function to unpack a batch of bit-packed grids of the same shape in one call
+def unpack_occupancy_batch(bits, shape):
+    bits = np.asarray(bits)
+    count = int(np.prod(shape))
+    return np.unpackbits(bits, axis=1, count=count).reshape((len(bits),) + tuple(shape)).view(bool)
+
+
+# Function to get the file path used by a storage mode for an occupancy path
+def occupancy_file_path(path, occupancy_format="dense"):
+    stem, _ = os.path.splitext(path)
+    return stem + (".npy" if occupancy_format == "dense" else ".npz")
+
+
+# Function to save an occupancy grid in the requested storage mode, returns the written path
+def save_occupancy(path, grid, occupancy_format="dense"):
+    if occupancy_format not in occupancy_formats:
+        raise ValueError(f"unknown occupancy format {occupancy_format!r}")
+    path = occupancy_file_path(path, occupancy_format)
+    if occupancy_format == "dense":
+        np.save(path, grid)
+        return path
+    if occupancy_format == "sparse":
+        with open(path, "wb") as f:
+            np.savez(f, resolution=np.int32(grid["resolution"]), columns=grid["columns"], intervals=grid["intervals"])
+        return path
+
+    bits, shape = pack_occupancy(grid)
+    save = np.savez_compressed if occupancy_format == "packed_compressed" else np.savez
+    with open(path, "wb") as f:
+        save(f, bits=bits, shape=np.asarray(shape, dtype=np.int32))
+    return path
+
+
+# Function to read the packed bytes and shape stored in a .npz occupancy file
+def load_packed_occupancy(path):
+    with np.load(path) as data:
+        return data["bits"], tuple(int(n) for n in data["shape"])
+
+
+# Function to load the column intervals of a sparse occupancy file
+def load_sparse_occupancy(path):
+    with np.load(path) as data:
+        return {"resolution": int(data["resolution"]), "columns": data["columns"], "intervals": data["intervals"]}
+
+
+# Function to check whether an .npz occupancy file holds sparse column intervals
+def is_sparse_occupancy(path):
+    with np.load(path) as data:
+        return "intervals" in data.files
+
+
+# Function to load an occupancy grid written in any storage mode, sparse grids at their own or the given resolution
+def load_occupancy(path, resolution=None):
+    if path.endswith(".npz") and is_sparse_occupancy(path):
+        return densify_intervals(load_sparse_occupancy(path), resolution)
+    if path.endswith(".npz"):
+        return unpack_occupancy(*load_packed_occupancy(path))
+    return np.load(path)
+
+
+# Function to find the occupancy file of a variant whichever storage mode wrote it
+def find_occupancy_file(path):
+    for occupancy_format in ("dense", "packed"):
+        candidate = occupancy_file_path(path, occupancy_format)
+        if os.path.exists(candidate):
+            return candidate
+    raise FileNotFoundError(path)
+
+
+# Function to load many occupancy grids, unpacking all packed grids of the same shape together
+def load_occupancy_batch(paths):
+    grids = [None] * len(paths)
+    packed = {}
+    for index, path in enumerate(paths):
+        if path.endswith(".npz") and is_sparse_occupancy(path):
+            grids[index] = densify_intervals(load_sparse_occupancy(path))
+        elif path.endswith(".npz"):
+            bits, shape = load_packed_occupancy(path)
+            packed.setdefault(shape, []).append((index, bits))
+        else:
+            grids[index] = np.load(path)
+
+    for shape, entries in packed.items():
+        unpacked = unpack_occupancy_batch(np.stack([bits for _, bits in entries]), shape)
+        for (index, _), grid in zip(entries, unpacked):
+            grids[index] = grid
+    return grids
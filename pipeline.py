@@ -0,0 +1,457 @@
+import os
+import json
+import time
+import shutil
+import zlib
+import argparse
+import functools
+from multiprocessing import Pool
+import numpy as np
+import trimesh
+import data_augmentation as augmentation
+from manifest import Manifest, params_hash
+from catalog import Catalog, catalog_name
+from mesh_cache import load_cached_mesh, source_hash
+from surface_sampler import SurfaceSampler, sample_half_space
+from voxelizer import voxelize_solid, grid_min, grid_size
+from grid_transform import rotate_grids, normalized_cube_grid
+from pointcloud_io import save_xyz, binary_path
+from occupancy_io import save_occupancy, occupancy_file_path
+from query_points import save_query_points
+from async_writer import AsyncWriter
+from profiling import StageProfiler, ProgressLine
+
+# Define base paths
+ycb_grasp_dataset_dir = "/home/haoming/Downloads/ycb_grasp_dataset"
+artifact_dir = "/home/haoming/Downloads/ycb_meshes/pipeline_cache"
+
+# Pipeline configuration; a JSON file given with --config overrides any of these keys
+#   outputs:      "base" writes one complete/partial cloud and grid per mesh, "variants" the rotated train/test variants
+#   base_outputs: which of the base outputs are written
+#   base_grid:    "solid" parity-voxelizes the normalized mesh into a fixed voxel_resolution^3 grid of [-0.5, 0.5]^3,
+#                 "surface" is the mesh.voxelized surface grid of the normalized mesh at pitch 1 / voxel_resolution
+#                 (the grids pcs_generator.py always wrote), "raw_surface" the surface grid of the source mesh in its
+#                 own frame at pitch mesh.scale / voxel_resolution (the grids main.py always wrote); surface grids
+#                 take the shape of the mesh
+#   variants:     "resample" draws every rotated variant with data_augmentation.generate_variants,
+#                 "rotate_base" rotates the base clouds and grid of the mesh into voxel_resolution^3 grids of the
+#                 normalized cube (like grasp_base_generator); it needs a base grid in the normalized frame
+#   options:      data_augmentation options of the resampled variants (sampler, voxelizer, partial, point_sampling,
+#                 mesh_lod, query_points, ...); voxel_resolution, occupancy_format and binary_sidecar come from the
+#                 config, and only loose files are written
+#   layout:       output file name templates relative to output_dir, filled in at write time from
+#                 {category}, {split}, {row} and {variant_id}; the directories are created as files are written
+#   overwrite:    rewrite outputs the manifest records as complete for the same mesh and parameters
+# Resampled variants use the point counts, cutting plane and seed of data_augmentation, so the config must agree with them.
+default_config = {
+    "meshes_dir": augmentation.meshes_dir,
+    "output_dir": ycb_grasp_dataset_dir,
+    "artifact_dir": artifact_dir,
+    "outputs": ["base", "variants"],
+    "base_outputs": ["base_complete", "base_partial", "base_occupancy"],
+    "base_grid": "solid",
+    "variants": "resample",
+    "options": {},
+    "num_variants": augmentation.num_variants,
+    "num_train_variants": augmentation.num_train_variants,
+    "num_complete_points": augmentation.num_complete_points,
+    "num_partial_points": augmentation.num_partial_points,
+    "voxel_resolution": augmentation.voxel_resolution,
+    "partial_plane": [list(augmentation.partial_plane[0]), augmentation.partial_plane[1]],
+    "seed": augmentation.base_seed,
+    "occupancy_format": "dense",
+    "binary_sidecar": False,
+    "writer_threads": 4,
+    "variant_batch_size": 25,
+    "overwrite": False,
+    "layout": {
+        "base_complete": "base/complete_pcs/{category}.xyz",
+        "base_partial": "base/partial_pcs/{category}.xyz",
+        "base_occupancy": "base/occupancy_grids/{category}.npy",
+        "partial": "input/{category}/{split}/{variant_id}_x.xyz",
+        "complete": "gt/{category}/{split}/{variant_id}_y.xyz",
+        "occupancy": "gt/{category}/{split}/{variant_id}.npy",
+        "points": "gt/{category}/{split}/{variant_id}_q.npz",
+    },
+}
+
+# Function to build a configuration from the defaults, an optional JSON file and keyword overrides
+def load_config(path=None, **overrides):
+    config = json.loads(json.dumps(default_config))
+    updates = {}
+    if path is not None:
+        with open(path) as f:
+            updates.update(json.load(f))
+    updates.update(overrides)
+    layout = {**config["layout"], **updates.pop("layout", {})}
+    config.update(updates)
+    config["layout"] = layout
+    if config["variants"] not in ("resample", "rotate_base"):
+        raise ValueError(f"unknown variant mode {config['variants']!r}")
+    if config["base_grid"] not in ("solid", "surface", "raw_surface"):
+        raise ValueError(f"unknown base grid {config['base_grid']!r}")
+    if config["variants"] == "rotate_base" and "variants" in config["outputs"] and config["base_grid"] == "raw_surface":
+        raise ValueError("rotate_base variants need a base grid of the normalized mesh, not raw_surface")
+    if config["variants"] == "resample" and "variants" in config["outputs"]:
+        variant_options(config)
+        shared = {"num_complete_points": augmentation.num_complete_points, "num_partial_points": augmentation.num_partial_points,
+                  "partial_plane": [list(augmentation.partial_plane[0]), augmentation.partial_plane[1]],
+                  "seed": augmentation.base_seed}
+        for key, value in shared.items():
+            if json.loads(json.dumps(config[key])) != json.loads(json.dumps(value)):
+                raise ValueError(f"resampled variants are drawn by data_augmentation with {key} = {value}, not {config[key]}")
+    return config
+
+# Function to get the data_augmentation options of the resampled variants
+def variant_options(config):
+    options = augmentation.resolve_options({**config["options"], "voxel_resolution": config["voxel_resolution"],
+                                            "occupancy_format": config["occupancy_format"],
+                                            "binary_sidecar": config["binary_sidecar"]})
+    if options["output_format"] != "files":
+        raise ValueError("the pipeline writes loose files through its layout, use data_augmentation for packed shards")
+    return options
+
+
+# Intermediate artifacts are stored per source mesh and stage, keyed by the parameters they depend on:
+#   normalized   vertices.npy, faces.npy        mesh scaled into [-0.5, 0.5]^3
+#   base_clouds  complete.npy, partial.npy      clouds of the normalized mesh
+#   base_grid    occupancy.npy [transform.npy]  base grid, with its voxel index to world transform for surface grids
+def stage_params(config, stage):
+    normalized = {"normalization": "bounding_box"}
+    if stage == "normalized":
+        return normalized
+    if stage == "base_clouds":
+        return {**normalized, "num_complete_points": config["num_complete_points"],
+                "num_partial_points": config["num_partial_points"], "partial_plane": config["partial_plane"],
+                "seed": config["seed"]}
+    if config["base_grid"] == "raw_surface":
+        return {"base_grid": "raw_surface", "voxel_resolution": config["voxel_resolution"]}
+    grid = {"voxel_resolution": config["voxel_resolution"]}
+    if config["base_grid"] != "solid":
+        grid["base_grid"] = config["base_grid"]
+    return {**normalized, **grid}
+
+# Function to get the directory of one intermediate artifact of a mesh
+def artifact_path(config, mesh_path, stage):
+    category_name = os.path.splitext(os.path.basename(mesh_path))[0]
+    mesh_key = source_hash(mesh_path)[:16]
+    stage_key = params_hash(stage_params(config, stage))[:16]
+    return os.path.join(config["artifact_dir"], f"{category_name}-{mesh_key}", f"{stage}-{stage_key}")
+
+# Function to load an intermediate artifact, computing and storing it when it is missing
+def cached_artifact(config, mesh_path, stage, build, profiler):
+    directory = artifact_path(config, mesh_path, stage)
+    marker = os.path.join(directory, "done")
+    if os.path.exists(marker):
+        return {name[:-len(".npy")]: np.load(os.path.join(directory, name))
+                for name in os.listdir(directory) if name.endswith(".npy")}
+
+    with profiler.stage(stage):
+        arrays = build()
+
+    # Build in a private directory and rename it, so concurrent workers never see a half written artifact
+    temporary_dir = f"{directory}.tmp{os.getpid()}"
+    os.makedirs(temporary_dir, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(temporary_dir, f"{name}.npy"), array)
+    open(os.path.join(temporary_dir, "done"), "w").close()
+    try:
+        os.rename(temporary_dir, directory)
+    except OSError:
+        # Another process finished the same artifact first
+        shutil.rmtree(temporary_dir, ignore_errors=True)
+    return arrays
+
+
+# Stage: load the source mesh arrays through the mesh cache
+def load_stage(config, mesh_path):
+    mesh = load_cached_mesh(mesh_path)
+    return np.asarray(mesh.vertices, dtype=np.float64), np.asarray(mesh.faces, dtype=np.int64)
+
+# Stage: center the mesh and scale its largest extent to 1, like normalize_mesh
+def normalize_stage(config, vertices, faces):
+    min_bounds = vertices.min(axis=0)
+    max_bounds = vertices.max(axis=0)
+    center = (min_bounds + max_bounds) / 2.0
+    scale = np.max(max_bounds - min_bounds)
+    return {"vertices": (vertices - center) / scale, "faces": faces}
+
+# Stage: sample the complete cloud and the half-space partial cloud of a mesh in its own frame
+def sample_stage(config, category_name, vertices, faces):
+    complete_rng, partial_rng = [np.random.default_rng(child) for child in
+                                 np.random.SeedSequence([config["seed"], zlib.crc32(category_name.encode())]).spawn(2)]
+    sampler = SurfaceSampler(vertices, faces)
+    complete = sampler.sample(np.eye(3), np.zeros(3), config["num_complete_points"], [complete_rng])[0]
+    normal, distance = config["partial_plane"]
+    partial = sample_half_space(sampler.triangles, config["num_partial_points"], partial_rng, normal, distance)
+    return {"complete": complete, "partial": partial}
+
+# Stage: voxelize a mesh into the configured base grid
+def voxelize_stage(config, vertices, faces):
+    """
+    Solid grids cover [-0.5, 0.5]^3 of the normalized mesh. Surface grids are
+    mesh.voxelized of the normalized mesh, or of the source mesh at a pitch of
+    its scale for raw_surface, stored as int like the scripts that wrote them.
+    """
+    if config["base_grid"] == "solid":
+        return {"occupancy": voxelize_solid(vertices, faces, config["voxel_resolution"]).astype(np.uint8)}
+    mesh = trimesh.Trimesh(vertices=vertices, faces=faces, process=False)
+    scale = mesh.scale if config["base_grid"] == "raw_surface" else 1.0
+    voxelized_mesh = mesh.voxelized(pitch=scale / config["voxel_resolution"])
+    return {"occupancy": voxelized_mesh.matrix.astype(int), "transform": np.asarray(voxelized_mesh.transform)}
+
+# Stage: decide the split of a variant and its row inside that split
+def split_stage(config, variant_id):
+    if variant_id < config["num_train_variants"]:
+        return "train", variant_id
+    return "test", variant_id - config["num_train_variants"]
+
+# Stage: get the final path of one output from the layout
+def output_path(config, output, category_name, variant_id=None):
+    fields = {"category": category_name}
+    if variant_id is not None:
+        split, row = split_stage(config, variant_id)
+        fields.update(split=split, row=row, variant_id=variant_id)
+    path = os.path.join(config["output_dir"], config["layout"][output].format(**fields))
+    return occupancy_file_path(path, config["occupancy_format"]) if output.endswith("occupancy") else path
+
+# Stage: write one output to its final path, returns the written files
+def write_stage(config, output, path, array):
+    """
+    Files are written under a temporary name and renamed into place, so a
+    crash never leaves a truncated file at a final path. Query points are
+    given as (points, labels, signed distance or None).
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    stem, extension = os.path.splitext(path)
+    temporary_path = f"{stem}.tmp{os.getpid()}{extension}"
+    if output.endswith("occupancy"):
+        os.replace(save_occupancy(temporary_path, array, config["occupancy_format"]), path)
+        return [path]
+    if output == "points":
+        save_query_points(temporary_path, *array)
+        os.replace(temporary_path, path)
+        return [path]
+    save_xyz(array, temporary_path, config["binary_sidecar"])
+    os.replace(temporary_path, path)
+    if not config["binary_sidecar"]:
+        return [path]
+
+    # The sidecar is moved last so it stays at least as new as its .xyz, as load_xyz expects
+    os.replace(binary_path(temporary_path), binary_path(path))
+    return [path, binary_path(path)]
+
+
+# Function to get the voxel index to world transform of the base grid
+def base_grid_transform(config):
+    pitch = grid_size / config["voxel_resolution"]
+    transform = np.eye(4)
+    transform[:3, :3] *= pitch
+    transform[:3, 3] = grid_min + pitch / 2.0
+    return transform
+
+# Function to list the outputs written for every variant
+def variant_output_names(config):
+    if config["variants"] == "resample":
+        return augmentation.enabled_outputs(variant_options(config))
+    return augmentation.variant_outputs
+
+# Function to generate some outputs of a batch of variants, returns {output: one array per variant}
+def variant_stage(config, category_name, variant_ids, outputs, mesh, sampler, base):
+    """
+    "resample" draws the variants with data_augmentation.generate_variants and
+    generate_query_points, so they match a data_augmentation run with the same
+    options. "rotate_base" rotates the base clouds and grid of the mesh instead.
+    """
+    if config["variants"] == "resample":
+        options = variant_options(config)
+        results = augmentation.generate_variants(mesh, category_name, variant_ids, options, sampler,
+                                                 outputs=[output for output in outputs if output != "points"])
+        arrays = {output: [result[index] for result in results]
+                  for index, output in ((1, "partial"), (2, "complete"), (3, "occupancy")) if output in outputs}
+        if "points" in outputs:
+            arrays["points"] = augmentation.generate_query_points(mesh, category_name, variant_ids, options, sampler,
+                                                                     config["seed"])
+        return arrays
+
+    rngs = [augmentation.variant_rngs(category_name, i, config["seed"]) for i in variant_ids]
+    rotations = np.stack([augmentation.random_rotation_matrix(rotation_rng) for rotation_rng, _, _ in rngs])
+    arrays = {"partial": np.einsum("nj,bij->bni", base["partial"], rotations),
+              "complete": np.einsum("nj,bij->bni", base["complete"], rotations)}
+    # Solid base grids carry no transform, they always cover the normalized cube
+    transform = base["transform"] if "transform" in base else base_grid_transform(config)
+    rotated_shape, rotated_transform = normalized_cube_grid(config["voxel_resolution"])
+    arrays["occupancy"] = rotate_grids(base["occupancy"], rotations, transform, rotated_shape, rotated_transform)
+    return {output: arrays[output] for output in outputs}
+
+
+# Function to get the manifest of the outputs the pipeline wrote for one mesh
+def manifest_path(config, category_name):
+    return os.path.join(config["output_dir"], "manifests", "pipeline", f"{category_name}.json")
+
+# Function to hash the parameters every output depends on, including where the layout puts it
+def output_hashes(config):
+    common = {"variants": config["variants"], "num_train_variants": config["num_train_variants"], "seed": config["seed"],
+              "occupancy_format": config["occupancy_format"], "binary_sidecar": config["binary_sidecar"]}
+    if config["variants"] == "resample" and "variants" in config["outputs"]:
+        generator = augmentation.output_params_hashes(variant_options(config))
+    else:
+        generator = {"partial": params_hash(stage_params(config, "base_clouds")),
+                     "complete": params_hash(stage_params(config, "base_clouds")),
+                     "occupancy": params_hash({**stage_params(config, "base_grid"), "rotated_grid": "normalized_cube"})}
+    generator.update({"base_complete": params_hash(stage_params(config, "base_clouds")),
+                      "base_partial": params_hash(stage_params(config, "base_clouds")),
+                      "base_occupancy": params_hash(stage_params(config, "base_grid"))})
+    return {output: params_hash({**common, "generator": generator[output], "layout": config["layout"][output]})
+            for output in generator}
+
+
+# Function to run the configured stages for one mesh, returns the stage totals
+def run_mesh(config, mesh_path):
+    """
+    Outputs the manifest records as complete for the same mesh and
+    parameters are skipped unless overwrite is set. Base outputs are recorded
+    as variant 0 of a separate manifest.
+    """
+    profiler = StageProfiler()
+    category_name = os.path.splitext(os.path.basename(mesh_path))[0]
+    mesh_hash = source_hash(mesh_path)
+    hashes = output_hashes(config)
+    manifest = Manifest(manifest_path(config, category_name))
+    base_manifest = Manifest(manifest_path(config, f"{category_name}_base"))
+
+    def missing(manifest, variant_id, output):
+        return config["overwrite"] or not manifest.is_complete(variant_id, output, mesh_hash, hashes[output])
+
+    base_outputs = [output for output in config["base_outputs"] if missing(base_manifest, 0, output)] \
+        if "base" in config["outputs"] else []
+
+    # Every intermediate is computed once per mesh and parameters and reused by all outputs and later runs;
+    # the normalized mesh is only loaded or built when a base artifact has to be computed from it
+    def normalized():
+        mesh = cached_artifact(config, mesh_path, "normalized",
+                               lambda: normalize_stage(config, *load_stage(config, mesh_path)), profiler)
+        return mesh["vertices"], mesh["faces"]
+
+    def grid_mesh():
+        return load_stage(config, mesh_path) if config["base_grid"] == "raw_surface" else normalized()
+
+    base = {}
+    rotate_base = "variants" in config["outputs"] and config["variants"] == "rotate_base"
+    if rotate_base or any(output in base_outputs for output in ("base_complete", "base_partial")):
+        base.update(cached_artifact(config, mesh_path, "base_clouds",
+                                    lambda: sample_stage(config, category_name, *normalized()), profiler))
+    if rotate_base or "base_occupancy" in base_outputs:
+        base.update(cached_artifact(config, mesh_path, "base_grid", lambda: voxelize_stage(config, *grid_mesh()), profiler))
+
+    # Files are recorded once the writer has finished them, (manifest, variant id, output, files) per output
+    written = []
+    with AsyncWriter(config["writer_threads"]) as writer:
+        def write(target, variant_id, output, path, array):
+            with profiler.stage("write"):
+                files = write_stage(config, output, path, array)
+            profiler.add_bytes(sum(os.path.getsize(file) for file in files))
+            written.append((target, variant_id, output, files))
+
+        for output in base_outputs:
+            writer.submit(write, base_manifest, 0, output, output_path(config, output, category_name),
+                          base[output[len("base_"):]])
+
+        if "variants" in config["outputs"]:
+            mesh = sampler = None
+            if config["variants"] == "resample":
+                options = variant_options(config)
+                mesh = augmentation.load_source_mesh(mesh_path, options)
+                sampler = SurfaceSampler.from_mesh(mesh) if options["sampler"] == "cached" else None
+            outputs = variant_output_names(config)
+            batch_size = config["variant_batch_size"]
+            for batch_start in range(0, config["num_variants"], batch_size):
+                needed = {i: [output for output in outputs if missing(manifest, i, output)]
+                          for i in range(batch_start, min(batch_start + batch_size, config["num_variants"]))}
+                variant_ids = [i for i in needed if needed[i]]
+                if not variant_ids:
+                    continue
+                batch_outputs = [output for output in outputs if any(output in needed[i] for i in variant_ids)]
+                with profiler.stage("variants"):
+                    arrays = variant_stage(config, category_name, variant_ids, batch_outputs, mesh, sampler, base)
+                for b, i in enumerate(variant_ids):
+                    for output in needed[i]:
+                        writer.submit(write, manifest, i, output, output_path(config, output, category_name, i), arrays[output][b])
+                profiler.add_variants(len(variant_ids))
+
+    # Files a record no longer lists (e.g. a sidecar that is not written any more) are removed
+    for target, variant_id, output, files in written:
+        for path in target.record(variant_id, output, mesh_hash, hashes[output], files):
+            if os.path.exists(path):
+                os.remove(path)
+    if "base" in config["outputs"]:
+        base_manifest.save()
+    if "variants" in config["outputs"]:
+        manifest.save()
+    return profiler.as_dict()
+
+# Function to build the catalog rows of the variants of one mesh whose outputs the manifest records as complete
+def catalog_rows(config, mesh_path):
+    category_name = os.path.splitext(os.path.basename(mesh_path))[0]
+    mesh_hash = source_hash(mesh_path)
+    hashes = output_hashes(config)
+    manifest = Manifest(manifest_path(config, category_name))
+    grid_shape = (config["voxel_resolution"],) * 3
+    rows = []
+    for i in range(config["num_variants"]):
+        if not all(manifest.is_complete(i, output, mesh_hash, hashes[output]) for output in augmentation.variant_outputs):
+            continue
+        split, row = split_stage(config, i)
+        rotation_rng, _, _ = augmentation.variant_rngs(category_name, i, config["seed"])
+        entry = {"category": category_name, "split": split, "variant_id": i, "row": row,
+                 "rotation": augmentation.random_rotation_matrix(rotation_rng),
+                 "partial_shape": (config["num_partial_points"], 3), "complete_shape": (config["num_complete_points"], 3),
+                 "occupancy_shape": grid_shape}
+
+        # The first recorded file of an output is the .xyz or grid itself, a binary sidecar follows it
+        for output in augmentation.variant_outputs:
+            entry[f"{output}_path"] = next(iter(manifest.variants[str(i)][output]["files"]))
+        rows.append(entry)
+    return rows
+
+# Main function to run the pipeline over all meshes, one mesh per worker
+def main(config, num_workers=1, progress=False, report_path=None):
+    profiler = StageProfiler()
+    mesh_paths = [os.path.join(config["meshes_dir"], f) for f in sorted(os.listdir(config["meshes_dir"])) if f.endswith(".ply")]
+    report_path = report_path or os.path.join(config["output_dir"], "reports", f"pipeline_{time.strftime('%Y%m%d_%H%M%S')}.json")
+
+    num_variants = config["num_variants"] if "variants" in config["outputs"] else 0
+    progress_line = ProgressLine(len(mesh_paths) * num_variants, enabled=progress)
+    run = functools.partial(run_mesh, config)
+    if num_workers > 1:
+        with Pool(num_workers) as pool:
+            for totals in pool.imap_unordered(run, mesh_paths):
+                profiler.merge(totals)
+                progress_line.update(profiler.variants)
+    else:
+        for mesh_path in mesh_paths:
+            profiler.merge(run_mesh(config, mesh_path))
+            progress_line.update(profiler.variants)
+    progress_line.close(profiler.variants)
+
+    # The catalog lists every variant by its final path, so readers never scan the output directories
+    if "variants" in config["outputs"]:
+        with profiler.stage("catalog"), Catalog(os.path.join(config["output_dir"], catalog_name)) as catalog:
+            for mesh_path in mesh_paths:
+                catalog.remove(os.path.splitext(os.path.basename(mesh_path))[0])
+                catalog.add(catalog_rows(config, mesh_path))
+
+    profiler.write_report(report_path, config=config, num_workers=num_workers, num_meshes=len(mesh_paths))
+    totals = profiler.as_dict()
+    print(f"Pipeline wrote {totals['variants']} variants of {len(mesh_paths)} meshes in {totals['wall_seconds']:.1f}s, "
+          f"report written to {report_path}")
+    return totals
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the configured generation pipeline")
+    parser.add_argument("--config", default=None, help="JSON file overriding the default configuration")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes (one mesh each)")
+    parser.add_argument("--progress", action="store_true", help="show a single progress line")
+    parser.add_argument("--report", default=None, help="path of the JSON run report")
+    args = parser.parse_args()
+    main(load_config(args.config), num_workers=args.workers, progress=args.progress, report_path=args.report)
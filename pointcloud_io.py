@@ -0,0 +1,90 @@
+import os
+import numpy as np
+
+# Binary sidecar written next to an .xyz file: raw little-endian float32 (N, 3)
+binary_suffix = ".xyzb"
+
+# Values at or above this magnitude are formatted one by one, below it the fixed point value is exact enough
+max_fast_magnitude = 1e9
+
+
+# Function to format the decimal digits of non-negative integers into right-aligned byte columns
+def integer_digits(values, width):
+    digits = np.empty((len(values), width), dtype=np.uint8)
+    remaining = values.copy()
+    for column in range(width - 1, -1, -1):
+        digits[:, column] = remaining % 10 + ord("0")
+        remaining //= 10
+    return digits
+
+
+# Function to format points exactly like np.savetxt(..., fmt="%.6f") without a Python loop per value
+def format_xyz(points):
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    if len(points) == 0:
+        return b""
+    values = points.reshape(-1)
+    if not np.all(np.isfinite(values)) or np.abs(values).max() >= max_fast_magnitude:
+        return "".join("%.6f %.6f %.6f\n" % tuple(row) for row in points).encode()
+
+    # Fixed point value rounded to 6 decimals; values too close to a rounding tie are
+    # handed to the exact C formatter so the result matches "%.6f" digit for digit
+    scaled = np.abs(values) * 1e6
+    fixed = np.rint(scaled).astype(np.int64)
+    ambiguous = np.abs(scaled - np.floor(scaled) - 0.5) < scaled * 4e-16 + 1e-9
+    for index in np.flatnonzero(ambiguous):
+        fixed[index] = int(("%.6f" % abs(values[index])).replace(".", ""))
+    negative = np.signbit(values)
+
+    integer_part = fixed // 1000000
+    fraction_part = fixed % 1000000
+    integer_width = np.maximum(1, np.floor(np.log10(np.maximum(integer_part, 1))).astype(np.int64) + 1)
+    lengths = negative + integer_width + 7
+    width = int(lengths.max())
+
+    # Right-aligned text of every value followed by its separator
+    text = np.empty((len(values), width + 1), dtype=np.uint8)
+    text[:, width - 6:width] = integer_digits(fraction_part, 6)
+    text[:, width - 7] = ord(".")
+    max_integer_width = int(integer_width.max())
+    text[:, width - 7 - max_integer_width:width - 7] = integer_digits(integer_part, max_integer_width)
+    sign_column = width - 7 - integer_width - 1
+    rows = np.flatnonzero(negative)
+    text[rows, sign_column[rows]] = ord("-")
+    text[:, width] = ord(" ")
+    text[2::3, width] = ord("\n")
+
+    columns = np.arange(width + 1)
+    keep = columns[None, :] >= (width - lengths)[:, None]
+    return text[keep].tobytes()
+
+
+# Function to parse the text of an .xyz file into an (N, 3) array
+def parse_xyz(data):
+    if isinstance(data, bytes):
+        data = data.decode()
+    values = np.fromstring(data, dtype=np.float64, sep=" ") if data.strip() else np.empty(0)
+    return values.reshape(-1, 3)
+
+
+# Function to get the path of the binary sidecar of an .xyz file
+def binary_path(file_path):
+    return os.path.splitext(file_path)[0] + binary_suffix
+
+
+# Function to save a point cloud as .xyz text, optionally with a float32 binary sidecar
+def save_xyz(points, file_path, binary=False):
+    with open(file_path, "wb") as f:
+        f.write(format_xyz(points))
+    if binary:
+        np.asarray(points, dtype="<f4").reshape(-1, 3).tofile(binary_path(file_path))
+
+
+# Function to load a point cloud, preferring an up to date binary sidecar when one exists
+def load_xyz(file_path, prefer_binary=True):
+    sidecar = binary_path(file_path)
+    if prefer_binary and os.path.exists(sidecar) and (
+            not os.path.exists(file_path) or os.path.getmtime(sidecar) >= os.path.getmtime(file_path)):
+        return np.fromfile(sidecar, dtype="<f4").reshape(-1, 3).astype(np.float64)
+    with open(file_path, "rb") as f:
+        return parse_xyz(f.read())
@@ -0,0 +1,120 @@
+import os
+import sys
+import json
+import time
+import resource
+import threading
+from contextlib import contextmanager
+
+
+# Function to get the peak resident set size of this process and of its finished children in bytes
+def peak_rss_bytes():
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit
+    return own, children
+
+
+class StageProfiler:
+    """
+    Accumulates wall time per generation stage, the number of variants and
+    the bytes written. Safe to use from the writer threads; the totals of
+    pool workers are combined with merge().
+    """
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.stage_seconds = {}
+        self.stage_calls = {}
+        self.variants = 0
+        self.bytes_written = 0
+        self.lock = threading.Lock()
+
+    # Context manager timing one stage
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - start)
+
+    def add_stage(self, name, seconds, calls=1):
+        with self.lock:
+            self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + seconds
+            self.stage_calls[name] = self.stage_calls.get(name, 0) + calls
+
+    # Function to wrap a job so its run time is counted under a stage
+    def timed(self, name, function):
+        def run(*args, **kwargs):
+            with self.stage(name):
+                return function(*args, **kwargs)
+        return run
+
+    def add_variants(self, count):
+        with self.lock:
+            self.variants += count
+
+    def add_bytes(self, count):
+        with self.lock:
+            self.bytes_written += int(count)
+
+    # Function to add the totals reported by another profiler (e.g. a pool worker)
+    def merge(self, totals):
+        for name, stage in totals["stages"].items():
+            self.add_stage(name, stage["seconds"], stage["calls"])
+        self.add_variants(totals["variants"])
+        self.add_bytes(totals["bytes_written"])
+
+    # Function to get the totals as a JSON-serializable dictionary
+    def as_dict(self):
+        wall_seconds = time.perf_counter() - self.start_time
+        own_rss, children_rss = peak_rss_bytes()
+        with self.lock:
+            return {
+                "wall_seconds": wall_seconds,
+                "variants": self.variants,
+                "variants_per_second": self.variants / wall_seconds if wall_seconds > 0 else 0.0,
+                "bytes_written": self.bytes_written,
+                "peak_rss_bytes": own_rss,
+                "peak_rss_children_bytes": children_rss,
+                "stages": {name: {"seconds": self.stage_seconds[name], "calls": self.stage_calls[name]}
+                           for name in sorted(self.stage_seconds)},
+            }
+
+    # Function to write the JSON report of a run, extra keys (options, counts) are stored alongside
+    def write_report(self, path, **extra):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({**extra, **self.as_dict()}, f, indent=2, sort_keys=True)
+        return path
+
+
+class ProgressLine:
+    """Single self-overwriting progress line on stderr, redrawn at most every interval seconds."""
+
+    def __init__(self, total, enabled=True, interval=0.5):
+        self.total = total
+        self.enabled = enabled
+        self.interval = interval
+        self.start_time = time.perf_counter()
+        self.last_draw = 0.0
+
+    def update(self, done, force=False):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if not force and now - self.last_draw < self.interval:
+            return
+        self.last_draw = now
+        elapsed = now - self.start_time
+        rate = done / elapsed if elapsed > 0 else 0.0
+        remaining = (self.total - done) / rate if rate > 0 else float("inf")
+        sys.stderr.write(f"\r{done}/{self.total} variants  {rate:.1f} variants/s  eta {remaining:.0f}s   ")
+        sys.stderr.flush()
+
+    def close(self, done):
+        if self.enabled:
+            self.update(done, force=True)
+            sys.stderr.write("\n")
@@ -0,0 +1,130 @@
+import numpy as np
+from scipy.spatial import cKDTree
+from voxelizer import crossing_above, jittered_rays, ray_crossings
+
+# Query points for implicit-surface training, stored per variant as a .npz file:
+#   points  (N, 3)        float16  coordinates in the normalized frame
+#   labels  (ceil(N/8),)  uint8    bit-packed inside (1) / outside (0) labels
+#   sdf     (N,)          float16  signed distance, negative inside (only when requested)
+
+# Uniform points are drawn from the normalized cube grown by this margin on every side
+query_padding = 0.05
+
+# Share of uniform points; the rest are surface samples jittered by a normal offset of std query_sigma
+query_uniform_fraction = 0.5
+query_sigma = 0.02
+
+# Surface samples the signed distance is measured against
+sdf_surface_samples = 1 << 16
+
+# Upper bound on (point, triangle) candidate pairs tested at once
+max_pair_block = 1 << 22
+
+
+# Function to bin triangles into a uniform xy grid, the spatial index of the inside test
+def build_xy_index(triangles, lower, upper, cells):
+    """
+    Every triangle is listed in each cell its xy bounding box overlaps.
+    Returns the triangle ids sorted by cell and the start of every cell in
+    that list (cells * cells + 1 offsets).
+    """
+    size = (upper - lower) / cells
+    xy = triangles[:, :, :2]
+    low = np.clip(np.floor((xy.min(axis=1) - lower) / size).astype(np.int64), 0, cells - 1)
+    high = np.clip(np.floor((xy.max(axis=1) - lower) / size).astype(np.int64), 0, cells - 1)
+    counts = high - low + 1
+    num_pairs = counts[:, 0] * counts[:, 1]
+
+    triangle_ids = np.repeat(np.arange(len(triangles)), num_pairs)
+    local = np.arange(num_pairs.sum()) - np.repeat(np.cumsum(num_pairs) - num_pairs, num_pairs)
+    ny = counts[triangle_ids, 1]
+    cell_ids = (low[triangle_ids, 0] + local // ny) * cells + low[triangle_ids, 1] + local % ny
+
+    order = np.argsort(cell_ids, kind="stable")
+    starts = np.searchsorted(cell_ids[order], np.arange(cells * cells + 1))
+    return triangle_ids[order], starts
+
+
+# Function to label points inside or outside a mesh given as (T, 3, 3) triangles
+def points_inside(triangles, points, cells=None):
+    """
+    A vertical ray through each point is tested against the triangles of its
+    cell of the xy index only. The rays, crossings and tie rule are the parity
+    voxelizer's: a point is inside when the surface is crossed an odd number
+    of times both above and below it, so the labels agree with the occupancy
+    grids at the voxel centres.
+    """
+    triangles = np.asarray(triangles, dtype=np.float64)
+    points = np.asarray(points, dtype=np.float64)
+    if cells is None:
+        cells = int(np.clip(np.sqrt(len(triangles) / 2.0), 8, 256))
+
+    # Rays are shifted like the voxelizer's so they never pass exactly through shared edges
+    rays = jittered_rays(points[:, :2])
+    lower = np.minimum(triangles[:, :, :2].min(axis=(0, 1)), rays.min(axis=0)) - 1e-9
+    upper = np.maximum(triangles[:, :, :2].max(axis=(0, 1)), rays.max(axis=0)) + 1e-9
+    triangle_ids, starts = build_xy_index(triangles, lower, upper, cells)
+
+    size = (upper - lower) / cells
+    ray_cells = np.clip(np.floor((rays - lower) / size).astype(np.int64), 0, cells - 1)
+    point_cells = ray_cells[:, 0] * cells + ray_cells[:, 1]
+    candidates = starts[point_cells + 1] - starts[point_cells]
+
+    above = np.zeros(len(points), dtype=np.int64)
+    below = np.zeros(len(points), dtype=np.int64)
+    cumulative = np.cumsum(candidates)
+    start = 0
+    while start < len(points):
+        # Take as many points as fit in one block of candidate pairs, at least one
+        done = cumulative[start - 1] if start > 0 else 0
+        stop = max(start + 1, int(np.searchsorted(cumulative, done + max_pair_block, side="right")))
+        block = np.arange(start, stop)
+        counts = candidates[block]
+        point_ids = np.repeat(block, counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        tri = triangle_ids[starts[point_cells[point_ids]] + local]
+
+        hit, z = ray_crossings(rays[point_ids], triangles[tri])
+        hit_points = point_ids[hit]
+        is_above = crossing_above(z, points[hit_points, 2])
+        above += np.bincount(hit_points[is_above], minlength=len(points))
+        below += np.bincount(hit_points[~is_above], minlength=len(points))
+        start = stop
+    return (above % 2 == 1) & (below % 2 == 1)
+
+
+# Function to draw uniform and near-surface query points, surface_points are samples of the same surface
+def sample_query_points(surface_points, count, rng):
+    num_uniform = int(round(count * query_uniform_fraction))
+    uniform = rng.uniform(-0.5 - query_padding, 0.5 + query_padding, size=(num_uniform, 3))
+    chosen = rng.choice(len(surface_points), count - num_uniform, replace=len(surface_points) < count - num_uniform)
+    near = surface_points[chosen] + rng.normal(scale=query_sigma, size=(count - num_uniform, 3))
+    return np.concatenate([uniform, near])
+
+
+# Function to approximate the signed distance of points to a surface from dense samples of it
+def signed_distance(surface_points, points, inside):
+    """
+    The distance to the nearest surface sample overestimates the distance to
+    the surface by at most about the sample spacing.
+    """
+    distance, _ = cKDTree(surface_points).query(points)
+    return np.where(inside, -distance, distance)
+
+
+# Function to save query points compactly
+def save_query_points(path, points, labels, sdf=None):
+    arrays = {"points": np.asarray(points, dtype=np.float16), "labels": np.packbits(np.asarray(labels, dtype=bool))}
+    if sdf is not None:
+        arrays["sdf"] = np.asarray(sdf, dtype=np.float16)
+    np.savez(path, **arrays)
+    return path
+
+
+# Function to load query points, returns float32 points, boolean labels and the signed distance or None
+def load_query_points(path):
+    with np.load(path) as data:
+        points = data["points"].astype(np.float32)
+        labels = np.unpackbits(data["labels"], count=len(points)).astype(bool)
+        sdf = data["sdf"].astype(np.float32) if "sdf" in data.files else None
+    return points, labels, sdf
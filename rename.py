@@ -1,34 +1,95 @@
 import os
 import re
+import glob
+from catalog import Catalog, catalog_name, path_columns
+from manifest import Manifest
+from pointcloud_io import binary_path
 
 # Define the base directories
 ycb_grasp_dataset_dir = "/home/haoming/Downloads/ycb_grasp_dataset"
 input_dir = os.path.join(ycb_grasp_dataset_dir, "input")
 gt_dir = os.path.join(ycb_grasp_dataset_dir, "gt")
+manifest_dir = os.path.join(ycb_grasp_dataset_dir, "manifests")
+catalog_path = os.path.join(ycb_grasp_dataset_dir, catalog_name)
 
-# Function to remove the prefix from file names
-def remove_prefix_from_files(base_dir):
+# Output files are named <category>_<id>[_x|_y|_q].<ext>; renaming keeps <id>[_x|_y|_q].<ext>
+prefixed_name = re.compile(r"_(\d+(_[xyq])?)\.(npy|npz|xyz|xyzb)$")
+
+# Function to get the name of an output file without its prefix, None when it has none
+def unprefixed_path(path):
+    match = prefixed_name.search(os.path.basename(path))
+    if match is None or os.path.basename(path) == match.group(0)[1:]:
+        return None
+    return os.path.join(os.path.dirname(path), f"{match.group(1)}.{match.group(3)}")
+
+# Function to rename one output file, recording the move in renamed
+def rename_output(old_path, new_path, renamed):
+    os.rename(old_path, new_path)
+    renamed[old_path] = new_path
+    print(f"Renamed: {old_path} -> {new_path}")
+
+# Function to point the manifest records at the renamed files, so resuming still finds every output
+def update_manifests(renamed, directory=manifest_dir):
+    for path in glob.glob(os.path.join(directory, "**", "*.json"), recursive=True):
+        manifest = Manifest(path)
+        changed = False
+        for outputs in manifest.variants.values():
+            for entry in outputs.values():
+                if any(file in renamed for file in entry.get("files", {})):
+                    entry["files"] = {renamed.get(file, file): size for file, size in entry["files"].items()}
+                    changed = True
+        if changed:
+            manifest.save()
+
+# Function to remove the prefix from file names (pipeline.py already writes the final names)
+def remove_prefix_from_files(base_dir, renamed):
     for category in os.listdir(base_dir):
         category_path = os.path.join(base_dir, category)
         if os.path.isdir(category_path):
             for subset in ['train', 'test']:
                 subset_path = os.path.join(category_path, subset)
                 if os.path.exists(subset_path):
+                    # Sidecars (.xyzb) and query points (_q.npz) are renamed along with the clouds and grids
                     for file in os.listdir(subset_path):
-                        if file.endswith(".npy") or file.endswith(".xyz"):
-                            # Use regex to capture the number and the suffix (if present)
-                            match = re.search(r"_(\d+(_[xy])?)\.(npy|xyz)", file)
-                            if match:
-                                new_name = f"{match.group(1)}.{match.group(3)}"
-                                old_path = os.path.join(subset_path, file)
-                                new_path = os.path.join(subset_path, new_name)
-                                os.rename(old_path, new_path)
-                                print(f"Renamed: {old_path} -> {new_path}")
+                        old_path = os.path.join(subset_path, file)
+                        new_path = unprefixed_path(old_path)
+                        if new_path is not None:
+                            rename_output(old_path, new_path, renamed)
+
+# Function to remove the prefix from the files the catalog records, updating their catalog paths
+def remove_prefix_from_catalog(renamed, path=catalog_path):
+    with Catalog(path) as catalog:
+        updates = []
+        for entry in catalog.query():
+            paths = {}
+            for column in path_columns:
+                old_path = entry[column]
+                new_path = unprefixed_path(old_path) if old_path else None
+                if new_path is None:
+                    continue
+                rename_output(old_path, new_path, renamed)
+                paths[column] = new_path
+
+                # Files the catalog does not list: the binary sidecar of a cloud, the query points next to a grid
+                companions = [binary_path(old_path)] if old_path.endswith(".xyz") else []
+                if column == "occupancy_path":
+                    companions.append(os.path.splitext(old_path)[0] + "_q.npz")
+                for companion in companions:
+                    if os.path.exists(companion):
+                        rename_output(companion, unprefixed_path(companion), renamed)
+            if paths:
+                updates.append((entry["category"], entry["variant_id"], paths))
+        catalog.update_paths(updates)
 
 # Execute renaming for both input and gt folders
 def main():
-    remove_prefix_from_files(input_dir)
-    remove_prefix_from_files(gt_dir)
+    renamed = {}
+    if os.path.exists(catalog_path):
+        remove_prefix_from_catalog(renamed, catalog_path)
+    else:
+        remove_prefix_from_files(input_dir, renamed)
+        remove_prefix_from_files(gt_dir, renamed)
+    update_manifests(renamed, manifest_dir)
 
 if __name__ == "__main__":
     main()
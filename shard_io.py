@@ -0,0 +1,180 @@
+import os
+import shutil
+import numpy as np
+from occupancy_io import pack_occupancy, pack_occupancy_batch, unpack_occupancy_batch
+
+# Packed shard layout: one directory per category/split holding contiguous arrays
+#   partial.npy      (N, num_partial_points, 3)  float32
+#   complete.npy     (N, num_complete_points, 3) float32
+#   occupancy.npy    (N, R, R, R)                uint8
+#   variant_ids.npy  (N,)                        int32
+#   rotations.npy    (N, 3, 3)                   float32
+# With packed occupancy the grid is replaced by
+#   occupancy_bits.npy   (N, ceil(R^3 / 8))          uint8
+#   occupancy_shape.npy  (3,)                        int32
+# Every file is a plain .npy so it can be opened with np.load(..., mmap_mode="r").
+shard_arrays = ("partial", "complete", "occupancy", "occupancy_bits", "occupancy_shape", "variant_ids", "rotations")
+required_shard_arrays = ("partial", "complete", "variant_ids", "rotations")
+
+
+# Function to get the directory of a category/split shard
+def shard_dir(packed_root, category_name, split):
+    return os.path.join(packed_root, category_name, split)
+
+
+# Function to allocate an empty shard on disk
+def create_shard(directory, num_rows, partial_shape, complete_shape, occupancy_shape, packed_occupancy=False, replace=True):
+    """
+    The shard is built in a private directory and renamed into place, so no
+    other process ever sees a half written shard. With replace an existing
+    shard is swapped out, otherwise a shard another process created first is
+    kept. Returns whether this call's shard is the one in place.
+    """
+    temporary_dir = f"{directory}.tmp{os.getpid()}"
+    shutil.rmtree(temporary_dir, ignore_errors=True)
+    os.makedirs(temporary_dir)
+    shapes = {
+        "partial": ((num_rows,) + tuple(partial_shape), np.float32),
+        "complete": ((num_rows,) + tuple(complete_shape), np.float32),
+        "variant_ids": ((num_rows,), np.int32),
+        "rotations": ((num_rows, 3, 3), np.float32),
+    }
+    if packed_occupancy:
+        shapes["occupancy_bits"] = ((num_rows, (int(np.prod(occupancy_shape)) + 7) // 8), np.uint8)
+        np.save(os.path.join(temporary_dir, "occupancy_shape.npy"), np.asarray(occupancy_shape, dtype=np.int32))
+    else:
+        shapes["occupancy"] = ((num_rows,) + tuple(occupancy_shape), np.uint8)
+
+    for name, (shape, dtype) in shapes.items():
+        array = np.lib.format.open_memmap(os.path.join(temporary_dir, f"{name}.npy"), mode="w+", dtype=dtype, shape=shape)
+        if name == "variant_ids":
+            # Rows that were never written keep the id -1
+            array[:] = -1
+        array.flush()
+        del array
+
+    # The replaced shard is moved aside first, a directory can only be renamed onto a missing or empty one
+    previous_dir = f"{directory}.old{os.getpid()}"
+    if replace and os.path.isdir(directory):
+        os.rename(directory, previous_dir)
+    try:
+        os.rename(temporary_dir, directory)
+    except OSError:
+        shutil.rmtree(temporary_dir, ignore_errors=True)
+        return False
+    finally:
+        shutil.rmtree(previous_dir, ignore_errors=True)
+    return True
+
+
+# Function to check whether a shard exists with the expected number of rows and per-row shapes
+def shard_exists(directory, num_rows, packed_occupancy=False, partial_shape=None, complete_shape=None, occupancy_shape=None):
+    occupancy_name = "occupancy_bits" if packed_occupancy else "occupancy"
+    names = required_shard_arrays + (occupancy_name,)
+    if not all(os.path.exists(os.path.join(directory, f"{name}.npy")) for name in names):
+        return False
+    shard = open_shard(directory)
+    if partial_shape is not None and shard["partial"].shape[1:] != tuple(partial_shape):
+        return False
+    if complete_shape is not None and shard["complete"].shape[1:] != tuple(complete_shape):
+        return False
+    if occupancy_shape is not None and tuple(shard_occupancy_shape(shard)) != tuple(occupancy_shape):
+        return False
+    return shard["variant_ids"].shape[0] == num_rows
+
+
+# Function to open all arrays of a shard as memory maps
+def open_shard(directory, mode="r"):
+    shard = {}
+    for name in shard_arrays:
+        path = os.path.join(directory, f"{name}.npy")
+        if name == "occupancy_shape" and os.path.exists(path):
+            shard[name] = tuple(int(n) for n in np.load(path))
+        elif os.path.exists(path):
+            shard[name] = np.load(path, mmap_mode=mode)
+    return shard
+
+
+# Function to get the dense occupancy grid shape of an opened shard
+def shard_occupancy_shape(shard):
+    if "occupancy_bits" in shard:
+        return shard["occupancy_shape"]
+    return shard["occupancy"].shape[1:]
+
+
+# Function to read the occupancy grids of some rows as dense boolean grids
+def read_shard_occupancy(shard, rows):
+    rows = np.atleast_1d(rows)
+    if "occupancy_bits" in shard:
+        return unpack_occupancy_batch(shard["occupancy_bits"][rows], shard["occupancy_shape"])
+    return shard["occupancy"][rows] > 0
+
+
+# Function to write one variant into its row of an opened shard, outputs given as None are left untouched
+def write_shard_row(shard, row, variant_id, rotation_matrix, partial, complete, occupancy):
+    if partial is not None:
+        shard["partial"][row] = partial
+    if complete is not None:
+        shard["complete"][row] = complete
+    if occupancy is not None:
+        occupancy = fit_occupancy_grid(occupancy, shard_occupancy_shape(shard)) > 0
+        if "occupancy_bits" in shard:
+            shard["occupancy_bits"][row] = pack_occupancy(occupancy)[0]
+        else:
+            shard["occupancy"][row] = occupancy
+    shard["rotations"][row] = rotation_matrix
+    shard["variant_ids"][row] = variant_id
+
+
+# Function to write a block of variants into the consecutive rows start.. of an opened shard
+def write_shard_rows(shard, start, variant_ids, rotation_matrices, partials, completes, occupancies):
+    rows = slice(start, start + len(variant_ids))
+    shard["partial"][rows] = partials
+    shard["complete"][rows] = completes
+    shape = shard_occupancy_shape(shard)
+    occupancies = np.asarray(occupancies)
+    if occupancies.shape[1:] != tuple(shape):
+        occupancies = np.stack([fit_occupancy_grid(grid, shape) for grid in occupancies])
+    if "occupancy_bits" in shard:
+        shard["occupancy_bits"][rows] = pack_occupancy_batch(occupancies)[0]
+    else:
+        shard["occupancy"][rows] = occupancies > 0
+    shard["rotations"][rows] = rotation_matrices
+    shard["variant_ids"][rows] = variant_ids
+
+
+# Function to flush the memory maps of an opened shard
+def flush_shard(shard):
+    for array in shard.values():
+        if isinstance(array, np.memmap):
+            array.flush()
+
+
+# Function to center a voxel grid inside a fixed shape, cropping or zero padding each axis
+def fit_occupancy_grid(grid, shape):
+    grid = np.asarray(grid)
+    if grid.shape == tuple(shape):
+        return grid
+    fitted = np.zeros(shape, dtype=grid.dtype)
+    src, dst = [], []
+    for have, want in zip(grid.shape, shape):
+        if have >= want:
+            start = (have - want) // 2
+            src.append(slice(start, start + want))
+            dst.append(slice(0, want))
+        else:
+            start = (want - have) // 2
+            src.append(slice(0, have))
+            dst.append(slice(start, start + have))
+    fitted[tuple(dst)] = grid[tuple(src)]
+    return fitted
+
+
+# Function to read a single variant (partial, complete, occupancy) from a shard by variant id
+def read_shard_variant(directory, variant_id):
+    shard = open_shard(directory)
+    rows = np.flatnonzero(shard["variant_ids"] == variant_id)
+    if len(rows) == 0:
+        raise KeyError(f"variant {variant_id} not found in {directory}")
+    row = rows[0]
+    return shard["partial"][row], shard["complete"][row], read_shard_occupancy(shard, row)[0]
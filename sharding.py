@@ -0,0 +1,103 @@
+import os
+import glob
+import heapq
+import trimesh
+from manifest import Manifest, entry_intact
+from mesh_cache import load_cached_mesh
+
+# Fixed cost of a variant in faces: sampling and voxelizing have a per-variant part independent of the mesh size
+variant_cost_faces = 20000
+
+
+# Function to get the number of faces of a mesh, from the mesh cache unless it is disabled
+def mesh_face_count(mesh_path, use_mesh_cache=True):
+    if use_mesh_cache:
+        return len(load_cached_mesh(mesh_path).faces)
+    return len(trimesh.load(mesh_path, force="mesh").faces)
+
+
+# Function to estimate the cost of every (mesh path, category, start, stop) work unit
+def unit_weights(units, use_mesh_cache=True):
+    face_counts = {}
+    weights = []
+    for mesh_path, _, start, stop in units:
+        if mesh_path not in face_counts:
+            face_counts[mesh_path] = mesh_face_count(mesh_path, use_mesh_cache)
+        weights.append((stop - start) * (face_counts[mesh_path] + variant_cost_faces))
+    return weights
+
+
+# Function to assign work units to shards with the longest-processing-time-first rule
+def assign_shards(weights, num_shards):
+    """
+    Units are taken from the heaviest down and each goes to the shard with the
+    least work so far; ties are broken by unit and shard index, so every node
+    computes the same assignment from the same unit list. Returns the shard
+    index of every unit.
+    """
+    order = sorted(range(len(weights)), key=lambda unit: (-weights[unit], unit))
+    loads = [(0, shard) for shard in range(num_shards)]
+    assignment = [0] * len(weights)
+    for unit in order:
+        load, shard = heapq.heappop(loads)
+        assignment[unit] = shard
+        heapq.heappush(loads, (load + weights[unit], shard))
+    return assignment
+
+
+# Function to get the work units of one shard, in their original (mesh by mesh) order
+def shard_units(units, num_shards, shard_index, weights=None, use_mesh_cache=True):
+    if not 0 <= shard_index < num_shards:
+        raise ValueError(f"shard index {shard_index} is not in [0, {num_shards})")
+    if num_shards == 1:
+        return list(units)
+    assignment = assign_shards(weights if weights is not None else unit_weights(units, use_mesh_cache), num_shards)
+    return [unit for unit, shard in zip(units, assignment) if shard == shard_index]
+
+
+# Function to get the directory holding the manifests written by one shard
+def shard_manifest_dir(manifest_dir, shard_index):
+    return os.path.join(manifest_dir, "shards", f"shard_{shard_index:03d}")
+
+
+# Function to merge the manifests of the shards of a run into the per-category manifests of the dataset
+def merge_shard_manifests(manifest_dir, num_shards):
+    """
+    Only the shards 0..num_shards-1 of the run are merged; manifests of other
+    shard indices (left by a run with another shard count) are ignored. Every
+    shard records only the variants it generated, so the records of a
+    category are disjoint across shards. When a variant output appears in more
+    than one shard (e.g. a unit re-run on another node) it is a conflict: the
+    record whose files are still intact wins, then the later shard. A shard
+    record replaces the record the dataset manifest already holds, like a
+    single-node run does, which is not a conflict. Merged shard manifests are
+    removed, so a later merge can never apply their records again. Returns
+    {category: number of conflicting records}.
+    """
+    conflicts = {}
+    shard_paths = [path for shard_index in range(num_shards)
+                   for path in sorted(glob.glob(os.path.join(shard_manifest_dir(manifest_dir, shard_index), "*.json")))]
+    categories = sorted({os.path.basename(path)[:-len(".json")] for path in shard_paths})
+    for category_name in categories:
+        merged = Manifest(os.path.join(manifest_dir, f"{category_name}.json"))
+        conflicts[category_name] = 0
+        category_paths = [path for path in shard_paths if os.path.basename(path) == f"{category_name}.json"]
+        merged_entries = set()
+        for path in category_paths:
+            for variant_id, outputs in Manifest(path).variants.items():
+                for output, entry in outputs.items():
+                    previous = merged.variants.get(variant_id, {}).get(output)
+                    if previous is not None and previous != entry:
+                        if (variant_id, output) in merged_entries:
+                            conflicts[category_name] += 1
+                        if entry_intact(previous, variant_id) and not entry_intact(entry, variant_id):
+                            continue
+                    merged_entries.add((variant_id, output))
+                    # Files the winning record no longer lists are removed, as in a single-node run
+                    for superseded in merged.add_entry(variant_id, output, entry):
+                        if os.path.exists(superseded):
+                            os.remove(superseded)
+        merged.save()
+        for path in category_paths:
+            os.remove(path)
+    return conflicts
@@ -0,0 +1,198 @@
+import numpy as np
+import trimesh
+from scipy.spatial import ConvexHull, QhullError
+
+# Upper bound on batch * faces entries processed at once when computing transformed face areas
+max_area_block = 1 << 22
+
+
+# Function to compute the cofactor matrices det(A) * A^-T of a batch of 3x3 matrices
+def cofactor_matrices(linear):
+    return np.stack([
+        np.cross(linear[..., 1, :], linear[..., 2, :]),
+        np.cross(linear[..., 2, :], linear[..., 0, :]),
+        np.cross(linear[..., 0, :], linear[..., 1, :]),
+    ], axis=-2)
+
+
+# Function to clip triangles to the half-space normal . x < distance
+def clip_triangles(triangles, normal, distance):
+    """
+    Returns the (M, 3, 3) triangles covering exactly the part of the input
+    triangles inside the half-space. A triangle with one vertex inside is cut
+    down to a smaller triangle, one with two vertices inside to a quad that is
+    split into two triangles; vertex order (and so orientation) is kept.
+    """
+    triangles = np.asarray(triangles, dtype=np.float64).reshape(-1, 3, 3)
+    signed = triangles @ np.asarray(normal, dtype=np.float64) - distance
+    inside = signed < 0
+    count = inside.sum(axis=1)
+
+    # Roll the vertices so the odd one out (the only inside or the only outside vertex) comes first
+    odd = np.where(count == 1, np.argmax(inside, axis=1), np.argmin(inside, axis=1))
+    order = (odd[:, None] + np.arange(3)) % 3
+    cut = (count == 1) | (count == 2)
+    rolled = np.take_along_axis(triangles[cut], order[cut][:, :, None], axis=1)
+    rolled_signed = np.take_along_axis(signed[cut], order[cut], axis=1)
+
+    # Points where the edges from the first vertex cross the plane
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = rolled_signed[:, :1] / (rolled_signed[:, :1] - rolled_signed[:, 1:])
+    crossings = rolled[:, :1] + t[:, :, None] * (rolled[:, 1:] - rolled[:, :1])
+
+    one_inside = count[cut] == 1
+    pieces = [triangles[count == 3],
+              np.stack([rolled[one_inside, 0], crossings[one_inside, 0], crossings[one_inside, 1]], axis=1),
+              np.stack([crossings[~one_inside, 0], rolled[~one_inside, 1], rolled[~one_inside, 2]], axis=1),
+              np.stack([crossings[~one_inside, 0], rolled[~one_inside, 2], crossings[~one_inside, 1]], axis=1)]
+    return np.concatenate(pieces, axis=0)
+
+
+# Function to draw count points uniformly from triangles with the given areas
+def sample_triangles(origins, edges, areas, count, rng):
+    cdf = np.cumsum(areas)
+    if len(cdf) == 0 or cdf[-1] <= 0:
+        raise ValueError("cannot sample points from an empty surface")
+    face_index = np.searchsorted(cdf, rng.random(count) * cdf[-1])
+    face_index = np.minimum(face_index, len(cdf) - 1)
+
+    # Fold points of the unit square outside the triangle back inside it
+    lengths = rng.random((count, 2))
+    outside = lengths.sum(axis=1) > 1.0
+    lengths[outside] = 1.0 - lengths[outside]
+    return origins[face_index] + np.einsum("nk,nki->ni", lengths, edges[face_index])
+
+
+# Function to pick count well spread points from each cloud of a batch by farthest-point sampling
+def farthest_point_sampling(clouds, count, rngs=None):
+    """
+    clouds is (B, N, 3); every cloud starts from a random point (the first
+    one without rngs) and repeatedly adds the point farthest from those
+    already chosen. Each step updates the (B, N) nearest-chosen distances with
+    one batched matrix product, so a batch costs O(B * N * count) in count steps.
+    Returns (B, count, 3) points in the input dtype.
+    """
+    clouds = np.asarray(clouds)
+    points = clouds.astype(np.float32)
+    num_clouds, num_points, _ = points.shape
+    rows = np.arange(num_clouds)
+
+    # |p - c|^2 = |p|^2 + [-2 p, 1] . [c, |c|^2]: one batched matrix product and one add per step
+    squared_norms = np.einsum("bnd,bnd->bn", points, points)
+    augmented = np.concatenate([-2.0 * points, np.ones((num_clouds, num_points, 1), dtype=np.float32)], axis=2)
+    distances = np.full((num_clouds, num_points), np.inf, dtype=np.float32)
+    step = np.empty((num_clouds, num_points, 1), dtype=np.float32)
+    current = np.array([rng.integers(num_points) for rng in rngs] if rngs is not None else [0] * num_clouds)
+    selected = np.empty((num_clouds, count), dtype=np.int64)
+    for j in range(count):
+        selected[:, j] = current
+        chosen = points[rows, current]
+        query = np.concatenate([chosen, np.einsum("bd,bd->b", chosen, chosen)[:, None]], axis=1)
+        np.matmul(augmented, query[:, :, None], out=step)
+        step[:, :, 0] += squared_norms
+        np.minimum(distances, step[:, :, 0], out=distances)
+        current = distances.argmax(axis=1)
+    return clouds[rows[:, None], selected]
+
+
+# Function to sample count points uniformly from the part of a triangle soup inside a half-space
+def sample_half_space(triangles, count, rng, normal=(0.0, 0.0, 1.0), distance=0.0):
+    clipped = clip_triangles(triangles, normal, distance)
+    edges = clipped[:, 1:] - clipped[:, :1]
+    areas = 0.5 * np.linalg.norm(np.cross(edges[:, 0], edges[:, 1]), axis=1)
+    return sample_triangles(clipped[:, 0], edges, areas, count, rng)
+
+
+class SurfaceSampler:
+    """
+    Uniform surface sampler for one mesh under many affine maps x -> A x + t.
+
+    The triangles, their edge vectors and cross products are computed once.
+    For a batch of maps the face areas are reweighted exactly: a triangle with
+    cross product c has area |cof(A) c| / 2 after the map, where cof(A) is the
+    cofactor matrix of A. Points are drawn in the source frame and mapped, which
+    keeps them uniform because affine maps preserve barycentric coordinates.
+    """
+
+    def __init__(self, vertices, faces):
+        self.vertices = np.asarray(vertices, dtype=np.float64)
+        self.faces = np.asarray(faces, dtype=np.int64)
+
+        self.triangles = self.vertices[self.faces]
+        self.origins = self.triangles[:, 0]
+        self.edges = self.triangles[:, 1:] - self.triangles[:, :1]
+        self.face_cross = np.cross(self.edges[:, 0], self.edges[:, 1])
+
+        # The extent of the mesh along any axis is decided by its convex hull vertices alone
+        try:
+            self.hull_vertices = self.vertices[ConvexHull(self.vertices).vertices]
+        except (QhullError, ValueError):
+            self.hull_vertices = self.vertices
+
+    @classmethod
+    def from_mesh(cls, mesh):
+        return cls(mesh.vertices, mesh.faces)
+
+    # Function to get the maps equal to rotate_mesh followed by force_cubic_normalization
+    def cubic_normalization(self, rotations):
+        rotations = np.asarray(rotations, dtype=np.float64).reshape(-1, 3, 3)
+        rotated = np.einsum("bij,vj->bvi", rotations, self.hull_vertices)
+        min_bounds = rotated.min(axis=1)
+        max_bounds = rotated.max(axis=1)
+        center = (min_bounds + max_bounds) / 2.0
+        ranges = max_bounds - min_bounds
+
+        # Scaling by max_range / ranges and then by 1 / max_range is a per-axis scale of 1 / ranges
+        linear = rotations / ranges[:, :, None]
+        offset = -center / ranges
+        return linear, offset
+
+    # Function to compute the face areas of the mesh under a batch of linear maps
+    def face_areas(self, linear):
+        linear = np.asarray(linear, dtype=np.float64).reshape(-1, 3, 3)
+        cofactors = cofactor_matrices(linear)
+        areas = np.empty((len(linear), len(self.faces)))
+        step = max(1, max_area_block // max(1, len(self.faces)))
+        for start in range(0, len(linear), step):
+            mapped = np.einsum("bij,fj->bfi", cofactors[start:start + step], self.face_cross)
+            areas[start:start + step] = 0.5 * np.linalg.norm(mapped, axis=2)
+        return areas
+
+    # Function to sample count points per map, one random generator per map
+    def sample(self, linear, offset, count, rngs):
+        linear = np.asarray(linear, dtype=np.float64).reshape(-1, 3, 3)
+        offset = np.asarray(offset, dtype=np.float64).reshape(-1, 3)
+        areas = self.face_areas(linear)
+
+        points = np.empty((len(linear), count, 3))
+        for b, rng in enumerate(rngs):
+            local = sample_triangles(self.origins, self.edges, areas[b], count, rng)
+            points[b] = local @ linear[b].T + offset[b]
+        return points
+
+    # Function to sample count points per map from the mapped surface inside normal . y < distance
+    def sample_half_space(self, linear, offset, count, rngs, normal=(0.0, 0.0, 1.0), distance=0.0):
+        """
+        The half-space is given in the mapped frame. It is pulled back to the
+        source frame (normal A^T n, distance d - n . t), the source triangles are
+        clipped once per map and the pieces are weighted by their mapped area,
+        so exactly count points are drawn without rejection or padding.
+        """
+        linear = np.asarray(linear, dtype=np.float64).reshape(-1, 3, 3)
+        offset = np.asarray(offset, dtype=np.float64).reshape(-1, 3)
+        normal = np.asarray(normal, dtype=np.float64)
+
+        points = np.empty((len(linear), count, 3))
+        for b, rng in enumerate(rngs):
+            clipped = clip_triangles(self.triangles, linear[b].T @ normal, distance - normal @ offset[b])
+            edges = clipped[:, 1:] - clipped[:, :1]
+            cross = np.cross(edges[:, 0], edges[:, 1])
+            areas = 0.5 * np.linalg.norm(cross @ cofactor_matrices(linear[b]).T, axis=1)
+            local = sample_triangles(clipped[:, 0], edges, areas, count, rng)
+            points[b] = local @ linear[b].T + offset[b]
+        return points
+
+    # Function to build the mesh obtained by applying one map to the source mesh
+    def transformed_mesh(self, linear, offset):
+        vertices = self.vertices @ np.asarray(linear).T + np.asarray(offset)
+        return trimesh.Trimesh(vertices=vertices, faces=self.faces, process=False)
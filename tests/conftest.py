@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+
+# The modules live flat in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def scratch_dataset(tmp_path, monkeypatch):
+    """
+    Points data_augmentation at a box and a ball mesh below tmp_path and
+    shrinks the dataset to 7 variants (5 train, 2 test). Returns a function
+    that moves the outputs to a fresh directory and returns its path.
+    """
+    import trimesh
+    import data_augmentation
+    import mesh_cache
+
+    meshes_dir = tmp_path / "meshes"
+    meshes_dir.mkdir()
+    trimesh.creation.box(extents=(0.4, 0.7, 1.0)).export(str(meshes_dir / "box.ply"))
+    trimesh.creation.icosphere(subdivisions=2).export(str(meshes_dir / "ball.ply"))
+    monkeypatch.setattr(mesh_cache, "default_cache_dir", str(tmp_path / "mesh_cache"))
+    monkeypatch.setattr(data_augmentation, "meshes_dir", str(meshes_dir))
+    monkeypatch.setattr(data_augmentation, "num_variants", 7)
+    monkeypatch.setattr(data_augmentation, "num_train_variants", 5)
+
+    def use_directory(name="dataset"):
+        directory = str(tmp_path / name)
+        for attribute in ("input_dir", "gt_dir", "packed_dir", "manifest_dir", "report_dir"):
+            monkeypatch.setattr(data_augmentation, attribute, os.path.join(directory, attribute.replace("_dir", "")))
+        monkeypatch.setattr(data_augmentation, "catalog_path", os.path.join(directory, "catalog.sqlite"))
+        return directory
+
+    use_directory()
+    return use_directory
@@ -0,0 +1,66 @@
+import threading
+
+import pytest
+
+from async_writer import AsyncWriter
+
+
+def test_all_jobs_run_before_close():
+    done = []
+    with AsyncWriter(num_threads=3) as writer:
+        for i in range(50):
+            writer.submit(done.append, i)
+    assert sorted(done) == list(range(50))
+
+
+def test_inline_mode_runs_in_the_caller():
+    threads = []
+    with AsyncWriter(num_threads=0) as writer:
+        writer.submit(lambda: threads.append(threading.current_thread()))
+    assert threads == [threading.current_thread()]
+
+
+def test_submit_blocks_when_the_queue_is_full():
+    release = threading.Event()
+    started = threading.Semaphore(0)
+
+    def job():
+        started.release()
+        release.wait()
+
+    writer = AsyncWriter(num_threads=1, max_pending=2)
+    writer.submit(job)
+    writer.submit(job)
+    third = threading.Thread(target=writer.submit, args=(job,))
+    third.start()
+    # Two jobs are outstanding, so the third submit waits until one of them finishes
+    third.join(timeout=0.2)
+    assert third.is_alive()
+    release.set()
+    third.join(timeout=5)
+    assert not third.is_alive()
+    writer.close()
+
+
+def test_job_error_is_raised_by_the_next_call():
+    def fail():
+        raise OSError("disk full")
+
+    writer = AsyncWriter(num_threads=2)
+    writer.submit(fail)
+    with pytest.raises(OSError, match="disk full"):
+        writer.flush()
+    with pytest.raises(OSError, match="disk full"):
+        writer.submit(print)
+    with pytest.raises(OSError, match="disk full"):
+        writer.close()
+
+
+def test_main_loop_error_is_not_masked():
+    def fail():
+        raise OSError("disk full")
+
+    with pytest.raises(KeyError):
+        with AsyncWriter(num_threads=1) as writer:
+            writer.submit(fail)
+            raise KeyError("main loop")
@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+import pytest
+import trimesh
+
+import data_augmentation as da
+
+
+@pytest.fixture
+def mesh():
+    return trimesh.creation.box(extents=(0.4, 0.7, 1.0))
+
+
+# Function to compare the (rotation, partial, complete, grid) tuples of two variant lists
+def assert_same_variants(first, second):
+    assert len(first) == len(second)
+    for a, b in zip(first, second):
+        for x, y in zip(a, b):
+            np.testing.assert_array_equal(x, y)
+
+
+@pytest.mark.parametrize("options", [{}, {"point_sampling": "fps"}, {"partial": "depth"}])
+def test_variants_do_not_depend_on_the_batch(mesh, options):
+    options = {**options, "voxel_resolution": 16}
+    together = da.generate_variants(mesh, "box", range(6), options)
+    split = (da.generate_variants(mesh, "box", [3, 4, 5], options)
+             + da.generate_variants(mesh, "box", [0, 1, 2], options))
+    assert_same_variants(together, split[3:] + split[:3])
+    assert_same_variants(together[4:5], da.generate_variants(mesh, "box", [4], options))
+
+
+def test_left_out_outputs_do_not_shift_the_others(mesh):
+    complete_only = da.generate_variants(mesh, "box", range(3), outputs=("complete",))
+    everything = da.generate_variants(mesh, "box", range(3))
+    for a, b in zip(complete_only, everything):
+        np.testing.assert_array_equal(a[2], b[2])
+
+
+# Function to read every output file below a directory, keyed by its relative path
+def read_outputs(directory):
+    files = {}
+    for name in ("input", "gt"):
+        for root, _, names in os.walk(os.path.join(directory, name)):
+            for file_name in names:
+                path = os.path.join(root, file_name)
+                with open(path, "rb") as f:
+                    files[os.path.relpath(path, directory)] = f.read()
+    return files
+
+
+def test_output_does_not_depend_on_workers_or_units(scratch_dataset):
+    outputs = []
+    for run, (num_workers, unit_size) in enumerate([(2, 7), (2, 2), (3, 3)]):
+        directory = scratch_dataset(f"run{run}")
+        da.main(num_workers=num_workers, unit_size=unit_size, options={"voxel_resolution": 16, "binary_sidecar": True})
+        outputs.append(read_outputs(directory))
+
+    assert len(outputs[0]) == 2 * 7 * 5
+    assert outputs[1] == outputs[0]
+    assert outputs[2] == outputs[0]
@@ -0,0 +1,80 @@
+import os
+
+import numpy as np
+import pytest
+import trimesh
+
+import grasp_base_generator as grasp
+from pointcloud_io import load_xyz
+from shard_io import read_shard_variant, shard_dir
+
+
+@pytest.fixture
+def grasp_dataset(tmp_path, monkeypatch):
+    """Points grasp_base_generator at one box mesh below tmp_path, returns a function moving its outputs."""
+    import mesh_cache
+
+    mesh_dir = tmp_path / "grasp_database" / "box" / "meshes"
+    mesh_dir.mkdir(parents=True)
+    trimesh.creation.box(extents=(0.04, 0.07, 0.1)).export(str(mesh_dir / "box_scaled.ply"))
+    monkeypatch.setattr(mesh_cache, "default_cache_dir", str(tmp_path / "mesh_cache"))
+    monkeypatch.setattr(grasp, "base_dir", str(tmp_path / "grasp_database"))
+    monkeypatch.setattr(grasp, "num_variants", 6)
+    monkeypatch.setattr(grasp, "variant_block_size", 4)
+
+    def use_directory(name):
+        output_dir = str(tmp_path / name)
+        for attribute, folder in [("complete_output_dir", "complete_pcs"), ("partial_output_dir", "partial_pcs"),
+                                  ("occupancy_output_dir", "occupancy_grids"), ("variant_output_dir", "variants"),
+                                  ("packed_variant_dir", "packed_variants"), ("report_dir", "reports")]:
+            monkeypatch.setattr(grasp, attribute, os.path.join(output_dir, folder))
+        return output_dir
+
+    return use_directory
+
+
+# Function to read every file below a directory except the run reports
+def read_tree(directory):
+    files = {}
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if "reports" not in root:
+                with open(os.path.join(root, name), "rb") as f:
+                    files[os.path.relpath(os.path.join(root, name), directory)] = f.read()
+    return files
+
+
+def test_runs_are_reproducible(grasp_dataset):
+    first = grasp_dataset("first")
+    grasp.process_dataset()
+    second = grasp_dataset("second")
+    grasp.process_dataset()
+    files = read_tree(first)
+    assert len(files) == 3 + 3 * 6
+    assert files == read_tree(second)
+
+
+def test_variants_rotate_the_base_outputs(grasp_dataset):
+    output_dir = grasp_dataset("run")
+    grasp.process_dataset()
+    complete = load_xyz(os.path.join(output_dir, "complete_pcs", "box_complete.xyz"))
+    rotations = grasp.random_rotation_matrices("box", range(6))
+    np.testing.assert_array_equal(rotations[2:4], grasp.random_rotation_matrices("box", [2, 3]))
+    for i, rotation in enumerate(rotations):
+        variant = load_xyz(os.path.join(output_dir, "variants", f"box_complete_variant_{i}.xyz"))
+        np.testing.assert_allclose(variant, complete @ rotation.T, atol=2e-6)
+        grid = np.load(os.path.join(output_dir, "variants", f"box_occupancy_variant_{i}.npy"))
+        assert grid.shape == (grasp.voxel_resolution,) * 3 and grid.any()
+
+
+def test_packed_variants_match_the_files(grasp_dataset):
+    files_dir = grasp_dataset("files")
+    grasp.process_dataset()
+    grasp_dataset("packed")
+    grasp.create_output_dirs()
+    grasp.process_mesh("box", os.path.join(grasp.base_dir, "box", "meshes", "box_scaled.ply"), output_format="packed")
+    for i in range(6):
+        partial, complete, grid = read_shard_variant(shard_dir(grasp.packed_variant_dir, "box", "variants"), i)
+        np.testing.assert_allclose(complete, load_xyz(os.path.join(files_dir, "variants", f"box_complete_variant_{i}.xyz")),
+                                   atol=2e-6)
+        np.testing.assert_array_equal(grid, np.load(os.path.join(files_dir, "variants", f"box_occupancy_variant_{i}.npy")) > 0)
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+import scipy.ndimage
+import trimesh
+from scipy.spatial.transform import Rotation as R
+
+import grasp_base_generator
+from grid_transform import normalized_cube_grid, rotate_grids, rotation_bounds_grid
+from voxelizer import voxelize_solid
+
+
+@pytest.fixture
+def box_grid():
+    box = trimesh.creation.box(extents=(0.53, 0.31, 0.77))
+    return box, voxelize_solid(box.vertices, box.faces, 32)
+
+
+def test_identity_keeps_the_grid(box_grid):
+    _, grid = box_grid
+    shape, transform = normalized_cube_grid(32)
+    np.testing.assert_array_equal(rotate_grids(grid, np.eye(3), transform)[0], grid)
+
+
+def test_quarter_turn_matches_rot90():
+    grid = np.random.default_rng(0).random((9, 9, 9)) < 0.3
+    transform = np.eye(4)
+    transform[:3, 3] = -4.0
+    # A quarter turn about z takes (x, y) to (-y, x)
+    rotated = rotate_grids(grid, R.from_euler("z", 90, degrees=True).as_matrix(), transform)[0]
+    np.testing.assert_array_equal(rotated, np.rot90(grid, k=1, axes=(0, 1)))
+
+
+def test_rotated_grid_matches_rotated_mesh(box_grid):
+    box, grid = box_grid
+    shape, transform = normalized_cube_grid(32)
+    rotations = R.random(3, random_state=1).as_matrix()
+    rotated = rotate_grids(grid, rotations, transform, shape, transform)
+    forward = rotate_grids(grid, rotations, transform, shape, transform, method="forward")
+    for rotation, rotated_grid, forward_grid in zip(rotations, rotated, forward):
+        expected = voxelize_solid(box.vertices @ rotation.T, box.faces, 32)
+        assert (rotated_grid & expected).sum() / (rotated_grid | expected).sum() > 0.85
+        # Forward mapping never sets a voxel away from the rotated shape
+        assert not (forward_grid & ~scipy.ndimage.binary_dilation(expected)).any()
+
+
+def test_bounds_grid_holds_every_rotation(box_grid):
+    _, grid = box_grid
+    shape, transform = normalized_cube_grid(32)
+    out_shape, out_transform = rotation_bounds_grid(shape, transform)
+    assert out_shape[0] % 2 == 1 and out_shape[0] > 32
+    rotations = R.random(5, random_state=2).as_matrix()
+    rotated = rotate_grids(grid, rotations, transform, out_shape, out_transform)
+    # Nothing is cropped, so the volume is kept up to resampling
+    np.testing.assert_allclose(rotated.reshape(5, -1).sum(axis=1), grid.sum(), rtol=0.05)
+    assert not rotated[:, 0].any() and not rotated[:, -1].any()
+
+
+def test_grasp_grids_keep_the_configured_shape(box_grid, monkeypatch):
+    box, _ = box_grid
+    voxels = box.voxelized(pitch=1.0 / 32)
+    rotations = R.random(4, random_state=3).as_matrix()
+    rotated = grasp_base_generator.apply_rotation_to_occupancy_grids(voxels.matrix.astype(int), rotations, voxels.transform)
+    assert rotated.shape == (4, 32, 32, 32)
+
+    monkeypatch.setattr(grasp_base_generator, "pad_rotated_grids", True)
+    padded = grasp_base_generator.apply_rotation_to_occupancy_grids(voxels.matrix.astype(int), rotations, voxels.transform)
+    assert padded.shape[1] > 32 and padded.shape[1:] == padded.shape[1:2] * 3
@@ -0,0 +1,89 @@
+import os
+
+import numpy as np
+
+import data_augmentation as da
+from manifest import Manifest, load_variant_ids, params_hash
+
+
+def test_record_and_check_files(tmp_path):
+    path = tmp_path / "box_0.npy"
+    np.save(path, np.zeros(4))
+    manifest = Manifest(str(tmp_path / "manifest.json"))
+    manifest.record(0, "occupancy", "mesh", "params", files=[str(path)])
+    manifest.save()
+
+    manifest = Manifest(str(tmp_path / "manifest.json"))
+    assert manifest.is_complete(0, "occupancy", "mesh", "params")
+    assert not manifest.is_complete(0, "occupancy", "other mesh", "params")
+    assert not manifest.is_complete(0, "occupancy", "mesh", "other params")
+    assert not manifest.is_complete(1, "occupancy", "mesh", "params")
+    # A truncated file no longer counts as written
+    np.save(path, np.zeros(2))
+    assert not manifest.is_complete(0, "occupancy", "mesh", "params")
+
+
+def test_record_returns_replaced_files(tmp_path):
+    old, new = tmp_path / "old.xyz", tmp_path / "new.xyz"
+    old.write_text("0 0 0\n")
+    new.write_text("1 1 1\n")
+    manifest = Manifest(str(tmp_path / "manifest.json"))
+    assert manifest.record(0, "partial", "mesh", "params", files=[str(old)]) == []
+    assert manifest.record(0, "partial", "mesh", "params", files=[str(new)]) == [str(old)]
+
+
+def test_prune_removes_stale_records(tmp_path):
+    files = []
+    manifest = Manifest(str(tmp_path / "manifest.json"))
+    for variant_id in range(3):
+        files.append(tmp_path / f"box_{variant_id}.npy")
+        np.save(files[-1], np.zeros(1))
+        manifest.record(variant_id, "occupancy", "mesh" if variant_id else "old mesh", "params", files=[str(files[-1])])
+    removed = manifest.prune("mesh", {"occupancy": "params"}, num_variants=2)
+    assert sorted(removed) == sorted([str(files[0]), str(files[2])])
+    assert list(manifest.variants) == ["1"]
+
+
+def test_shard_rows_are_checked_against_the_ids(tmp_path):
+    directory = tmp_path / "shard"
+    directory.mkdir()
+    np.save(directory / "variant_ids.npy", np.array([5, -1, 7], dtype=np.int32))
+    manifest = Manifest(str(tmp_path / "manifest.json"))
+    for row, variant_id in enumerate([5, 6, 7]):
+        manifest.record(variant_id, "partial", "mesh", "params", shard=str(directory), row=row)
+
+    load_variant_ids.cache_clear()
+    assert [manifest.is_complete(i, "partial", "mesh", "params") for i in (5, 6, 7)] == [True, False, True]
+    # The ids file is read once for all checks
+    assert load_variant_ids.cache_info().misses == 1
+
+    # A rewritten ids file is read again
+    np.save(directory / "variant_ids.npy", np.array([5, 6, 7], dtype=np.int32))
+    os.utime(directory / "variant_ids.npy", ns=(0, 10**18))
+    assert manifest.is_complete(6, "partial", "mesh", "params")
+
+
+def test_params_hash_ignores_key_order():
+    assert params_hash({"a": 1, "b": [2, 3]}) == params_hash({"b": [2, 3], "a": 1})
+    assert params_hash({"a": 1}) != params_hash({"a": 2})
+
+
+def test_resume_regenerates_only_missing_outputs(scratch_dataset):
+    options = {"voxel_resolution": 16}
+    assert da.main(num_workers=2, unit_size=3, options=options)["variants"] == 14
+    assert da.main(num_workers=2, unit_size=3, options=options)["variants"] == 0
+
+    partial_path, complete_path, occupancy_path = da.variant_paths("box", 3)
+    with open(complete_path, "rb") as f:
+        complete = f.read()
+    os.remove(complete_path)
+    mtime = os.path.getmtime(partial_path)
+    assert da.main(num_workers=2, unit_size=3, options=options)["variants"] == 1
+    with open(complete_path, "rb") as f:
+        assert f.read() == complete
+    assert os.path.getmtime(partial_path) == mtime
+
+    # Changing a parameter of one output regenerates that output only
+    assert da.main(num_workers=2, unit_size=3, options={"voxel_resolution": 8})["variants"] == 14
+    assert np.load(occupancy_path).shape == (8, 8, 8)
+    assert os.path.getmtime(partial_path) == mtime
@@ -0,0 +1,42 @@
+import os
+
+import numpy as np
+import trimesh
+
+import data_augmentation as da
+from manifest import file_hash
+from mesh_cache import load_cached_mesh, load_mesh, prune_cache, source_hash
+
+
+def test_cached_mesh_matches_the_source(tmp_path):
+    mesh = trimesh.creation.icosphere(subdivisions=2)
+    mesh_path = str(tmp_path / "ball.ply")
+    mesh.export(mesh_path)
+    cached = load_mesh(mesh_path, str(tmp_path / "cache"))
+    np.testing.assert_allclose(cached.vertices, mesh.vertices, atol=1e-6)
+    np.testing.assert_array_equal(cached.faces, mesh.faces)
+    np.testing.assert_allclose(load_cached_mesh(mesh_path, str(tmp_path / "cache")).face_areas, mesh.area_faces, rtol=1e-5)
+
+
+def test_changed_source_gets_a_new_entry(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    mesh_path = str(tmp_path / "ball.ply")
+    trimesh.creation.icosphere(subdivisions=1).export(mesh_path)
+    first = load_cached_mesh(mesh_path, cache_dir).directory
+    assert source_hash(mesh_path, cache_dir) == file_hash(mesh_path)
+
+    trimesh.creation.icosphere(subdivisions=2).export(mesh_path)
+    os.utime(mesh_path, ns=(0, os.stat(mesh_path).st_mtime_ns + 10**9))
+    second = load_cached_mesh(mesh_path, cache_dir)
+    assert second.directory != first
+    assert len(second.faces) == 320
+    assert prune_cache(mesh_path, cache_dir) == [first]
+
+
+def test_disabled_cache_is_left_untouched(scratch_dataset, tmp_path):
+    import mesh_cache
+
+    da.main(num_workers=2, unit_size=4, options={"voxel_resolution": 16, "mesh_cache": False})
+    assert da.main(num_workers=2, unit_size=4, options={"voxel_resolution": 16, "mesh_cache": False})["variants"] == 0
+    da.main(num_workers=2, unit_size=4, options={"voxel_resolution": 16, "mesh_cache": False}, num_shards=2, shard_index=1)
+    assert not os.path.exists(mesh_cache.default_cache_dir)
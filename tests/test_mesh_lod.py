@@ -0,0 +1,48 @@
+import numpy as np
+import trimesh
+
+import data_augmentation as da
+from mesh_lod import cluster_vertices, load_lod_info, load_lod_mesh, select_level
+from voxelizer import voxelize_solid
+
+
+def test_cluster_vertices_keeps_the_solid():
+    mesh = trimesh.creation.icosphere(subdivisions=4, radius=0.4)
+    vertices, faces, shift = cluster_vertices(mesh.vertices, mesh.faces, 0.02)
+    assert len(faces) < len(mesh.faces)
+    assert 0 < shift <= 0.02 * np.sqrt(3)
+    # No face is left twice on the same vertices, so the parity of every ray is kept
+    assert len(np.unique(np.sort(faces, axis=1), axis=0)) == len(faces)
+
+    before = voxelize_solid(mesh.vertices, mesh.faces, 32)
+    after = voxelize_solid(vertices, faces, 32)
+    assert (before & after).sum() / (before | after).sum() > 0.97
+
+
+def test_coarser_grids_get_coarser_levels(tmp_path):
+    mesh_path = str(tmp_path / "ball.ply")
+    trimesh.creation.icosphere(subdivisions=5).export(mesh_path)
+    cache_dir = str(tmp_path / "cache")
+    info = load_lod_info(mesh_path, cache_dir)
+    assert info["levels"] and info == load_lod_info(mesh_path, cache_dir)
+
+    # Levels get coarser and less accurate, and a larger budget never picks a finer one
+    faces = [level["faces"] for level in info["levels"]]
+    errors = [level["error"] for level in info["levels"]]
+    assert faces == sorted(faces, reverse=True) and errors == sorted(errors)
+    assert select_level(info, 0.0) is None
+    assert select_level(info, errors[-1]) == len(errors) - 1
+
+    coarse = load_lod_mesh(mesh_path, 8, 256, cache_dir)
+    fine = load_lod_mesh(mesh_path, 256, 8192, cache_dir)
+    assert len(coarse.faces) < len(fine.faces) <= info["faces"]
+
+
+def test_mesh_lod_outputs_depend_on_the_level_inputs():
+    plain = da.output_params_hashes(da.resolve_options({"voxel_resolution": 32}))
+    assert plain["complete"] == da.output_params_hashes(da.resolve_options({"voxel_resolution": 64}))["complete"]
+
+    lod = da.output_params_hashes(da.resolve_options({"mesh_lod": True, "voxel_resolution": 32}))
+    lod_64 = da.output_params_hashes(da.resolve_options({"mesh_lod": True, "voxel_resolution": 64}))
+    assert all(lod[output] != plain[output] for output in plain)
+    assert lod["complete"] != lod_64["complete"] and lod["partial"] != lod_64["partial"]
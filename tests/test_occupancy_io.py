@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from occupancy_io import (find_occupancy_file, load_occupancy, load_occupancy_batch, pack_occupancy, pack_occupancy_batch,
+                          save_occupancy, unpack_occupancy, unpack_occupancy_batch)
+
+
+# Function to draw boolean grids with a shape that is not a multiple of 8 voxels
+def random_grids(count, shape=(7, 5, 9), seed=0):
+    return np.random.default_rng(seed).random((count,) + shape) < 0.4
+
+
+def test_pack_round_trip():
+    grid = random_grids(1)[0]
+    bits, shape = pack_occupancy(grid)
+    assert len(bits) == (grid.size + 7) // 8
+    np.testing.assert_array_equal(unpack_occupancy(bits, shape), grid)
+
+
+def test_batch_pack_matches_single():
+    grids = random_grids(4)
+    bits, shape = pack_occupancy_batch(grids)
+    for grid, row in zip(grids, bits):
+        np.testing.assert_array_equal(row, pack_occupancy(grid)[0])
+    np.testing.assert_array_equal(unpack_occupancy_batch(bits, shape), grids)
+
+
+@pytest.mark.parametrize("occupancy_format", ["dense", "packed", "packed_compressed"])
+def test_save_load_round_trip(tmp_path, occupancy_format):
+    grid = random_grids(1)[0].astype(int)
+    path = save_occupancy(str(tmp_path / "box_0.npy"), grid, occupancy_format)
+    assert find_occupancy_file(str(tmp_path / "box_0.npy")) == path
+    np.testing.assert_array_equal(load_occupancy(path) > 0, grid > 0)
+
+
+def test_load_batch_mixes_formats(tmp_path):
+    grids = random_grids(5)
+    formats = ["dense", "packed", "packed_compressed", "packed", "dense"]
+    paths = [save_occupancy(str(tmp_path / f"box_{i}.npy"), grid, occupancy_format)
+             for i, (grid, occupancy_format) in enumerate(zip(grids, formats))]
+    for loaded, grid in zip(load_occupancy_batch(paths), grids):
+        np.testing.assert_array_equal(loaded > 0, grid)
+
+
+def test_unknown_format_raises(tmp_path):
+    with pytest.raises(ValueError):
+        save_occupancy(str(tmp_path / "box_0.npy"), random_grids(1)[0], "gzip")
@@ -0,0 +1,97 @@
+import os
+
+import numpy as np
+import pytest
+import trimesh
+
+import data_augmentation as da
+import pipeline
+
+
+# Function to configure the pipeline for the scratch dataset, writing below directory
+def scratch_config(directory, **overrides):
+    return pipeline.load_config(meshes_dir=da.meshes_dir, output_dir=directory,
+                                artifact_dir=os.path.join(directory, "artifacts"), num_variants=7,
+                                num_train_variants=5, voxel_resolution=16, writer_threads=0, **overrides)
+
+
+# Function to read every file below some directories of a run
+def read_tree(root, *directories):
+    files = {}
+    for directory in directories:
+        for path, _, names in os.walk(os.path.join(root, directory)):
+            for name in names:
+                with open(os.path.join(path, name), "rb") as f:
+                    files[os.path.relpath(os.path.join(path, name), root)] = f.read()
+    return files
+
+
+def test_config_rejects_unknown_modes():
+    with pytest.raises(ValueError):
+        pipeline.load_config(variants="mirror")
+    with pytest.raises(ValueError):
+        pipeline.load_config(base_grid="hollow")
+    with pytest.raises(ValueError):
+        pipeline.load_config(base_grid="raw_surface", variants="rotate_base")
+    pipeline.load_config(base_grid="raw_surface", variants="rotate_base", outputs=["base"])
+
+
+def test_resampled_variants_match_data_augmentation(scratch_dataset):
+    directory = scratch_dataset()
+    da.main(num_workers=2, options={"voxel_resolution": 16})
+    expected = read_tree(directory, "input", "gt")
+
+    layout = {"partial": "input/{category}/{split}/{category}_{variant_id}_x.xyz",
+              "complete": "gt/{category}/{split}/{category}_{variant_id}_y.xyz",
+              "occupancy": "gt/{category}/{split}/{category}_{variant_id}.npy"}
+    config = scratch_config(str(directory) + "_pipeline", outputs=["variants"], layout=layout)
+    assert pipeline.main(config)["variants"] == 14
+    assert read_tree(config["output_dir"], "input", "gt") == expected
+
+    # A second run finds every output recorded and writes nothing
+    assert pipeline.main(config)["variants"] == 0
+
+
+def test_surface_grids_reproduce_the_old_scripts(scratch_dataset):
+    directory = scratch_dataset()
+    layout = {"base_occupancy": "occupancy_grids/{category}.npy"}
+    for base_grid in ("surface", "raw_surface"):
+        config = scratch_config(os.path.join(directory, base_grid), outputs=["base"], base_outputs=["base_occupancy"],
+                                base_grid=base_grid, layout=layout)
+        pipeline.main(config)
+        for category_name in ("ball", "box"):
+            mesh = trimesh.load(os.path.join(da.meshes_dir, f"{category_name}.ply"))
+            if base_grid == "surface":
+                vertices = pipeline.normalize_stage(config, np.asarray(mesh.vertices), mesh.faces)["vertices"]
+                mesh = trimesh.Trimesh(vertices=vertices, faces=mesh.faces, process=False)
+            expected = mesh.voxelized(pitch=(mesh.scale if base_grid == "raw_surface" else 1.0) / 16).matrix.astype(int)
+            grid = np.load(os.path.join(config["output_dir"], "occupancy_grids", f"{category_name}.npy"))
+            assert grid.dtype == expected.dtype and np.array_equal(grid, expected)
+
+
+# Function to list the stages of the artifacts built for all meshes
+def built_stages(config):
+    if not os.path.isdir(config["artifact_dir"]):
+        return set()
+    return {stage.split("-")[0] for mesh_dir in os.listdir(config["artifact_dir"])
+            for stage in os.listdir(os.path.join(config["artifact_dir"], mesh_dir))}
+
+
+def test_normalized_mesh_is_only_built_when_used(scratch_dataset):
+    directory = scratch_dataset()
+    pipeline.main(scratch_config(directory, outputs=["variants"]))
+    assert built_stages(scratch_config(directory)) == set()
+
+    pipeline.main(scratch_config(directory, outputs=["base"], base_outputs=["base_occupancy"], base_grid="raw_surface"))
+    assert built_stages(scratch_config(directory)) == {"base_grid"}
+
+    pipeline.main(scratch_config(directory, outputs=["base"], base_outputs=["base_complete"]))
+    assert built_stages(scratch_config(directory)) == {"base_grid", "normalized", "base_clouds"}
+
+
+def test_rotated_base_grids_cover_the_normalized_cube(scratch_dataset):
+    directory = scratch_dataset()
+    config = scratch_config(directory, variants="rotate_base", base_grid="surface")
+    pipeline.main(config)
+    grid = np.load(pipeline.output_path(config, "occupancy", "box", 0))
+    assert grid.shape == (16, 16, 16) and grid.any()
@@ -0,0 +1,46 @@
+import os
+
+import numpy as np
+import pytest
+
+from pointcloud_io import format_xyz, load_xyz, parse_xyz, save_xyz
+
+
+@pytest.mark.parametrize("values", [
+    np.random.default_rng(0).normal(scale=0.3, size=(500, 3)),
+    np.random.default_rng(1).uniform(-1e6, 1e6, size=(200, 3)),
+    (np.random.default_rng(2).integers(-10**7, 10**7, size=(300, 3)) + 0.5) / 1e6,
+    np.array([[0.0, -0.0, 1e-7], [-1e-7, 5e-7, -5e-7], [0.9999995, -0.9999995, 123.0000005]]),
+    np.array([[1e9, -3e12, 0.25], [np.inf, -np.inf, 2.0]]),
+])
+def test_format_xyz_matches_savetxt(tmp_path, values):
+    np.savetxt(tmp_path / "reference.xyz", values, fmt="%.6f")
+    assert format_xyz(values) == (tmp_path / "reference.xyz").read_bytes()
+
+
+def test_format_xyz_empty():
+    assert format_xyz(np.empty((0, 3))) == b""
+
+
+def test_xyz_sidecar_round_trip(tmp_path):
+    points = np.random.default_rng(3).normal(size=(100, 3))
+    path = str(tmp_path / "cloud.xyz")
+    save_xyz(points, path, binary=True)
+    np.testing.assert_allclose(load_xyz(path, prefer_binary=False), points, atol=5e-7)
+    np.testing.assert_array_equal(load_xyz(path), points.astype(np.float32))
+
+
+def test_parse_reads_savetxt_output(tmp_path):
+    points = np.random.default_rng(4).normal(size=(50, 3))
+    np.savetxt(tmp_path / "reference.xyz", points, fmt="%.6f")
+    np.testing.assert_array_equal(parse_xyz((tmp_path / "reference.xyz").read_bytes()), np.loadtxt(tmp_path / "reference.xyz"))
+    assert parse_xyz(b"").shape == (0, 3)
+
+
+def test_stale_sidecar_is_ignored(tmp_path):
+    path = str(tmp_path / "cloud.xyz")
+    save_xyz(np.zeros((4, 3)), path, binary=True)
+    save_xyz(np.ones((4, 3)), path, binary=False)
+    # The text file was rewritten after the sidecar, so the sidecar no longer describes it
+    os.utime(path, (os.path.getmtime(path) + 10,) * 2)
+    np.testing.assert_array_equal(load_xyz(path), np.ones((4, 3)))
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+import trimesh
+
+import data_augmentation as da
+from query_points import points_inside
+from voxelizer import grid_min, grid_size, voxelize_solid
+
+
+# Function to get the voxel centres of a grid in (x, y, z) index order
+def voxel_centres(resolution):
+    axis = grid_min + (np.arange(resolution) + 0.5) * grid_size / resolution
+    return np.stack(np.meshgrid(axis, axis, axis, indexing="ij"), axis=-1).reshape(-1, 3)
+
+
+# Boxes whose faces lie exactly on voxel centres or column rays check the ray offset and the tie rule
+@pytest.mark.parametrize("mesh", [trimesh.creation.icosphere(subdivisions=2, radius=0.4),
+                                  trimesh.creation.box(extents=(0.9375, 0.9375, 0.9375)),
+                                  trimesh.creation.box(extents=(0.8125, 0.5625, 0.9))],
+                         ids=["sphere", "cube_on_centres", "box"])
+def test_points_inside_matches_voxel_centres(mesh):
+    resolution = 16
+    solid = voxelize_solid(mesh.vertices, mesh.faces, resolution).reshape(-1)
+    np.testing.assert_array_equal(points_inside(mesh.triangles, voxel_centres(resolution)), solid)
+
+
+def test_points_inside_labels_a_box():
+    box = trimesh.creation.box(extents=(0.5, 0.5, 0.5))
+    points = np.random.default_rng(0).uniform(-0.5, 0.5, size=(2000, 3))
+    expected = np.all(np.abs(points) < 0.25, axis=1)
+    np.testing.assert_array_equal(points_inside(box.triangles, points, cells=4), expected)
+
+
+def test_query_points_stream_follows_the_variant_seed():
+    def draw(rng):
+        return rng.integers(0, 1 << 30, size=4)
+
+    np.testing.assert_array_equal(draw(da.query_points_rng("box", 3)), draw(da.variant_rngs("box", 3, count=4)[3]))
+    np.testing.assert_array_equal(draw(da.query_points_rng("box", 3, da.base_seed)), draw(da.query_points_rng("box", 3)))
+    assert not np.array_equal(draw(da.query_points_rng("box", 3, 1)), draw(da.query_points_rng("box", 3)))
+    # The first three streams are unchanged by drawing the query stream along with them
+    np.testing.assert_array_equal(draw(da.variant_rngs("box", 3)[2]), draw(da.variant_rngs("box", 3, count=4)[2]))
+
+
+def test_generated_query_points_depend_on_the_seed():
+    mesh = trimesh.creation.box(extents=(0.4, 0.7, 1.0))
+    options = da.resolve_options({"query_points": 256})
+    (points, inside, _), = da.generate_query_points(mesh, "box", [2], options)
+    (same, _, _), = da.generate_query_points(mesh, "box", [2], options, seed=da.base_seed)
+    (other, _, _), = da.generate_query_points(mesh, "box", [2], options, seed=1)
+    np.testing.assert_array_equal(points, same)
+    assert not np.array_equal(points, other)
+    assert 0 < inside.sum() < len(inside)
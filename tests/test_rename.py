@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+import data_augmentation as da
+import rename
+from catalog import Catalog
+
+
+# Function to list the files of the current dataset relative to its root
+def dataset_files():
+    files = set()
+    for directory in (da.input_dir, da.gt_dir):
+        for root, _, names in os.walk(directory):
+            files.update(os.path.relpath(os.path.join(root, name), os.path.dirname(directory)) for name in names)
+    return files
+
+
+@pytest.mark.parametrize("mode", ["catalog", "files"])
+def test_rename_keeps_catalog_and_manifests_in_sync(scratch_dataset, monkeypatch, mode):
+    directory = scratch_dataset(mode)
+    options = {"voxel_resolution": 16, "binary_sidecar": True, "query_points": 64}
+    da.main(num_workers=2, options=options)
+    if mode == "files":
+        os.remove(da.catalog_path)
+    for attribute in ("input_dir", "gt_dir", "manifest_dir", "catalog_path"):
+        monkeypatch.setattr(rename, attribute, getattr(da, attribute))
+
+    rename.main()
+    files = dataset_files()
+    assert len(files) == 2 * 7 * 6
+    assert {"input/box/train/0_x.xyz", "input/box/train/0_x.xyzb", "gt/box/train/0_y.xyz", "gt/box/train/0_y.xyzb",
+            "gt/box/train/0.npy", "gt/box/test/6_q.npz"} <= files
+    assert not any(os.path.basename(file).startswith(("box_", "ball_")) for file in files)
+
+    if mode == "catalog":
+        with Catalog(da.catalog_path) as catalog:
+            entries = catalog.query()
+        assert len(entries) == 14
+        assert all(os.path.exists(entry[column]) for entry in entries for column in rename.path_columns if entry[column])
+        assert entries[0]["partial_path"] == os.path.join(da.input_dir, "ball", "train", "0_x.xyz")
+
+    # The manifests point at the renamed files, so resuming finds every variant complete
+    assert da.main(num_workers=2, options=options)["variants"] == 0
+    assert dataset_files() == files
+    rename.main()
+    assert dataset_files() == files
@@ -0,0 +1,88 @@
+import os
+
+import numpy as np
+import pytest
+
+from shard_io import (create_shard, fit_occupancy_grid, open_shard, read_shard_occupancy, read_shard_variant,
+                      shard_exists, write_shard_row, write_shard_rows)
+
+
+# Function to draw the outputs of a block of variants
+def random_rows(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.normal(size=(count, 3, 3)).astype(np.float32), rng.normal(size=(count, 16, 3)).astype(np.float32),
+            rng.normal(size=(count, 32, 3)).astype(np.float32), rng.random((count, 8, 8, 8)) < 0.3)
+
+
+@pytest.mark.parametrize("packed_occupancy", [False, True])
+def test_rows_round_trip(tmp_path, packed_occupancy):
+    directory = str(tmp_path / "box" / "train")
+    assert create_shard(directory, 5, (16, 3), (32, 3), (8, 8, 8), packed_occupancy=packed_occupancy)
+    assert shard_exists(directory, 5, packed_occupancy, (16, 3), (32, 3), (8, 8, 8))
+    assert not shard_exists(directory, 5, packed_occupancy, (16, 3), (32, 3), (16, 16, 16))
+    assert not shard_exists(directory, 6, packed_occupancy)
+
+    rotations, partials, completes, grids = random_rows(5)
+    shard = open_shard(directory, mode="r+")
+    np.testing.assert_array_equal(shard["variant_ids"], -1)
+    write_shard_rows(shard, 0, [10, 11, 12], rotations[:3], partials[:3], completes[:3], grids[:3])
+    write_shard_row(shard, 4, 14, rotations[4], partials[4], completes[4], grids[4])
+    del shard
+
+    shard = open_shard(directory)
+    np.testing.assert_array_equal(shard["variant_ids"], [10, 11, 12, -1, 14])
+    np.testing.assert_array_equal(read_shard_occupancy(shard, [0, 1, 2, 4]), grids[[0, 1, 2, 4]])
+    partial, complete, grid = read_shard_variant(directory, 14)
+    np.testing.assert_array_equal(partial, partials[4])
+    np.testing.assert_array_equal(complete, completes[4])
+    np.testing.assert_array_equal(grid, grids[4])
+    with pytest.raises(KeyError):
+        read_shard_variant(directory, 13)
+
+
+def test_row_outputs_left_out_are_kept(tmp_path):
+    directory = str(tmp_path / "shard")
+    create_shard(directory, 1, (16, 3), (32, 3), (8, 8, 8))
+    rotations, partials, completes, grids = random_rows(2)
+    shard = open_shard(directory, mode="r+")
+    write_shard_row(shard, 0, 0, rotations[0], partials[0], completes[0], grids[0])
+    write_shard_row(shard, 0, 0, rotations[0], partials[1], None, None)
+    np.testing.assert_array_equal(shard["partial"][0], partials[1])
+    np.testing.assert_array_equal(shard["complete"][0], completes[0])
+    np.testing.assert_array_equal(read_shard_occupancy(shard, 0)[0], grids[0])
+
+
+def test_replace_swaps_the_shard_atomically(tmp_path):
+    directory = str(tmp_path / "shard")
+    create_shard(directory, 3, (16, 3), (32, 3), (8, 8, 8))
+    # Without replace the shard already in place wins
+    assert not create_shard(directory, 4, (16, 3), (32, 3), (8, 8, 8), replace=False)
+    assert shard_exists(directory, 3)
+    assert create_shard(directory, 4, (16, 3), (32, 3), (8, 8, 8), replace=True)
+    assert shard_exists(directory, 4)
+    assert sorted(os.listdir(tmp_path)) == ["shard"]
+
+
+def test_fit_occupancy_grid_centres():
+    grid = np.arange(4 * 6 * 5).reshape(4, 6, 5)
+    fitted = fit_occupancy_grid(grid, (6, 4, 5))
+    np.testing.assert_array_equal(fitted[1:5], grid[:, 1:5])
+    assert not fitted[0].any() and not fitted[5].any()
+    np.testing.assert_array_equal(fit_occupancy_grid(grid, grid.shape), grid)
+
+
+def test_packed_run_matches_loose_files(scratch_dataset):
+    import data_augmentation as da
+    from pointcloud_io import load_xyz
+
+    da.main(num_workers=2, unit_size=3, options={"voxel_resolution": 16, "output_format": "packed"})
+    packed_dir = da.packed_dir
+    scratch_dataset("loose")
+    da.main(num_workers=2, unit_size=3, options={"voxel_resolution": 16, "binary_sidecar": True})
+    for variant_id in range(7):
+        split, _ = da.variant_split(variant_id)
+        partial, complete, grid = read_shard_variant(os.path.join(packed_dir, "ball", split), variant_id)
+        partial_path, complete_path, occupancy_path = da.variant_paths("ball", variant_id)
+        np.testing.assert_array_equal(partial, load_xyz(partial_path))
+        np.testing.assert_array_equal(complete, load_xyz(complete_path))
+        np.testing.assert_array_equal(grid, np.load(occupancy_path) > 0)
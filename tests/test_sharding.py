@@ -0,0 +1,90 @@
+import os
+
+import numpy as np
+
+import data_augmentation as da
+from manifest import Manifest
+from sharding import assign_shards, merge_shard_manifests, shard_manifest_dir, shard_units
+
+
+# Function to read every loose output file of the current dataset directories
+def read_outputs():
+    files = {}
+    for directory in (da.input_dir, da.gt_dir):
+        for root, _, names in os.walk(directory):
+            for name in names:
+                with open(os.path.join(root, name), "rb") as f:
+                    files[os.path.relpath(os.path.join(root, name), directory)] = f.read()
+    return files
+
+
+def test_assignment_is_balanced_and_deterministic():
+    weights = list(np.random.default_rng(0).integers(1, 100, size=40))
+    assignment = assign_shards(weights, 4)
+    assert assignment == assign_shards(list(weights), 4)
+    loads = np.bincount(assignment, weights=weights, minlength=4)
+    assert loads.max() - loads.min() <= max(weights)
+
+
+def test_shards_partition_the_units():
+    units = [("mesh.ply", "mesh", start, start + 5) for start in range(0, 50, 5)]
+    weights = list(range(1, 11))
+    shards = [shard_units(units, 3, index, weights) for index in range(3)]
+    assert sorted(unit for shard in shards for unit in shard) == sorted(units)
+    assert all(shard == sorted(shard, key=units.index) for shard in shards)
+
+
+def test_sharded_run_matches_a_single_node_run(scratch_dataset):
+    options = {"voxel_resolution": 16}
+    da.main(num_workers=2, unit_size=2, options=options)
+    single = read_outputs()
+
+    scratch_dataset("sharded")
+    for shard_index in range(3):
+        da.main(num_workers=2, unit_size=2, options=options, num_shards=3, shard_index=shard_index)
+    assert merge_shard_manifests(da.manifest_dir, 3) == {"ball": 0, "box": 0}
+    assert read_outputs() == single
+    assert not os.listdir(shard_manifest_dir(da.manifest_dir, 0))
+
+    # Merged records are still found by the shards, and by a single-node run
+    assert da.main(num_workers=2, unit_size=2, options=options, num_shards=3, shard_index=1)["variants"] == 0
+    assert da.main(num_workers=2, unit_size=2, options=options)["variants"] == 0
+
+
+def test_leftover_shard_manifests_are_ignored(scratch_dataset):
+    # An unmerged shard of an earlier three-shard run with other parameters
+    da.main(num_workers=2, unit_size=2, options={"voxel_resolution": 8}, num_shards=3, shard_index=2)
+    for shard_index in range(2):
+        da.main(num_workers=2, unit_size=2, options={"voxel_resolution": 16}, num_shards=2, shard_index=shard_index)
+    merge_shard_manifests(da.manifest_dir, 2)
+
+    hashes = da.output_params_hashes(da.resolve_options({"voxel_resolution": 16}))
+    for category_name in ("ball", "box"):
+        manifest = Manifest(da.manifest_path(category_name))
+        mesh_hash = da.mesh_file_hash(os.path.join(da.meshes_dir, f"{category_name}.ply"))
+        for variant_id in range(7):
+            assert manifest.is_complete(variant_id, "occupancy", mesh_hash, hashes["occupancy"])
+            assert np.load(da.variant_paths(category_name, variant_id)[2]).shape == (16, 16, 16)
+
+
+def test_only_records_in_several_shards_conflict(scratch_dataset):
+    options = {"voxel_resolution": 16}
+    for shard_index in range(2):
+        da.main(num_workers=2, unit_size=2, options=options, num_shards=2, shard_index=shard_index)
+    merge_shard_manifests(da.manifest_dir, 2)
+
+    # Regenerating variants on shard 0 updates the dataset records without conflicts
+    options = {"voxel_resolution": 16, "resume": False}
+    da.main(num_workers=2, unit_size=2, options=options, num_shards=2, shard_index=0)
+    assert set(merge_shard_manifests(da.manifest_dir, 2).values()) == {0}
+
+    # The same variant output recorded by two shards is a conflict
+    da.main(num_workers=2, unit_size=2, options=options, num_shards=2, shard_index=0)
+    shard_zero = Manifest(da.manifest_path("box", 0))
+    copy = Manifest(da.manifest_path("box", 1))
+    variant_id = next(iter(shard_zero.variants))
+    copy.variants[variant_id] = {output: {**entry} for output, entry in shard_zero.variants[variant_id].items()}
+    for entry in copy.variants[variant_id].values():
+        entry["params_hash"] = "other"
+    copy.save()
+    assert merge_shard_manifests(da.manifest_dir, 2)["box"] == len(shard_zero.variants[variant_id])
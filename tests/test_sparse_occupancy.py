@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+import trimesh
+
+from occupancy_io import load_occupancy, save_occupancy
+from surface_sampler import SurfaceSampler
+from voxelizer import densify_intervals, voxelize_intervals, voxelize_intervals_batch, voxelize_solid, voxelize_solid_batch
+
+
+# Function to get a few random proper rotations
+def random_rotations(count, seed=0):
+    q, r = np.linalg.qr(np.random.default_rng(seed).normal(size=(count, 3, 3)))
+    q = q * np.sign(np.diagonal(r, axis1=1, axis2=2))[:, None, :]
+    return q * np.sign(np.linalg.det(q))[:, None, None]
+
+
+@pytest.fixture
+def sphere():
+    return trimesh.creation.icosphere(subdivisions=2, radius=0.4)
+
+
+
+@pytest.mark.parametrize("resolution", [8, 16, 32])
+def test_sparse_densify_matches_dense(sphere, resolution):
+    mesh = trimesh.creation.torus(major_radius=0.3, minor_radius=0.12)
+    dense = voxelize_solid(mesh.vertices, mesh.faces, resolution)
+    np.testing.assert_array_equal(densify_intervals(voxelize_intervals(mesh.vertices, mesh.faces, resolution)), dense)
+
+    sampler = SurfaceSampler.from_mesh(sphere)
+    linear, offset = sampler.cubic_normalization(random_rotations(3))
+    dense_batch = voxelize_solid_batch(sphere.vertices, sphere.faces, linear, offset, resolution)
+    sparse_batch = voxelize_intervals_batch(sphere.vertices, sphere.faces, linear, offset, resolution)
+    for b in range(3):
+        np.testing.assert_array_equal(densify_intervals(sparse_batch[b]), dense_batch[b])
+
+
+def test_other_resolutions_are_exact_along_z():
+    box = trimesh.creation.box(extents=(0.53, 0.31, 0.77))
+    sparse = voxelize_intervals(box.vertices, box.faces, 16)
+    densified = densify_intervals(sparse, 64)
+    # Heights are tested at the 64 fine centres, x and y at the centre of the nearest of the 16 encoded columns
+    fine = -0.5 + (np.arange(64) + 0.5) / 64
+    coarse = -0.5 + (np.arange(64) // 4 + 0.5) / 16
+    half = box.extents / 2
+    expected = ((np.abs(coarse) < half[0])[:, None, None] & (np.abs(coarse) < half[1])[None, :, None]
+                & (np.abs(fine) < half[2])[None, None, :])
+    np.testing.assert_array_equal(densified, expected)
+
+
+def test_sparse_file_round_trip(tmp_path, sphere):
+    path = save_occupancy(str(tmp_path / "ball_0.npy"), voxelize_intervals(sphere.vertices, sphere.faces, 16), "sparse")
+    np.testing.assert_array_equal(load_occupancy(path), voxelize_solid(sphere.vertices, sphere.faces, 16))
+    assert load_occupancy(path, 32).shape == (32, 32, 32)
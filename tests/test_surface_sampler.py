@@ -0,0 +1,130 @@
+import numpy as np
+import pytest
+import trimesh
+
+from surface_sampler import SurfaceSampler, clip_triangles, farthest_point_sampling
+
+
+# Function to get a few random proper rotations
+def random_rotations(count, seed=0):
+    q, r = np.linalg.qr(np.random.default_rng(seed).normal(size=(count, 3, 3)))
+    q = q * np.sign(np.diagonal(r, axis1=1, axis2=2))[:, None, :]
+    return q * np.sign(np.linalg.det(q))[:, None, None]
+
+
+# Function to get the total area of a (M, 3, 3) triangle soup
+def total_area(triangles):
+    edges = triangles[:, 1:] - triangles[:, :1]
+    return 0.5 * np.linalg.norm(np.cross(edges[:, 0], edges[:, 1]), axis=1).sum()
+
+
+@pytest.fixture
+def sphere():
+    return trimesh.creation.icosphere(subdivisions=2, radius=0.4)
+
+
+def test_face_areas_match_transformed_mesh(sphere):
+    sampler = SurfaceSampler.from_mesh(sphere)
+    linear, offset = sampler.cubic_normalization(random_rotations(4))
+    areas = sampler.face_areas(linear)
+    for b in range(len(linear)):
+        np.testing.assert_allclose(areas[b], sampler.transformed_mesh(linear[b], offset[b]).area_faces, rtol=1e-10)
+
+
+
+def test_cubic_normalization_fills_the_unit_cube():
+    sampler = SurfaceSampler.from_mesh(trimesh.creation.box(extents=(0.4, 0.7, 1.0)))
+    linear, offset = sampler.cubic_normalization(random_rotations(4))
+    for b in range(4):
+        bounds = sampler.transformed_mesh(linear[b], offset[b]).bounds
+        np.testing.assert_allclose(bounds, [[-0.5] * 3, [0.5] * 3], atol=1e-12)
+
+
+def test_samples_lie_on_the_mapped_surface():
+    box = trimesh.creation.box(extents=(0.4, 0.7, 1.0))
+    sampler = SurfaceSampler.from_mesh(box)
+    linear, offset = sampler.cubic_normalization(random_rotations(3))
+    points = sampler.sample(linear, offset, 2000, [np.random.default_rng(b) for b in range(3)])
+    for b in range(3):
+        local = np.linalg.solve(linear[b], (points[b] - offset[b]).T).T
+        # Every point is on a face of the box, and the faces get points in proportion to their area
+        on_face = np.isclose(np.abs(local), box.extents / 2, atol=1e-9)
+        assert np.all(on_face.sum(axis=1) >= 1)
+        mapped = sampler.transformed_mesh(linear[b], offset[b])
+        fraction = [on_face[:, axis].mean() for axis in range(3)]
+        expected = [mapped.area_faces[np.abs(box.face_normals[:, axis]) > 0.5].sum() / mapped.area for axis in range(3)]
+        np.testing.assert_allclose(fraction, expected, atol=0.04)
+
+
+
+def test_clip_right_triangle():
+    triangle = np.array([[[0.0, 0.0, 0.0], [1.0, 0.0, 0.0], [0.0, 1.0, 0.0]]])
+    # x < 0.5 removes the corner triangle with legs 0.5, x < -1 and x < 2 keep nothing and everything
+    assert total_area(clip_triangles(triangle, (1.0, 0.0, 0.0), 0.5)) == pytest.approx(0.375)
+    assert total_area(clip_triangles(triangle, (-1.0, 0.0, 0.0), -0.5)) == pytest.approx(0.125)
+    assert len(clip_triangles(triangle, (1.0, 0.0, 0.0), -1.0)) == 0
+    np.testing.assert_array_equal(clip_triangles(triangle, (1.0, 0.0, 0.0), 2.0), triangle)
+    # The diagonal cut x + y < 0.5 keeps a triangle with legs 0.5 only
+    assert total_area(clip_triangles(triangle, (1.0, 1.0, 0.0), 0.5)) == pytest.approx(0.125)
+
+
+def test_clip_cube_surface():
+    box = trimesh.creation.box(extents=(1.0, 1.0, 1.0))
+    # Below z = 0.1 lie the bottom face and 0.6 of each of the four side faces
+    clipped = clip_triangles(box.triangles, (0.0, 0.0, 1.0), 0.1)
+    assert total_area(clipped) == pytest.approx(1.0 + 4 * 0.6)
+    assert clipped[:, :, 2].max() <= 0.1 + 1e-12
+
+
+def test_clip_halves_add_up(sphere):
+    rng = np.random.default_rng(4)
+    for _ in range(10):
+        normal = rng.normal(size=3)
+        distance = rng.uniform(-0.3, 0.3)
+        below = clip_triangles(sphere.triangles, normal, distance)
+        above = clip_triangles(sphere.triangles, -normal, -distance)
+        assert total_area(below) + total_area(above) == pytest.approx(sphere.area)
+        # Vertex order is kept, so every piece faces the way its source triangle does
+        centre_side = np.einsum("mi,mi->m", np.cross(below[:, 1] - below[:, 0], below[:, 2] - below[:, 0]), below.mean(axis=1))
+        assert np.all(centre_side > -1e-12)
+
+
+def test_half_space_samples_stay_inside(sphere):
+    sampler = SurfaceSampler.from_mesh(sphere)
+    linear, offset = sampler.cubic_normalization(random_rotations(3))
+    rngs = [np.random.default_rng(b) for b in range(3)]
+    points = sampler.sample_half_space(linear, offset, 1000, rngs, (0.0, 0.0, 1.0), 0.1)
+    assert points.shape == (3, 1000, 3)
+    assert points[:, :, 2].max() < 0.1 + 1e-9
+
+
+def test_half_space_samples_are_uniform():
+    # Below z = 0 a unit cube keeps its bottom face and the lower halves of the sides: 1 + 4 * 0.5
+    box = trimesh.creation.box(extents=(1.0, 1.0, 1.0))
+    sampler = SurfaceSampler.from_mesh(box)
+    points = sampler.sample_half_space(np.eye(3)[None], np.zeros((1, 3)), 30000, [np.random.default_rng(0)])[0]
+    assert np.isclose(points[:, 2], -0.5).mean() == pytest.approx(1.0 / 3.0, abs=0.01)
+    assert np.histogram(points[points[:, 2] > -0.5, 2], bins=5, range=(-0.5, 0.0))[0].std() < 100
+
+
+def test_batched_fps_matches_single_clouds():
+    clouds = np.random.default_rng(5).normal(size=(4, 300, 3))
+    picked = farthest_point_sampling(clouds, 50, [np.random.default_rng(b) for b in range(4)])
+    for b in range(4):
+        single = farthest_point_sampling(clouds[b:b + 1], 50, [np.random.default_rng(b)])[0]
+        np.testing.assert_array_equal(picked[b], single)
+        # Every pick is one of the candidates and none is picked twice
+        matches = (picked[b][:, None, :] == clouds[b][None]).all(axis=2)
+        assert np.all(matches.sum(axis=1) == 1)
+        assert len(np.unique(matches.argmax(axis=1))) == 50
+
+
+def test_fps_spreads_the_picks():
+    cloud = np.random.default_rng(1).uniform(-0.5, 0.5, size=(1, 2000, 3))
+    picked = farthest_point_sampling(cloud, 64, [np.random.default_rng(0)])[0]
+
+    def min_spacing(points):
+        distances = np.linalg.norm(points[:, None] - points[None], axis=2)
+        return distances[np.triu_indices(len(points), 1)].min()
+
+    assert min_spacing(picked) > 2 * min_spacing(cloud[0, :64])
@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+import pytest
+
+import data_augmentation as da
+from pointcloud_io import load_xyz, save_xyz
+from validate import validate_dataset
+
+
+# Function to validate the current dataset at the test resolution
+def run_validation(tmp_path, layout, num_workers=1):
+    return validate_dataset(layout, resolution=16, num_workers=num_workers, report_path=str(tmp_path / "report.json"),
+                            progress=False)
+
+
+@pytest.mark.parametrize("layout", ["files", "packed"])
+def test_generated_dataset_is_valid(scratch_dataset, tmp_path, layout):
+    scratch_dataset(layout)
+    da.main(num_workers=2, options={"voxel_resolution": 16, "output_format": layout})
+    report = run_validation(tmp_path, layout, num_workers=2)
+    assert report["summary"]["valid"]
+    assert report["summary"]["variants_checked"] == report["summary"]["variants_valid"] == 14
+    train = report["categories"]["box"]["train"]
+    assert train["valid"] == train["expected"] == 5
+    assert 0 < train["fill_ratio"]["min"] <= train["fill_ratio"]["max"] < 1
+    assert np.all(np.asarray(train["points"]["complete"]["max"]) <= 0.5 + 1e-3)
+    assert os.path.exists(tmp_path / "report.json")
+
+
+def test_damaged_outputs_are_reported(scratch_dataset, tmp_path):
+    scratch_dataset()
+    da.main(num_workers=2, options={"voxel_resolution": 16})
+
+    # A cloud padded with a repeated point, a truncated cloud, a missing grid, an empty grid and a stray file
+    partial_path, _, _ = da.variant_paths("box", 0)
+    cloud = load_xyz(partial_path, prefer_binary=False)
+    cloud[1] = cloud[0]
+    save_xyz(cloud, partial_path)
+    _, complete_path, _ = da.variant_paths("box", 1)
+    save_xyz(load_xyz(complete_path, prefer_binary=False)[:100], complete_path)
+    os.remove(da.variant_paths("box", 2)[2])
+    np.save(da.variant_paths("box", 5)[2], np.zeros((16, 16, 16), dtype=np.uint8))
+    open(os.path.join(os.path.dirname(partial_path), "notes.txt"), "w").close()
+
+    report = run_validation(tmp_path, "files")
+    assert not report["summary"]["valid"]
+    train, test = report["categories"]["box"]["train"], report["categories"]["box"]["test"]
+    assert train["problems"]["duplicate_points"] == {"partial": [0]}
+    assert train["problems"]["wrong_shape"] == {"complete": [1]}
+    assert train["problems"]["missing"] == {"occupancy": [2]}
+    assert test["problems"]["empty_grid"] == {"occupancy": [5]}
+    assert train["unexpected_files"] == [os.path.join(os.path.dirname(partial_path), "notes.txt")]
+    assert train["valid"] == 2 and test["valid"] == 1
+    assert report["summary"]["problems"] == 5
+    assert all(not split["problems"] for split in report["categories"]["ball"].values())
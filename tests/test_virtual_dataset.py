@@ -0,0 +1,50 @@
+import numpy as np
+
+import data_augmentation as da
+from pointcloud_io import load_xyz
+from shard_io import read_shard_variant, shard_dir
+from virtual_dataset import LRUCache, VirtualDataset
+
+
+def test_lru_cache_evicts_the_oldest():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+
+def test_samples_match_the_written_files(scratch_dataset):
+    options = {"voxel_resolution": 16}
+    da.main(num_workers=2, unit_size=4, options=options)
+    dataset = VirtualDataset("test", options=options)
+    assert len(dataset) == 2 * 2
+    for sample in dataset.get_batch(range(len(dataset))):
+        partial_path, complete_path, occupancy_path = da.variant_paths(sample["category"], sample["variant_id"])
+        np.testing.assert_array_equal(sample["partial"], load_xyz(partial_path))
+        np.testing.assert_array_equal(sample["complete"], load_xyz(complete_path))
+        np.testing.assert_array_equal(sample["occupancy"], np.load(occupancy_path))
+
+
+def test_samples_match_the_packed_shards(scratch_dataset):
+    options = {"voxel_resolution": 16, "output_format": "packed"}
+    da.main(num_workers=2, unit_size=4, options=options)
+    dataset = VirtualDataset("train", mesh_files=["box.ply"], options=options)
+    for sample in dataset.get_batch([4, 0, 2]):
+        partial, complete, occupancy = read_shard_variant(shard_dir(da.packed_dir, "box", "train"), sample["variant_id"])
+        np.testing.assert_array_equal(sample["partial"], partial)
+        np.testing.assert_array_equal(sample["complete"], complete)
+        np.testing.assert_array_equal(sample["occupancy"], occupancy)
+
+
+def test_iteration_does_not_depend_on_workers(scratch_dataset):
+    dataset = VirtualDataset(None, options={"voxel_resolution": 16})
+    inline = list(dataset.iterate(batch_size=3, shuffle=True, num_workers=0))
+    prefetched = list(dataset.iterate(batch_size=3, shuffle=True, num_workers=2, prefetch=1))
+    assert len(inline) == 5
+    for a, b in zip(inline, prefetched):
+        assert a["category"] == b["category"] and a["variant_id"] == b["variant_id"]
+        for key in ("rotation", "partial", "complete", "occupancy"):
+            np.testing.assert_array_equal(a[key], b[key])
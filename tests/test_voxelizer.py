@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+import trimesh
+
+from surface_sampler import SurfaceSampler
+from voxelizer import grid_min, grid_size, voxelize_solid, voxelize_solid_batch
+
+
+# Function to get the voxel centres of a grid in (x, y, z) index order
+def voxel_centres(resolution):
+    axis = grid_min + (np.arange(resolution) + 0.5) * grid_size / resolution
+    return np.stack(np.meshgrid(axis, axis, axis, indexing="ij"), axis=-1).reshape(-1, 3)
+
+
+# Function to get a few random proper rotations
+def random_rotations(count, seed=0):
+    q, r = np.linalg.qr(np.random.default_rng(seed).normal(size=(count, 3, 3)))
+    q = q * np.sign(np.diagonal(r, axis1=1, axis2=2))[:, None, :]
+    return q * np.sign(np.linalg.det(q))[:, None, None]
+
+
+@pytest.fixture
+def sphere():
+    return trimesh.creation.icosphere(subdivisions=2, radius=0.4)
+
+
+
+@pytest.mark.parametrize("mesh", [
+    trimesh.creation.icosphere(subdivisions=2, radius=0.4),
+    trimesh.creation.box(extents=(0.53, 0.31, 0.77)),
+    trimesh.creation.torus(major_radius=0.3, minor_radius=0.12),
+])
+def test_voxelize_solid_matches_contains(mesh):
+    resolution = 16
+    centres = voxel_centres(resolution)
+    solid = voxelize_solid(mesh.vertices, mesh.faces, resolution).reshape(-1)
+    contained = mesh.contains(centres)
+    # Centres within a hair of the surface may go either way
+    mismatched = centres[solid != contained]
+    if len(mismatched):
+        assert np.all(np.abs(trimesh.proximity.signed_distance(mesh, mismatched)) < 1e-4)
+    assert solid.sum() > 0
+
+
+def test_batch_voxelization_matches_single(sphere):
+    sampler = SurfaceSampler.from_mesh(sphere)
+    linear, offset = sampler.cubic_normalization(random_rotations(3))
+    grids = voxelize_solid_batch(sphere.vertices, sphere.faces, linear, offset, 16)
+    for b in range(3):
+        mapped = sampler.transformed_mesh(linear[b], offset[b])
+        np.testing.assert_array_equal(grids[b], voxelize_solid(mapped.vertices, mapped.faces, 16))
+
+
+def test_box_fills_the_centres_it_covers():
+    # Faces at +-0.265, +-0.155 and +-0.385 lie between voxel centres at resolution 16
+    box = trimesh.creation.box(extents=(0.53, 0.31, 0.77))
+    solid = voxelize_solid(box.vertices, box.faces, 16)
+    centres = voxel_centres(16).reshape(16, 16, 16, 3)
+    np.testing.assert_array_equal(solid, np.all(np.abs(centres) < box.extents / 2, axis=-1))
+
+
+def test_open_surface_does_not_leak():
+    box = trimesh.creation.box(extents=(0.53, 0.31, 0.77))
+    closed = voxelize_solid(box.vertices, box.faces, 16)
+    # Without its top the columns of the box cross the surface once below and never above
+    bottom_and_sides = box.faces[box.face_normals[:, 2] < 0.5]
+    assert not voxelize_solid(box.vertices, bottom_and_sides, 16).any()
+    assert closed.any()
@@ -0,0 +1,366 @@
+import os
+import json
+import time
+import zipfile
+import contextlib
+import argparse
+from multiprocessing import Pool
+import numpy as np
+import data_augmentation as augmentation
+from occupancy_io import find_occupancy_file, load_occupancy
+from pointcloud_io import load_xyz
+from shard_io import shard_dir, open_shard, read_shard_occupancy
+
+# Every category/split is cut into blocks of this many variants, each checked as one task of the process pool
+validation_block_size = 100
+
+# Outputs are normalized into [-0.5, 0.5]^3; the .xyz text rounding may push points out by this much
+bounds_tolerance = 1e-3
+
+# Problems a variant output can have
+#   missing           no file, or a shard row that was never written
+#   corrupt           the file or shard array cannot be read
+#   wrong_shape       a cloud with another point count, or a grid of another resolution
+#   non_finite        NaN or infinite coordinates
+#   duplicate_points  a cloud holding the same point twice, e.g. padded to its point count
+#   out_of_bounds     coordinates outside the normalized cube
+#   empty_grid        an occupancy grid without a single occupied voxel
+#   wrong_id          a shard row holding another variant than its position implies
+#   unexpected_file   a file in the output directories no variant of the split writes
+problem_kinds = ("missing", "corrupt", "wrong_shape", "non_finite", "duplicate_points", "out_of_bounds", "empty_grid",
+                 "wrong_id", "unexpected_file")
+
+# Errors raised when reading a damaged .xyz, .npy or .npz file
+read_errors = (OSError, ValueError, EOFError, KeyError, zipfile.BadZipFile)
+
+
+# Function to list the variant ids of a split
+def split_variant_ids(split):
+    if split == "train":
+        return list(range(augmentation.num_train_variants))
+    return list(range(augmentation.num_train_variants, augmentation.num_variants))
+
+
+# Function to list the categories found in the output directories of a layout
+def dataset_categories(layout="files"):
+    roots = (augmentation.input_dir, augmentation.gt_dir) if layout == "files" else (augmentation.packed_dir,)
+    return sorted({name for root in roots if os.path.isdir(root)
+                   for name in os.listdir(root) if os.path.isdir(os.path.join(root, name))})
+
+
+# Function to count the points of each cloud that repeat another point of the same cloud, clouds is (N, P, 3)
+def duplicate_counts(clouds):
+    """
+    Equal points have equal hashes of their coordinate bits, so each cloud's
+    hashes are sorted and only the clouds with a repeated hash are compared
+    point by point.
+    """
+    bits = np.ascontiguousarray(clouds, dtype=np.float64).view(np.uint64)
+    keys = np.sort(bits[:, :, 0] ^ (bits[:, :, 1] * np.uint64(0x9E3779B97F4A7C15)) ^ (bits[:, :, 2] * np.uint64(0xC2B2AE3D27D4EB4F)),
+                   axis=1)
+    counts = np.zeros(len(clouds), dtype=np.int64)
+    for index in np.flatnonzero((keys[:, 1:] == keys[:, :-1]).any(axis=1)):
+        counts[index] = len(clouds[index]) - len(np.unique(clouds[index], axis=0))
+    return counts
+
+
+# Function to create the empty result of one category/split
+def new_result(category_name, split, layout):
+    return {"category": category_name, "split": split, "layout": layout, "expected": len(split_variant_ids(split)),
+            "valid": 0, "problems": {}, "unexpected_files": [], "points": {}, "fill_ratio": None}
+
+
+# Function to record that some outputs of some variants have a problem
+def add_problem(result, kind, output, variant_ids):
+    variant_ids = [int(variant_id) for variant_id in variant_ids]
+    if variant_ids:
+        result["problems"].setdefault(kind, {}).setdefault(output, []).extend(variant_ids)
+
+
+# Function to check a block of point clouds and accumulate their bounding box statistics
+def check_clouds(result, output, variant_ids, clouds, num_points):
+    """
+    clouds holds one array per variant, or None when it was already reported
+    missing or corrupt. Returns a mask of the variants whose cloud passed.
+    """
+    present = np.array([cloud is not None for cloud in clouds], dtype=bool)
+    shaped = np.array([cloud is not None and np.shape(cloud) == (num_points, 3) for cloud in clouds], dtype=bool)
+    add_problem(result, "wrong_shape", output, np.asarray(variant_ids)[present & ~shaped])
+    if not shaped.any():
+        return shaped
+
+    ids = np.asarray(variant_ids)[shaped]
+    batch = np.stack([cloud for cloud, ok in zip(clouds, shaped) if ok]).astype(np.float64)
+    finite = np.isfinite(batch).all(axis=(1, 2))
+    duplicates = duplicate_counts(batch) > 0
+    lower, upper = batch.min(axis=1), batch.max(axis=1)
+    inside = finite & (lower >= -0.5 - bounds_tolerance).all(axis=1) & (upper <= 0.5 + bounds_tolerance).all(axis=1)
+    add_problem(result, "non_finite", output, ids[~finite])
+    add_problem(result, "duplicate_points", output, ids[duplicates])
+    add_problem(result, "out_of_bounds", output, ids[finite & ~inside])
+
+    # Bounding boxes are accumulated over the finite clouds only
+    stats = result["points"].setdefault(output, {"clouds": 0, "min": [np.inf] * 3, "max": [-np.inf] * 3,
+                                                 "extent_sum": [0.0] * 3})
+    if finite.any():
+        stats["clouds"] += int(finite.sum())
+        stats["min"] = np.minimum(stats["min"], lower[finite].min(axis=0)).tolist()
+        stats["max"] = np.maximum(stats["max"], upper[finite].max(axis=0)).tolist()
+        stats["extent_sum"] = (np.asarray(stats["extent_sum"]) + (upper - lower)[finite].sum(axis=0)).tolist()
+
+    passed = shaped.copy()
+    passed[shaped] = finite & ~duplicates & inside
+    return passed
+
+
+# Function to check a block of occupancy grids and accumulate their fill ratios
+def check_grids(result, variant_ids, grids, resolution):
+    present = np.array([grid is not None for grid in grids], dtype=bool)
+    shaped = np.array([grid is not None and np.shape(grid) == (resolution,) * 3 for grid in grids], dtype=bool)
+    add_problem(result, "wrong_shape", "occupancy", np.asarray(variant_ids)[present & ~shaped])
+    if not shaped.any():
+        return shaped
+
+    ids = np.asarray(variant_ids)[shaped]
+    fill = (np.stack([grid for grid, ok in zip(grids, shaped) if ok]) > 0).mean(axis=(1, 2, 3))
+    add_problem(result, "empty_grid", "occupancy", ids[fill == 0])
+
+    stats = result["fill_ratio"] or {"grids": 0, "min": 1.0, "max": 0.0, "sum": 0.0}
+    stats["grids"] += len(fill)
+    stats["min"] = min(stats["min"], float(fill.min()))
+    stats["max"] = max(stats["max"], float(fill.max()))
+    stats["sum"] += float(fill.sum())
+    result["fill_ratio"] = stats
+
+    passed = shaped.copy()
+    passed[shaped] = fill > 0
+    return passed
+
+
+# Function to check a block of variants given as their (partial, complete, occupancy) arrays, None when unreadable
+def check_block(result, variant_ids, partials, completes, grids, resolution):
+    passed = check_clouds(result, "partial", variant_ids, partials, augmentation.num_partial_points)
+    passed &= check_clouds(result, "complete", variant_ids, completes, augmentation.num_complete_points)
+    passed &= check_grids(result, variant_ids, grids, resolution)
+    result["valid"] += int(passed.sum())
+
+
+# Function to read one output file, recording it as missing or corrupt when that fails
+def read_output(result, output, variant_id, path, load):
+    if path is None or not os.path.exists(path):
+        add_problem(result, "missing", output, [variant_id])
+        return None
+    try:
+        return load(path)
+    except read_errors:
+        add_problem(result, "corrupt", output, [variant_id])
+        return None
+
+
+# Function to list the names of every file the variants of a split may write into the input and gt directories
+def expected_file_names(category_name, variant_ids):
+    names = set()
+    for variant_id in variant_ids:
+        stem = f"{category_name}_{variant_id}"
+        names.update({f"{stem}_x.xyz", f"{stem}_x.xyzb", f"{stem}_y.xyz", f"{stem}_y.xyzb", f"{stem}.npy", f"{stem}.npz",
+                      f"{stem}_q.npz"})
+    return names
+
+
+# Function to validate the loose _x/_y/.npy files of some variants of one category/split
+def validate_files(category_name, split, variant_ids, resolution):
+    result = new_result(category_name, split, "files")
+
+    # Stray files are listed once per split, by the task holding its first variant
+    if variant_ids[0] == split_variant_ids(split)[0]:
+        expected = expected_file_names(category_name, split_variant_ids(split))
+        for root in (augmentation.input_dir, augmentation.gt_dir):
+            directory = os.path.join(root, category_name, split)
+            if os.path.isdir(directory):
+                result["unexpected_files"].extend(os.path.join(directory, name) for name in sorted(os.listdir(directory))
+                                                  if name not in expected)
+
+    partials, completes, grids = [], [], []
+    for variant_id in variant_ids:
+        partial_path, complete_path, occupancy_path = augmentation.variant_paths(category_name, variant_id)
+        try:
+            occupancy_path = find_occupancy_file(occupancy_path)
+        except FileNotFoundError:
+            occupancy_path = None
+
+        # The text files are what training reads, so binary sidecars are not preferred here
+        partials.append(read_output(result, "partial", variant_id, partial_path, lambda p: load_xyz(p, prefer_binary=False)))
+        completes.append(read_output(result, "complete", variant_id, complete_path, lambda p: load_xyz(p, prefer_binary=False)))
+        grids.append(read_output(result, "occupancy", variant_id, occupancy_path, load_occupancy))
+    check_block(result, variant_ids, partials, completes, grids, resolution)
+    return result
+
+
+# Function to validate some variants of the packed shard of one category/split
+def validate_shard(category_name, split, variant_ids, resolution):
+    result = new_result(category_name, split, "packed")
+    variant_ids = np.asarray(variant_ids)
+    directory = shard_dir(augmentation.packed_dir, category_name, split)
+    if not os.path.isdir(directory):
+        for output in augmentation.variant_outputs:
+            add_problem(result, "missing", output, variant_ids)
+        return result
+    try:
+        shard = open_shard(directory)
+        stored_ids = np.asarray(shard["variant_ids"])
+    except read_errors:
+        for output in augmentation.variant_outputs:
+            add_problem(result, "corrupt", output, variant_ids)
+        return result
+
+    # Rows past the end of a short shard count as never written
+    rows = variant_ids - split_variant_ids(split)[0]
+    found = np.full(len(rows), -1)
+    in_shard = rows < len(stored_ids)
+    found[in_shard] = stored_ids[rows[in_shard]]
+    for output in augmentation.variant_outputs:
+        add_problem(result, "missing", output, variant_ids[found == -1])
+    add_problem(result, "wrong_id", "shard", variant_ids[(found != -1) & (found != variant_ids)])
+
+    written = found == variant_ids
+    try:
+        partials = list(np.asarray(shard["partial"][rows[written]]))
+        completes = list(np.asarray(shard["complete"][rows[written]]))
+        grids = list(read_shard_occupancy(shard, rows[written]))
+    except read_errors:
+        for output in augmentation.variant_outputs:
+            add_problem(result, "corrupt", output, variant_ids[written])
+        return result
+    check_block(result, variant_ids[written], partials, completes, grids, resolution)
+    return result
+
+
+# Function run by the pool workers on one (category, split, layout, first variant, stop, resolution) task
+def validate_task(task):
+    category_name, split, layout, start, stop, resolution = task
+    variant_ids = list(range(start, stop))
+    if layout == "packed":
+        return validate_shard(category_name, split, variant_ids, resolution)
+    return validate_files(category_name, split, variant_ids, resolution)
+
+
+# Function to add the result of one task to the result of its category/split
+def merge_results(total, part):
+    total["valid"] += part["valid"]
+    total["unexpected_files"].extend(part["unexpected_files"])
+    for kind, outputs in part["problems"].items():
+        for output, variant_ids in outputs.items():
+            add_problem(total, kind, output, variant_ids)
+    for output, stats in part["points"].items():
+        if output not in total["points"]:
+            total["points"][output] = stats
+            continue
+        merged = total["points"][output]
+        merged["clouds"] += stats["clouds"]
+        merged["min"] = np.minimum(merged["min"], stats["min"]).tolist()
+        merged["max"] = np.maximum(merged["max"], stats["max"]).tolist()
+        merged["extent_sum"] = (np.asarray(merged["extent_sum"]) + stats["extent_sum"]).tolist()
+    if part["fill_ratio"] is not None:
+        if total["fill_ratio"] is None:
+            total["fill_ratio"] = part["fill_ratio"]
+        else:
+            merged = total["fill_ratio"]
+            merged["grids"] += part["fill_ratio"]["grids"]
+            merged["min"] = min(merged["min"], part["fill_ratio"]["min"])
+            merged["max"] = max(merged["max"], part["fill_ratio"]["max"])
+            merged["sum"] += part["fill_ratio"]["sum"]
+    return total
+
+
+# Function to turn the accumulated sums of a result into the reported statistics
+def summarize_result(result):
+    for stats in result["points"].values():
+        extent_sum = stats.pop("extent_sum")
+        stats["mean_extent"] = [value / stats["clouds"] for value in extent_sum] if stats["clouds"] else None
+        if not stats["clouds"]:
+            stats["min"] = stats["max"] = None
+    if result["fill_ratio"] is not None:
+        stats = result["fill_ratio"]
+        stats["mean"] = stats.pop("sum") / stats["grids"]
+    for outputs in result["problems"].values():
+        for output in outputs:
+            outputs[output] = sorted(set(outputs[output]))
+    if result["unexpected_files"]:
+        result["problems"]["unexpected_file"] = {"files": len(result["unexpected_files"])}
+    result["num_problems"] = sum(len(ids) if isinstance(ids, list) else ids
+                                 for outputs in result["problems"].values() for ids in outputs.values())
+    return result
+
+
+# Function to validate a generated dataset, returns the report
+def validate_dataset(layout="files", categories=None, resolution=None, num_workers=1, report_path=None, progress=True):
+    """
+    Checks every variant of every category and split: that its outputs exist
+    and load, their point counts and grid resolution, NaNs, duplicated points,
+    coordinates outside the normalized cube and empty grids. Also reports the
+    valid variant count of each split against the expected train/test counts,
+    the occupancy fill ratios and the bounding boxes of the clouds.
+    """
+    resolution = resolution or augmentation.voxel_resolution
+    categories = categories or dataset_categories(layout)
+    report_path = report_path or os.path.join(augmentation.report_dir, f"validation_{time.strftime('%Y%m%d_%H%M%S')}.json")
+
+    # Splits are cut into blocks so the long train splits spread over the workers like the test splits
+    report = {category_name: {} for category_name in categories}
+    tasks = []
+    for category_name in categories:
+        for split in ("train", "test"):
+            variant_ids = split_variant_ids(split)
+            report[category_name][split] = new_result(category_name, split, layout)
+            tasks.extend((category_name, split, layout, variant_ids[start], variant_ids[min(start + validation_block_size, len(variant_ids)) - 1] + 1,
+                          resolution) for start in range(0, len(variant_ids), validation_block_size))
+
+    start_time = time.perf_counter()
+    with (Pool(num_workers) if num_workers > 1 else contextlib.nullcontext()) as pool:
+        parts = pool.imap_unordered(validate_task, tasks) if pool is not None else map(validate_task, tasks)
+        for part in parts:
+            merge_results(report[part["category"]][part["split"]], part)
+
+    results = [summarize_result(result) for splits in report.values() for result in splits.values()]
+    if progress:
+        for result in results:
+            if result["num_problems"]:
+                print(f"{result['category']}/{result['split']}: {result['valid']}/{result['expected']} valid, "
+                      f"{', '.join(kind for kind in problem_kinds if kind in result['problems'])}")
+    summary = {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "layout": layout,
+        "voxel_resolution": resolution,
+        "num_variants": augmentation.num_variants,
+        "num_train_variants": augmentation.num_train_variants,
+        "categories": len(categories),
+        "variants_checked": sum(result["expected"] for result in results),
+        "variants_valid": sum(result["valid"] for result in results),
+        "problems": sum(result["num_problems"] for result in results),
+        "seconds": time.perf_counter() - start_time,
+    }
+    summary["valid"] = summary["problems"] == 0
+    full_report = {"summary": summary, "categories": report}
+    os.makedirs(os.path.dirname(report_path) or ".", exist_ok=True)
+    with open(report_path, "w") as f:
+        json.dump(full_report, f, indent=2)
+    if progress:
+        print(f"Checked {summary['variants_checked']} variants of {summary['categories']} categories in "
+              f"{summary['seconds']:.1f}s: {summary['variants_valid']} valid, {summary['problems']} problems, "
+              f"report written to {report_path}")
+    return full_report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validate a generated dataset and report per-category statistics")
+    parser.add_argument("--layout", choices=["files", "packed"], default=augmentation.default_options["output_format"],
+                        help="loose files per variant or packed per-category shards")
+    parser.add_argument("--categories", nargs="+", default=None, help="categories to check (default: all found)")
+    parser.add_argument("--voxel-resolution", type=int, default=augmentation.voxel_resolution,
+                        help="expected resolution of the occupancy grids")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--report", default=None, help="JSON report path (default: a timestamped file in the reports directory)")
+    args = parser.parse_args()
+
+    full_report = validate_dataset(args.layout, args.categories, args.voxel_resolution, args.workers, args.report)
+    raise SystemExit(0 if full_report["summary"]["valid"] else 1)
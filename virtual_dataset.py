@@ -0,0 +1,168 @@
+import os
+from collections import OrderedDict, deque
+from multiprocessing import Pool
+import numpy as np
+import data_augmentation as augmentation
+from pointcloud_io import format_xyz, parse_xyz
+from surface_sampler import SurfaceSampler
+
+
+class LRUCache:
+    """Small least-recently-used mapping holding at most max_size entries."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        if key not in self.entries:
+            return None
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+
+# Function to convert a generated variant to the arrays the offline generator would store for it
+def written_arrays(rotation_matrix, partial, complete, occupancy, options):
+    """
+    Loose files keep 6 decimals of the point clouds (the .xyz text round trip)
+    and the grid as generated; packed shards keep float32 clouds and rotations
+    and a boolean grid. Sparse grids are stored as generated.
+    """
+    if options["output_format"] == "packed":
+        return (rotation_matrix.astype(np.float32), partial.astype(np.float32), complete.astype(np.float32),
+                np.asarray(occupancy) > 0)
+    return rotation_matrix, parse_xyz(format_xyz(partial)), parse_xyz(format_xyz(complete)), occupancy
+
+
+class VirtualDataset:
+    """
+    Dataset whose samples are generated on demand instead of read from disk.
+
+    Sample (category, variant id) is produced by data_augmentation.generate_variants
+    from the per-variant random streams, so it is identical to what the
+    offline generator writes for that variant with the same options (after
+    the rounding of the chosen output format, see written_arrays). The source
+    meshes with their samplers and the most recent samples are kept in LRU
+    caches; iterate() prefetches batches in worker processes.
+    """
+
+    def __init__(self, split="train", mesh_files=None, options=None, mesh_cache_size=4, sample_cache_size=256,
+                 match_written=True):
+        self.split = split
+        self.options = augmentation.resolve_options(options)
+        self.match_written = match_written
+        mesh_files = mesh_files if mesh_files is not None else augmentation.list_mesh_files()
+        self.mesh_paths = {os.path.basename(mesh_file).replace(".ply", ""): os.path.join(augmentation.meshes_dir, mesh_file)
+                           for mesh_file in mesh_files}
+
+        # Samples are ordered mesh by mesh, so sequential access keeps hitting a cached mesh
+        variant_ids = range(augmentation.num_variants)
+        if split is not None:
+            variant_ids = [i for i in variant_ids if augmentation.variant_split(i)[0] == split]
+        self.index = [(category_name, i) for category_name in self.mesh_paths for i in variant_ids]
+
+        self.meshes = LRUCache(mesh_cache_size)
+        self.samples = LRUCache(sample_cache_size)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, index):
+        return self.get_batch([index])[0]
+
+    # Function to get the loaded mesh and surface sampler of a category
+    def mesh(self, category_name):
+        cached = self.meshes.get(category_name)
+        if cached is None:
+            mesh = augmentation.load_source_mesh(self.mesh_paths[category_name], self.options)
+            cached = (mesh, SurfaceSampler.from_mesh(mesh) if self.options["sampler"] == "cached" else None)
+            self.meshes.put(category_name, cached)
+        return cached
+
+    # Function to generate the samples of a list of dataset indices, batching the variants of each mesh
+    def get_batch(self, indices):
+        """
+        Returns one dict per index with the category, the variant id, the
+        rotation and the partial, complete and occupancy arrays.
+        """
+        samples = [self.samples.get(self.index[index]) for index in indices]
+        missing = {}
+        for position, index in enumerate(indices):
+            if samples[position] is None:
+                category_name, variant_id = self.index[index]
+                missing.setdefault(category_name, []).append((position, variant_id))
+
+        for category_name, entries in missing.items():
+            mesh, sampler = self.mesh(category_name)
+            variant_ids = [variant_id for _, variant_id in entries]
+            variants = augmentation.generate_variants(mesh, category_name, variant_ids, self.options, sampler)
+            for (position, variant_id), variant in zip(entries, variants):
+                if self.match_written:
+                    variant = written_arrays(*variant, self.options)
+                rotation_matrix, partial, complete, occupancy = variant
+                sample = {"category": category_name, "variant_id": variant_id, "rotation": rotation_matrix,
+                          "partial": partial, "complete": complete, "occupancy": occupancy}
+                self.samples.put((category_name, variant_id), sample)
+                samples[position] = sample
+        return samples
+
+    # Function to list the index batches of one pass over the dataset
+    def batch_indices(self, batch_size, shuffle=False, seed=0):
+        order = np.arange(len(self))
+        if shuffle:
+            order = np.random.default_rng(seed).permutation(order)
+        return [order[start:start + batch_size].tolist() for start in range(0, len(order), batch_size)]
+
+    # Function to iterate over collated batches, generated ahead by worker processes
+    def iterate(self, batch_size=32, shuffle=False, seed=0, num_workers=2, prefetch=2):
+        """
+        With num_workers > 0 up to num_workers * prefetch batches are generated
+        ahead of the consumer; batches are always yielded in order, so the
+        result does not depend on the number of workers.
+        """
+        batches = self.batch_indices(batch_size, shuffle, seed)
+        if num_workers <= 0:
+            for indices in batches:
+                yield collate(self.get_batch(indices))
+            return
+
+        pending = deque()
+        with Pool(num_workers, initializer=init_worker_dataset,
+                  initargs=(self.split, list(self.mesh_paths.values()), self.options, self.match_written)) as pool:
+            for indices in batches:
+                pending.append(pool.apply_async(load_worker_batch, (indices,)))
+                if len(pending) >= num_workers * prefetch:
+                    yield pending.popleft().get()
+            while pending:
+                yield pending.popleft().get()
+
+
+# Function to stack a list of samples into batch arrays, outputs of differing shapes stay lists
+def collate(samples):
+    batch = {}
+    for key in samples[0]:
+        values = [sample[key] for sample in samples]
+        if isinstance(values[0], np.ndarray) and all(value.shape == values[0].shape for value in values):
+            batch[key] = np.stack(values)
+        else:
+            batch[key] = values
+    return batch
+
+
+# Each prefetching worker builds its own dataset with its own mesh cache; batches are not reused, so it keeps no samples
+worker_dataset = None
+
+def init_worker_dataset(split, mesh_paths, options, match_written):
+    global worker_dataset
+    worker_dataset = VirtualDataset(split, mesh_paths, options, sample_cache_size=0, match_written=match_written)
+
+def load_worker_batch(indices):
+    return collate(worker_dataset.get_batch(indices))
@@ -1,54 +1,181 @@
 import os
 import random
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
 import numpy as np
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
+from mpl_toolkits.mplot3d.art3d import Poly3DCollection
+from shard_io import shard_dir, open_shard, read_shard_occupancy
+from occupancy_io import load_occupancy, load_occupancy_batch, find_occupancy_file
+from catalog import Catalog, catalog_name, load_entry
+import pointcloud_io
 
 # Define the directories
 base_dir = "/home/haoming/Downloads/ycb_grasp_dataset"
 input_dir = os.path.join(base_dir, "input")
 gt_dir = os.path.join(base_dir, "gt")
+packed_dir = os.path.join(base_dir, "packed")
+catalog_path = os.path.join(base_dir, catalog_name)
+
+# Fast mode draws at most this many points per cloud
+display_points = 2048
+
+# Threads loading the samples of a figure
+loader_threads = 8
+
+# The four corners of the unit square face of a voxel on the high side of each axis, in voxel units
+face_corners = np.array([
+    [[1, 0, 0], [1, 1, 0], [1, 1, 1], [1, 0, 1]],
+    [[0, 1, 0], [0, 1, 1], [1, 1, 1], [1, 1, 0]],
+    [[0, 0, 1], [1, 0, 1], [1, 1, 1], [0, 1, 1]],
+])
 
 # Function to load an XYZ file and return the points as a numpy array
 def load_xyz(file_path):
-    return np.loadtxt(file_path)
+    return pointcloud_io.load_xyz(file_path)
 
-# Function to load an occupancy grid (npy format)
+# Function to load an occupancy grid (dense .npy or bit-packed .npz)
 def load_occupancy_grid(file_path):
-    return np.load(file_path)
+    return load_occupancy(file_path)
+
+# Function to get the voxel faces between occupied and empty cells as (F, 4, 3) quads in voxel units
+def exposed_faces(grid):
+    """
+    Only the outer surface of the grid is drawn, which for a solid 32^3 grid
+    is a few thousand quads instead of the faces of every occupied voxel.
+    """
+    occupied = np.pad(np.asarray(grid) > 0, 1)
+    quads = []
+    for axis in range(3):
+        # The face between padded cells c and c + 1 is exposed when exactly one of them is occupied;
+        # in grid coordinates it is the high face of cell c - 1
+        cells = np.argwhere(np.diff(occupied.astype(np.int8), axis=axis) != 0)
+        quads.append((cells - 1)[:, None, :] + face_corners[axis][None])
+    return np.concatenate(quads).astype(np.float32)
+
+# Function to draw an occupancy grid as its exposed faces
+def draw_occupancy(ax, grid):
+    quads = exposed_faces(grid)
+    ax.add_collection3d(Poly3DCollection(quads, facecolor="tab:green", edgecolor="k", linewidth=0.1))
+    shape = np.asarray(grid).shape
+    ax.set_xlim(0, shape[0])
+    ax.set_ylim(0, shape[1])
+    ax.set_zlim(0, shape[2])
+
+# Function to keep at most budget points of a cloud for display
+def subsample_points(points, budget=display_points, rng=None):
+    if len(points) <= budget:
+        return points
+    rng = rng or np.random.default_rng(0)
+    return points[rng.choice(len(points), budget, replace=False)]
 
 # Function to visualize the point clouds and occupancy grid for 10 samples
-def visualize_data(complete_points_list, partial_points_list, occupancy_grid_list):
+def visualize_data(complete_points_list, partial_points_list, occupancy_grid_list, fast=False, output_path=None):
+    """
+    fast subsamples the clouds to display_points and draws the grids as
+    their exposed faces. With output_path the figure is saved there instead
+    of shown, which also works without a display.
+    """
+    if fast:
+        complete_points_list = [subsample_points(points) for points in complete_points_list]
+        partial_points_list = [subsample_points(points) for points in partial_points_list]
+    num_samples = len(complete_points_list)
     fig = plt.figure(figsize=(15, 10))
 
     # Loop through all 10 samples
-    for i in range(10):
-        ax1 = fig.add_subplot(3, 10, i + 1, projection='3d')
+    for i in range(num_samples):
+        ax1 = fig.add_subplot(3, num_samples, i + 1, projection='3d')
         ax1.scatter(complete_points_list[i][:, 0], complete_points_list[i][:, 1], complete_points_list[i][:, 2], c='b', s=1)
         ax1.set_title(f'Complete {i}')
         ax1.set_xlabel('X')
         ax1.set_ylabel('Y')
         ax1.set_zlabel('Z')
 
-        ax2 = fig.add_subplot(3, 10, i + 11, projection='3d')
+        ax2 = fig.add_subplot(3, num_samples, i + num_samples + 1, projection='3d')
         ax2.scatter(partial_points_list[i][:, 0], partial_points_list[i][:, 1], partial_points_list[i][:, 2], c='r', s=1)
         ax2.set_title(f'Partial {i}')
         ax2.set_xlabel('X')
         ax2.set_ylabel('Y')
         ax2.set_zlabel('Z')
 
-        ax3 = fig.add_subplot(3, 10, i + 21, projection='3d')
-        ax3.voxels(occupancy_grid_list[i], edgecolor='k')
+        ax3 = fig.add_subplot(3, num_samples, i + 2 * num_samples + 1, projection='3d')
+        if fast:
+            draw_occupancy(ax3, occupancy_grid_list[i])
+        else:
+            ax3.voxels(occupancy_grid_list[i], edgecolor='k')
         ax3.set_title(f'Occupancy {i}')
         ax3.set_xlabel('X')
         ax3.set_ylabel('Y')
         ax3.set_zlabel('Z')
 
     plt.tight_layout()
-    plt.show()
+    if output_path is not None:
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        fig.savefig(output_path, dpi=100)
+        plt.close(fig)
+    else:
+        plt.show()
+
+# Function to load catalog entries in parallel threads, in the order given
+def load_entries(entries, num_threads=loader_threads):
+    with ThreadPoolExecutor(max(1, num_threads)) as executor:
+        return list(executor.map(load_entry, entries))
+
+# Function to randomly sample 10 variants of one category and split through the catalog, without listing any directory
+def random_catalog_sample_visualization(path=catalog_path, seed=None, fast=True, output_path=None):
+    rng = random.Random(seed)
+    with Catalog(path) as catalog:
+        selected_category = rng.choice(catalog.categories())
+        subset = rng.choice([split for split in ("train", "test") if catalog.count(selected_category, split) > 0])
+        entries = catalog.sample(10, category=selected_category, split=subset, seed=rng.randrange(1 << 31))
+
+    samples = load_entries(entries)
+    visualize_data([complete for _, complete, _ in samples], [partial for partial, _, _ in samples],
+                   [occupancy for _, _, occupancy in samples], fast=fast, output_path=output_path)
+
+# Function to render the samples of one category to an image file, run by the batch rendering workers
+def render_category(path, category, output_dir, num_samples=10, seed=0):
+    with Catalog(path) as catalog:
+        entries = catalog.sample(num_samples, category=category, seed=seed)
+    # Samples are only loaded here, inside the worker that draws them
+    samples = load_entries(entries)
+    output_path = os.path.join(output_dir, f"{category}.png")
+    visualize_data([complete for _, complete, _ in samples], [partial for partial, _, _ in samples],
+                   [occupancy for _, _, occupancy in samples], fast=True, output_path=output_path)
+    return output_path
+
+# Function to render one image per category without a display, for quick dataset QA
+def render_catalog_batch(output_dir, path=catalog_path, categories=None, num_samples=10, num_workers=4, seed=0):
+    with Catalog(path) as catalog:
+        categories = categories or catalog.categories()
+    jobs = [(path, category, output_dir, num_samples, seed) for category in categories]
+    if num_workers > 1:
+        with Pool(num_workers, initializer=plt.switch_backend, initargs=("Agg",)) as pool:
+            return pool.starmap(render_category, jobs)
+    plt.switch_backend("Agg")
+    return [render_category(*job) for job in jobs]
+
+# Function to randomly sample 10 variants from a packed shard without listing any files
+def random_packed_sample_visualization(fast=True):
+    categories = [f for f in os.listdir(packed_dir) if os.path.isdir(os.path.join(packed_dir, f))]
+    selected_category = random.choice(categories)
+    subset = random.choice(["train", "test"])
+
+    # The shard is memory mapped, so only the selected rows are read from disk
+    shard = open_shard(shard_dir(packed_dir, selected_category, subset))
+    written_rows = [row for row, variant_id in enumerate(shard["variant_ids"]) if variant_id >= 0]
+    random_rows = sorted(random.sample(written_rows, 10))
+
+    complete_points_list = [np.asarray(shard["complete"][row]) for row in random_rows]
+    partial_points_list = [np.asarray(shard["partial"][row]) for row in random_rows]
+    occupancy_grid_list = list(read_shard_occupancy(shard, random_rows))
+
+    visualize_data(complete_points_list, partial_points_list, occupancy_grid_list, fast=fast)
 
 # Function to randomly sample 10 corresponding partial, complete point clouds, and occupancy grids
-def random_sample_visualization():
+def random_sample_visualization(fast=True):
     # Get all the subfolders (categories) in the 'input' directory
     categories = [f for f in os.listdir(input_dir) if os.path.isdir(os.path.join(input_dir, f))]
 
@@ -69,30 +196,47 @@ def random_sample_visualization():
 
     complete_points_list = []
     partial_points_list = []
-    occupancy_grid_list = []
+    occupancy_paths = []
 
     # Load the corresponding partial, complete point clouds, and occupancy grids
     for variant in random_variants:
         partial_path = os.path.join(partial_dir, f"{variant}_x.xyz")
         complete_path = os.path.join(complete_dir, f"{variant}_y.xyz")
-        occupancy_path = os.path.join(occupancy_dir, f"{variant}.npy")
+        occupancy_paths.append(find_occupancy_file(os.path.join(occupancy_dir, f"{variant}.npy")))
 
         # Load the files
         partial_points = load_xyz(partial_path)
         complete_points = load_xyz(complete_path)
-        occupancy_grid = load_occupancy_grid(occupancy_path)
 
         # Append to the respective lists
         partial_points_list.append(partial_points)
         complete_points_list.append(complete_points)
-        occupancy_grid_list.append(occupancy_grid)
+
+    # Bit-packed grids are unpacked together in one call
+    occupancy_grid_list = load_occupancy_batch(occupancy_paths)
 
     # Visualize the 10 samples
-    visualize_data(complete_points_list, partial_points_list, occupancy_grid_list)
+    visualize_data(complete_points_list, partial_points_list, occupancy_grid_list, fast=fast)
 
 # Run the visualization
 if __name__ == "__main__":
-    random_sample_visualization()
+    parser = argparse.ArgumentParser(description="Visualize random dataset samples")
+    parser.add_argument("--batch-dir", default=None, help="render one image per category into this directory without a display")
+    parser.add_argument("--categories", nargs="*", default=None, help="categories to render in batch mode (default: all)")
+    parser.add_argument("--samples", type=int, default=10, help="samples per figure")
+    parser.add_argument("--workers", type=int, default=4, help="processes rendering categories in batch mode")
+    parser.add_argument("--slow", action="store_true", help="draw every point and every voxel with ax.voxels")
+    args = parser.parse_args()
+    if args.batch_dir is not None:
+        for output_path in render_catalog_batch(args.batch_dir, categories=args.categories, num_samples=args.samples,
+                                                num_workers=args.workers):
+            print(f"Rendered {output_path}")
+    elif os.path.exists(catalog_path):
+        random_catalog_sample_visualization(fast=not args.slow)
+    elif os.path.isdir(packed_dir):
+        random_packed_sample_visualization(fast=not args.slow)
+    else:
+        random_sample_visualization(fast=not args.slow)
 
 
 
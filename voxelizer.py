@@ -0,0 +1,207 @@
+import numpy as np
+
+# The grid always covers the normalized cube [-0.5, 0.5]^3
+grid_min = -0.5
+grid_size = 1.0
+
+# Upper bound on the number of transformed triangles processed at once
+max_triangle_block = 1 << 21
+
+# Sub-pitch offset applied to the ray positions so rays never pass exactly through shared edges or vertices
+ray_jitter = (1.17e-5, 0.73e-5)
+
+
+# Function to get the xy positions of the vertical rays cast through some (N, 2) points
+def jittered_rays(points_xy):
+    return points_xy + np.asarray(ray_jitter)
+
+# Function to intersect vertical rays at (N, 2) positions with one (N, 3, 3) triangle each
+def ray_crossings(rays, triangles):
+    """
+    Returns the mask of the rays that cross their triangle and the z value of
+    every crossing. Used by the voxelizer and by the inside test of
+    query_points, so both see exactly the same crossings.
+    """
+    # Barycentric coordinates of the ray in the xy projection of the triangle
+    px, py = rays[:, 0], rays[:, 1]
+    a, b, c = (triangles[:, k] for k in range(3))
+    denom = (b[:, 1] - c[:, 1]) * (a[:, 0] - c[:, 0]) + (c[:, 0] - b[:, 0]) * (a[:, 1] - c[:, 1])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        l0 = ((b[:, 1] - c[:, 1]) * (px - c[:, 0]) + (c[:, 0] - b[:, 0]) * (py - c[:, 1])) / denom
+        l1 = ((c[:, 1] - a[:, 1]) * (px - c[:, 0]) + (a[:, 0] - c[:, 0]) * (py - c[:, 1])) / denom
+        l2 = 1.0 - l0 - l1
+    hit = (denom != 0) & (l0 >= 0) & (l1 >= 0) & (l2 >= 0)
+    return hit, l0[hit] * a[hit, 2] + l1[hit] * b[hit, 2] + l2[hit] * c[hit, 2]
+
+# Function to tell which crossings lie above their points; a crossing exactly at a point counts as above it
+def crossing_above(z, point_z):
+    return z >= point_z
+
+# Function to get the index of the first voxel centre above each z value, by the rule of crossing_above
+def first_centre_above(z, resolution):
+    centres = grid_min + (np.arange(resolution) + 0.5) * (grid_size / resolution)
+    return np.searchsorted(centres, z, side="right")
+
+# Function to find where the vertical rays through the voxel column centres cross a set of triangles
+def column_crossings(triangles, resolution, triangle_columns_offset=None):
+    """
+    triangles: (T, 3, 3) triangles in the normalized frame.
+    triangle_columns_offset: optional (T,) offset added to the column id of each
+    triangle, used to keep the columns of different batch entries apart.
+    Returns the column id (ix * resolution + iy plus the offset) and the z value of every crossing.
+    """
+    pitch = grid_size / resolution
+    xy = (triangles[:, :, :2] - grid_min) / pitch - 0.5 - np.asarray(ray_jitter) / pitch
+
+    # Range of column centres covered by the xy bounding box of every triangle
+    low = np.clip(np.ceil(xy.min(axis=1)), 0, resolution).astype(np.int64)
+    high = np.clip(np.floor(xy.max(axis=1)), -1, resolution - 1).astype(np.int64)
+    counts = np.maximum(high - low + 1, 0)
+    num_pairs = counts[:, 0] * counts[:, 1]
+
+    # One (triangle, column) pair per covered column
+    triangle_index = np.repeat(np.arange(len(triangles)), num_pairs)
+    local = np.arange(num_pairs.sum()) - np.repeat(np.cumsum(num_pairs) - num_pairs, num_pairs)
+    ny = counts[triangle_index, 1]
+    ix = low[triangle_index, 0] + local // np.maximum(ny, 1)
+    iy = low[triangle_index, 1] + local % np.maximum(ny, 1)
+
+    centres = np.stack([grid_min + (ix + 0.5) * pitch, grid_min + (iy + 0.5) * pitch], axis=1)
+    hit, z = ray_crossings(jittered_rays(centres), triangles[triangle_index])
+    columns = ix[hit] * resolution + iy[hit]
+    if triangle_columns_offset is not None:
+        columns = columns + triangle_columns_offset[triangle_index[hit]]
+    return columns, z
+
+
+# Function to turn ray crossings into solid occupancy by crossing parity
+def solid_from_crossings(columns, z, resolution, num_columns):
+    """
+    A voxel centre is inside when the rays towards -z and +z both cross the
+    surface an odd number of times. For a closed surface the two agree; for a
+    surface with holes requiring both keeps a leaking column from filling up.
+    Returns a (num_columns, resolution) boolean array.
+    """
+    # Index of the first voxel centre above each crossing
+    above = first_centre_above(z, resolution)
+    counts = np.bincount(columns * (resolution + 1) + above, minlength=num_columns * (resolution + 1))
+    counts = counts.reshape(num_columns, resolution + 1)
+
+    crossings_below = np.cumsum(counts, axis=1)[:, :resolution]
+    crossings_above = counts.sum(axis=1, keepdims=True) - crossings_below
+    return (crossings_below % 2 == 1) & (crossings_above % 2 == 1)
+
+
+# Function to voxelize a mesh that already lives in the normalized frame
+def voxelize_solid(vertices, faces, resolution=32):
+    triangles = np.asarray(vertices, dtype=np.float64)[np.asarray(faces)]
+    columns, z = column_crossings(triangles, resolution)
+    solid = solid_from_crossings(columns, z, resolution, resolution * resolution)
+    return solid.reshape(resolution, resolution, resolution)
+
+
+# Function to voxelize a batch of affine copies x -> A x + t of one mesh into fixed-shape grids
+def voxelize_solid_batch(vertices, faces, linear, offset, resolution=32):
+    vertices = np.asarray(vertices, dtype=np.float64)
+    faces = np.asarray(faces)
+    linear = np.asarray(linear, dtype=np.float64).reshape(-1, 3, 3)
+    offset = np.asarray(offset, dtype=np.float64).reshape(-1, 3)
+    columns_per_grid = resolution * resolution
+
+    grids = np.empty((len(linear), resolution, resolution, resolution), dtype=bool)
+    step = max(1, max_triangle_block // max(1, len(faces)))
+    for start in range(0, len(linear), step):
+        stop = min(start + step, len(linear))
+        mapped = np.einsum("bij,vj->bvi", linear[start:stop], vertices) + offset[start:stop, None, :]
+        triangles = mapped[:, faces].reshape(-1, 3, 3)
+        batch_offset = np.repeat(np.arange(stop - start) * columns_per_grid, len(faces))
+
+        columns, z = column_crossings(triangles, resolution, batch_offset)
+        solid = solid_from_crossings(columns, z, resolution, (stop - start) * columns_per_grid)
+        grids[start:stop] = solid.reshape(stop - start, resolution, resolution, resolution)
+    return grids
+
+
+# Function to turn ray crossings into the inside z intervals of every column
+def intervals_from_crossings(columns, z):
+    """
+    Consecutive crossings of a column bound its inside intervals. Columns with
+    an odd number of crossings are empty, which is what the parity rule of
+    solid_from_crossings gives for them. Returns the column id and the
+    (low, high) z bounds of every interval, ordered by column and height.
+    """
+    order = np.lexsort((z, columns))
+    columns, z = columns[order], z[order]
+    _, counts = np.unique(columns, return_counts=True)
+    even = np.repeat(counts % 2 == 0, counts)
+    columns, z = columns[even], z[even]
+    return columns[0::2], np.stack([z[0::2], z[1::2]], axis=1)
+
+
+# Function to voxelize a mesh in the normalized frame into sparse column intervals
+def voxelize_intervals(vertices, faces, resolution=32):
+    triangles = np.asarray(vertices, dtype=np.float64)[np.asarray(faces)]
+    columns, intervals = intervals_from_crossings(*column_crossings(triangles, resolution))
+    return {"resolution": resolution, "columns": columns.astype(np.int32), "intervals": intervals.astype(np.float32)}
+
+
+# Function to voxelize a batch of affine copies x -> A x + t of one mesh into sparse column intervals
+def voxelize_intervals_batch(vertices, faces, linear, offset, resolution=32):
+    """
+    Same rays as voxelize_solid_batch, but only the crossings are kept, so the
+    memory scales with the columns the surface covers (resolution^2) and not
+    with the volume of the grid. Returns one sparse grid per map.
+    """
+    vertices = np.asarray(vertices, dtype=np.float64)
+    faces = np.asarray(faces)
+    linear = np.asarray(linear, dtype=np.float64).reshape(-1, 3, 3)
+    offset = np.asarray(offset, dtype=np.float64).reshape(-1, 3)
+    columns_per_grid = resolution * resolution
+
+    sparse_grids = []
+    step = max(1, max_triangle_block // max(1, len(faces)))
+    for start in range(0, len(linear), step):
+        stop = min(start + step, len(linear))
+        mapped = np.einsum("bij,vj->bvi", linear[start:stop], vertices) + offset[start:stop, None, :]
+        triangles = mapped[:, faces].reshape(-1, 3, 3)
+        batch_offset = np.repeat(np.arange(stop - start) * columns_per_grid, len(faces))
+
+        columns, intervals = intervals_from_crossings(*column_crossings(triangles, resolution, batch_offset))
+        bounds = np.searchsorted(columns, np.arange(stop - start + 1) * columns_per_grid)
+        for b in range(stop - start):
+            grid_slice = slice(bounds[b], bounds[b + 1])
+            sparse_grids.append({"resolution": resolution,
+                                 "columns": (columns[grid_slice] - b * columns_per_grid).astype(np.int32),
+                                 "intervals": intervals[grid_slice].astype(np.float32)})
+    return sparse_grids
+
+
+# Function to build the dense occupancy grid of sparse column intervals, along z at any resolution
+def densify_intervals(sparse_grid, resolution=None):
+    """
+    At the encoded resolution the grid equals voxelize_solid. Along z any other
+    resolution is exact as well: a voxel centre is inside when it lies in an
+    interval, the same test as solid_from_crossings. The intervals are only
+    known on the encoded columns, though, so in x and y another resolution
+    repeats (upsampling) or skips (downsampling) the nearest encoded column.
+    Such grids are not what voxelizing at that resolution would give; generate
+    at the resolution that is needed for exact grids.
+    """
+    source_resolution = int(sparse_grid["resolution"])
+    resolution = resolution or source_resolution
+    columns = np.asarray(sparse_grid["columns"], dtype=np.int64)
+    intervals = np.asarray(sparse_grid["intervals"], dtype=np.float64)
+
+    # +1 where an interval starts and -1 where it ends, summed up along each column
+    low = first_centre_above(intervals[:, 0], resolution)
+    high = first_centre_above(intervals[:, 1], resolution)
+    size = source_resolution * source_resolution * (resolution + 1)
+    edges = (np.bincount(columns * (resolution + 1) + low, minlength=size)
+             - np.bincount(columns * (resolution + 1) + high, minlength=size))
+    solid = np.cumsum(edges.reshape(-1, resolution + 1), axis=1)[:, :resolution] > 0
+    solid = solid.reshape(source_resolution, source_resolution, resolution)
+
+    if resolution != source_resolution:
+        nearest = ((np.arange(resolution) + 0.5) * source_resolution / resolution).astype(np.int64)
+        solid = solid[nearest][:, nearest]
+    return solid